@@ -0,0 +1,130 @@
+"""
+    Asyncio zookeeper configuration provider implementation
+
+"""
+import asyncio
+
+from niocore.configuration import Configuration
+
+from .async_proxy import AsyncZookeeperProxy
+from .provider import ZookeeperConfigurationProvider, \
+    ZookeeperConfigurationData
+from .resilience import is_stale
+from .sharding import get_layout, is_bucket, list_children
+
+
+__all__ = ['AsyncZookeeperConfigurationProvider']
+
+
+class AsyncZookeeperConfigurationProvider(ZookeeperConfigurationProvider):
+
+    """ Zookeeper configuration provider with awaitable operations
+
+    fetch, register, save and remove are coroutines accepting a timeout in
+    seconds, children of multiple configurations are fetched concurrently.
+    Shares the zookeeper connection and settings of the synchronous
+    provider, whose API is unchanged.
+
+    Example:
+        provider = AsyncZookeeperConfigurationProvider(settings)
+        blocks = await provider.fetch("blocks", timeout=5)
+    """
+
+    def __init__(self, settings, config_class=Configuration):
+        super().__init__(settings, config_class)
+        self._async_proxy = AsyncZookeeperProxy(self._get_proxy(),
+                                                self._max_in_flight)
+
+    async def fetch(self, name, substitute=True, timeout=None):
+        """ Fetches a zookeeper base configuration, multiple or single
+
+        Args:
+            name (str): node name
+            substitute (bool): substitute variables
+            timeout (float): seconds to wait for, no limit when None
+
+        Returns:
+            Configuration: with config values
+
+        Raises:
+            asyncio.TimeoutError: fetch did not complete within timeout
+        """
+        return await asyncio.wait_for(self._fetch_async(name, substitute),
+                                      timeout)
+
+    async def _fetch_async(self, name, substitute):
+        config = self._take_prefetched(name, substitute)
+        if config is not None:
+            return config
+
+        node_path = self._get_name_node_path(name)
+        children = await self._async_proxy.get_children(node_path)
+        if not children:
+            return self._create_single_config(
+                node_path, await self._async_proxy.fetch(node_path),
+                substitute)
+
+        if any(is_bucket(child) for child in children):
+            # buckets are listed concurrently from the executor
+            buckets, child_paths = \
+                await asyncio.get_running_loop().run_in_executor(
+                    None, list_children, self._get_proxy(), node_path,
+                    children, self._max_in_flight)
+        else:
+            # flat layout, no request is sent
+            buckets, child_paths = list_children(
+                self._get_proxy(), node_path, children)
+
+        config = self._create_multiple_config(
+            self._config_class, name, node_path, child_paths, buckets,
+            substitute, is_stale(children))
+        children = {child_node_path: child
+                    for child, child_node_path in child_paths.items()}
+        for child_node_path, data in \
+                await self._async_proxy.fetch_many(children):
+            config[children[child_node_path]] = self._create_config(
+                child_node_path, data, substitute, baseline=True)
+        return config
+
+    async def register(self, config, sub_config, name, timeout=None):
+        """ Registers a configuration as a child, see
+        ZookeeperConfigurationProvider.register
+        """
+        parent_path = self._get_name_node_path(config.name)
+        buckets = self._get_known_buckets(config, parent_path)
+        if buckets is None:
+            buckets = self._layouts[parent_path] = get_layout(
+                await self._async_proxy.fetch(parent_path, timeout=timeout))
+        node_path = self._get_child_node_path(config, name, buckets)
+        self._discard_prefetched(node_path)
+        sub_config['_private'] = ZookeeperConfigurationData(node_path,
+                                                            False)
+        await self._async_proxy.register(node_path, sub_config,
+                                         timeout=timeout)
+        self._registered(config, sub_config, name, node_path)
+
+    async def save(self, config, timeout=None):
+        """ Saves the configuration, see ZookeeperConfigurationProvider.save
+
+        Changes to a multiple configuration are applied as a transaction,
+        which is sent from the loop's default executor
+        """
+        node_path = self._get_node_path(config)
+        self._discard_prefetched(node_path)
+        private = self._get_private(config)
+        if private is not None and private.multiple and \
+                private.children is not None:
+            await asyncio.wait_for(
+                asyncio.get_running_loop().run_in_executor(
+                    None, self._save_children, config, private), timeout)
+            return
+
+        await self._async_proxy.save(node_path, config, timeout=timeout,
+                                     **self._get_save_options(private))
+        self._saved(config, private, node_path)
+
+    async def remove(self, config, timeout=None):
+        node_path = self._get_node_path(config)
+        self._discard_prefetched(node_path)
+        await self._async_proxy.remove(node_path, timeout=timeout)
+        self._layouts.pop(node_path, None)
@@ -0,0 +1,309 @@
+"""
+    Asyncio interface to the zookeeper proxy
+
+"""
+import asyncio
+from functools import partial
+from itertools import count
+
+from kazoo.exceptions import NodeExistsError, NoNodeError, NotEmptyError
+
+from .chunks import ChunkManifest
+from .dedup import is_reference
+from .proxy import DEFAULT_MAX_IN_FLIGHT, REMOVE_ATTEMPTS
+from .resilience import CONNECTION_ERRORS
+
+
+__all__ = ['AsyncZookeeperProxy', 'wait_result']
+
+
+def wait_result(async_result):
+    """ Makes a kazoo asynchronous result awaitable
+
+    The result is delivered to the running event loop from kazoo's
+    completion thread. Cancelling the returned future does not cancel the
+    request, its result is discarded when it arrives.
+
+    Args:
+        async_result (IAsyncResult): result of a kazoo *_async call
+
+    Returns:
+        asyncio.Future: resolved with the value or exception of the result
+    """
+    loop = asyncio.get_running_loop()
+    future = loop.create_future()
+
+    def deliver(result):
+        try:
+            loop.call_soon_threadsafe(_resolve, future, result)
+        except RuntimeError:
+            # loop closed while request was in flight
+            pass
+
+    async_result.rawlink(deliver)
+    return future
+
+
+def _resolve(future, async_result):
+    if future.done():
+        return
+    if async_result.successful():
+        future.set_result(async_result.value)
+    else:
+        future.set_exception(async_result.exception)
+
+
+class AsyncZookeeperProxy(object):
+
+    """ Awaitable fetch, get_children, register, save and remove
+
+    Wraps a connected ZookeeperProxy, sharing its sessions, cache, snapshot,
+    versions and statistics. Requests are issued through kazoo's
+    asynchronous API and awaited on the event loop, no thread is blocked
+    waiting for zookeeper. Chunked or deduplicated nodes, and writes subject
+    to write elision or offline queueing, need several dependent round trips
+    that are run through the synchronous proxy in the loop's default
+    executor.
+
+    Every operation accepts a timeout in seconds, when it expires the
+    operation is cancelled and asyncio.TimeoutError raised. Requests already
+    sent to zookeeper still complete, their results are discarded.
+    """
+
+    def __init__(self, proxy, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        """ Constructor for asyncio zookeeper proxy
+
+        Args:
+            proxy (ZookeeperProxy): connected proxy
+            max_in_flight (int): maximum number of outstanding requests of
+                operations spanning several nodes
+        """
+        self._proxy = proxy
+        self._max_in_flight = max(1, max_in_flight)
+
+    @property
+    def proxy(self):
+        return self._proxy
+
+    async def fetch(self, node_path, timeout=None):
+        return await asyncio.wait_for(self._fetch(node_path), timeout)
+
+    async def _fetch(self, node_path):
+        await self._wait_ready()
+        with self._proxy.measure("fetch", node_path) as transferred:
+            try:
+                data, stat = await self._get(node_path)
+                transferred[1] = len(data or b"")
+                if is_reference(data):
+                    # payload may need to be read
+                    data = await self._run_blocking(
+                        self._proxy.decode_read, data, stat)
+                else:
+                    data = self._proxy.decode_read(data, stat)
+            except NoNodeError:
+                data = {}
+        return data
+
+    async def _get(self, node_path):
+        proxy = self._proxy
+        async_result, generation, reader = proxy.get_async(node_path)
+        if isinstance(async_result, tuple):
+            # served from snapshot or cache
+            return async_result
+        try:
+            data, stat = await wait_result(async_result)
+        except CONNECTION_ERRORS:
+            if not proxy.retries:
+                raise
+            # retried through the retry policy from the executor
+            data, stat = await self._run_blocking(proxy.read, node_path)
+        if ChunkManifest.is_manifest(data):
+            data, stat = await self._run_blocking(
+                proxy.resolve_chunks, node_path, data, stat, reader=reader)
+        proxy.store_read(node_path, data, stat, generation)
+        return data, stat
+
+    async def fetch_many(self, node_paths, timeout=None):
+        """ Fetches several nodes concurrently
+
+        Keeps at most max_in_flight requests outstanding
+
+        Returns:
+            list: (node_path, data) in node_paths order
+        """
+        return await asyncio.wait_for(self._fetch_many(node_paths), timeout)
+
+    async def _fetch_many(self, node_paths):
+        node_paths = list(node_paths)
+        data = await self._gather(self._fetch, node_paths)
+        return list(zip(node_paths, data))
+
+    async def get_children(self, node_path, timeout=None):
+        return await asyncio.wait_for(self._get_children(node_path), timeout)
+
+    async def _get_children(self, node_path):
+        proxy = self._proxy
+        await self._wait_ready()
+        with proxy.measure("get_children", node_path) as transferred:
+            try:
+                found, children = proxy.take_children(node_path)
+                if not found:
+                    async_result, generation = \
+                        proxy.get_children_async(node_path)
+                    children = proxy.complete_children(
+                        node_path, await wait_result(async_result),
+                        generation)
+                transferred[1] = sum(len(child) for child in children)
+                return children
+            except NoNodeError:
+                return None
+
+    async def register(self, node_path, config, timeout=None):
+        await asyncio.wait_for(
+            self._measure_write("register", node_path, config, create=True),
+            timeout)
+
+    async def save(self, node_path, config, version=None, timeout=None):
+        """ Saves config to an existing node, queued when write-behind is
+        enabled and no version is specified, see ZookeeperProxy.save
+
+        Raises:
+            BadVersionError: version specified and node was modified since
+        """
+        if self._proxy.queues_saves and version is None:
+            # queueing does not block
+            self._proxy.save(node_path, config)
+            return
+        await asyncio.wait_for(
+            self._measure_write("save", node_path, config, version=version),
+            timeout)
+
+    async def _measure_write(self, operation, node_path, config,
+                             create=False, version=None):
+        await self._wait_ready()
+        with self._proxy.measure(operation, node_path) as transferred:
+            transferred[0] = \
+                await self._write(node_path, config, create, version)
+
+    async def _write(self, node_path, config, create, version):
+        proxy = self._proxy
+        serialized_config = proxy.serialize(config)
+        if not proxy.writes_directly(node_path, serialized_config):
+            return await self._run_blocking(proxy.write, node_path, config,
+                                            create, version)
+
+        await self._discard_queued(node_path)
+        # data is stored in the node itself, nothing blocks
+        data, cleanup, _ = proxy.prepare_write(node_path, serialized_config)
+        attempts = count()
+        try:
+            try:
+                new_version = await self._send_write(node_path, data, create,
+                                                     version, attempts)
+            except CONNECTION_ERRORS:
+                if not proxy.retries:
+                    raise
+                # retried through the retry policy from the executor, a
+                # versioned write may have been applied already
+                new_version = await self._run_blocking(
+                    proxy.send_write, node_path, data, create, version,
+                    attempts)
+        finally:
+            proxy.invalidate(node_path)
+        proxy.record_version(node_path, new_version, serialized_config)
+        # chunks replaced, if any, are deleted
+        await self._run_blocking(cleanup)
+        return len(serialized_config)
+
+    async def _send_write(self, node_path, data, create, version, attempts):
+        """ Sends a write to zookeeper, first attempt of
+        ZookeeperProxy.send_write
+        """
+        client = self._proxy.get_client()
+        next(attempts)
+        if create:
+            try:
+                await wait_result(client.create_async(node_path, data))
+                return 0
+            except NodeExistsError:
+                pass
+        stat = await wait_result(client.set_async(
+            node_path, data, version=-1 if version is None else version))
+        return stat.version
+
+    async def remove(self, node_path, timeout=None):
+        """ Removes node and its descendants
+
+        Descendants are listed and deleted concurrently, deepest first.
+        Nodes deleted by others meanwhile are skipped, nodes created
+        meanwhile are listed and deleted as well, see ZookeeperProxy.remove
+        """
+        await asyncio.wait_for(self._remove(node_path), timeout)
+
+    async def _remove(self, node_path):
+        proxy = self._proxy
+        await self._wait_ready()
+        with proxy.measure("remove", node_path):
+            proxy.forget_removed(node_path)
+            await self._discard_queued(node_path, tree=True)
+            try:
+                await self._delete_tree(node_path)
+            finally:
+                proxy.invalidate(node_path, tree=True)
+            await self._delete_tree(proxy.get_chunk_path(node_path))
+
+    async def _discard_queued(self, node_path, tree=False):
+        """ Drops saves queued by write-behind, see
+        ZookeeperProxy.discard_queued
+
+        Sent from the executor, as it waits for saves being sent
+        """
+        if self._proxy.queues_saves:
+            await self._run_blocking(self._proxy.discard_queued, node_path,
+                                     tree)
+
+    async def _delete_tree(self, node_path, semaphore=None, attempt=1):
+        semaphore = semaphore or asyncio.Semaphore(self._max_in_flight)
+        client = self._proxy.get_client()
+        try:
+            async with semaphore:
+                children = await wait_result(
+                    client.get_children_async(node_path))
+            await asyncio.gather(*[
+                self._delete_tree("{0}/{1}".format(node_path, child),
+                                  semaphore)
+                for child in children])
+            async with semaphore:
+                await wait_result(client.delete_async(node_path))
+        except NoNodeError:
+            pass
+        except NotEmptyError:
+            if attempt >= REMOVE_ATTEMPTS:
+                raise
+            # children were created meanwhile
+            await self._delete_tree(node_path, semaphore, attempt + 1)
+
+    async def _wait_ready(self):
+        """ Waits for sessions being established in background without
+        blocking the loop, see ZookeeperProxy.wait_ready
+        """
+        if self._proxy.is_ready():
+            self._proxy.wait_ready()
+        else:
+            await self._run_blocking(self._proxy.wait_ready)
+
+    async def _gather(self, coroutine_function, items):
+        """ Runs coroutine_function over items keeping at most
+        max_in_flight running
+        """
+        semaphore = asyncio.Semaphore(self._max_in_flight)
+
+        async def run(item):
+            async with semaphore:
+                return await coroutine_function(item)
+        return await asyncio.gather(*[run(item) for item in items])
+
+    @staticmethod
+    async def _run_blocking(func, *args, **kwargs):
+        return await asyncio.get_running_loop().run_in_executor(
+            None, partial(func, *args, **kwargs))
@@ -0,0 +1,242 @@
+"""
+    Batched zookeeper writes committed as multi-op transactions
+
+"""
+from kazoo.exceptions import NoNodeError, NodeExistsError, RolledBackError
+
+
+# zookeeper rejects requests larger than jute.maxbuffer (1MB by default),
+# a transaction is a single request so chunks stay well under it
+DEFAULT_MAX_BATCH_BYTES = 960 * 1024
+# approximate encoding overhead of a single operation: op header, path and
+# data lengths, acl and flags
+OPERATION_OVERHEAD = 64
+
+REGISTER = "register"
+SAVE = "save"
+REMOVE = "remove"
+
+CREATE = "create"
+SET = "set"
+DELETE = "delete"
+
+
+class ZookeeperBatch(object):
+
+    """ Collects register, save and remove operations
+
+    Operations are resolved into creates, sets and deletes when committed
+    and sent as transactions split into chunks no larger than max_bytes,
+    each chunk is applied atomically.
+
+    Removes are expanded into deletes of the whole subtree, deepest nodes
+    first, since transactions can't delete recursively.
+    """
+
+    def __init__(self, client, max_bytes=DEFAULT_MAX_BATCH_BYTES):
+        self._client = client
+        self._max_bytes = max_bytes
+        self._operations = []
+        self._callbacks = []
+        # node path -> callables undoing what was stored for its write
+        self._rollbacks = {}
+        # node path -> version after commit, for nodes created or set
+        self._versions = {}
+
+    def register(self, node_path, data):
+        self._operations.append((REGISTER, node_path, data, None))
+
+    def save(self, node_path, data, version=None):
+        """ Adds a save, failing the transaction if version does not match
+        """
+        self._operations.append((SAVE, node_path, data, version))
+
+    def remove(self, node_path):
+        self._operations.append((REMOVE, node_path, None, None))
+
+    def add_callback(self, callback):
+        """ Adds a callable to invoke once the batch is committed
+        """
+        if callback is not None:
+            self._callbacks.append(callback)
+
+    def add_rollback(self, node_path, rollback):
+        """ Adds a callable to invoke if the write to node_path is not
+        committed
+        """
+        if rollback is not None:
+            self._rollbacks.setdefault(node_path, []).append(rollback)
+
+    def rollback(self):
+        """ Drops collected operations, invoking their rollbacks
+        """
+        self._rollback(set())
+
+    def _rollback(self, committed):
+        rollbacks, self._rollbacks = self._rollbacks, {}
+        self._operations = []
+        self._callbacks = []
+        for node_path, callbacks in rollbacks.items():
+            if node_path not in committed:
+                for callback in callbacks:
+                    callback()
+
+    def get_version(self, node_path):
+        """ Provides version of a node created or set once committed
+
+        Returns:
+            int: version, None if unknown
+        """
+        return self._versions.get(node_path)
+
+    @property
+    def paths(self):
+        """ Paths affected by the batch along with their operation kind
+        """
+        return [(kind, node_path)
+                for kind, node_path, _, _ in self._operations]
+
+    def __len__(self):
+        return len(self._operations)
+
+    def commit(self):
+        """ Sends collected operations to zookeeper
+
+        Returns:
+            int: number of transactions committed
+        """
+        committed = 0
+        # paths written by transactions committed so far
+        written = set()
+        try:
+            for chunk in self._chunk(self._resolve()):
+                try:
+                    self._commit_chunk(chunk)
+                except NodeExistsError:
+                    # a node was created by someone else after it was
+                    # resolved, resolve this chunk's registrations again and
+                    # retry once
+                    chunk = self._reresolve(chunk)
+                    self._commit_chunk(chunk)
+                committed += 1
+                written.update(node_path for _, node_path, _, _ in chunk)
+        except Exception:
+            self._rollback(written)
+            raise
+        self._operations = []
+        self._rollbacks = {}
+        callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            callback()
+        return committed
+
+    def _resolve(self):
+        """ Translates collected operations into zookeeper operations
+        """
+        registered = [node_path for kind, node_path, _, _ in self._operations
+                      if kind == REGISTER]
+        exists = self._exists(registered)
+
+        operations = []
+        for kind, node_path, data, version in self._operations:
+            if kind == REGISTER:
+                if exists.get(node_path):
+                    operations.append((SET, node_path, data, None))
+                else:
+                    operations.append((CREATE, node_path, data, None))
+                exists[node_path] = True
+            elif kind == SAVE:
+                operations.append((SET, node_path, data, version))
+            else:
+                for descendant in self._subtree(node_path, exists):
+                    operations.append((DELETE, descendant, None, None))
+                    exists[descendant] = False
+        return operations
+
+    def _reresolve(self, chunk):
+        created = [node_path for op, node_path, _, _ in chunk
+                   if op == CREATE]
+        exists = self._exists(created)
+        return [(SET if op == CREATE and exists[node_path] else op,
+                 node_path, data, version)
+                for op, node_path, data, version in chunk]
+
+    def _exists(self, node_paths):
+        """ Checks existence of several nodes with pipelined requests
+        """
+        requests = [(node_path, self._client.exists_async(node_path))
+                    for node_path in set(node_paths)]
+        return {node_path: request.get() is not None
+                for node_path, request in requests}
+
+    def _subtree(self, node_path, exists):
+        """ Lists node_path and its descendants, deepest first
+
+        Nodes registered earlier in this batch are included since they are
+        not yet known to zookeeper
+        """
+        nodes = []
+        level = [node_path]
+        while level:
+            # children of a whole level are listed through pipelined
+            # requests
+            requests = [(current, self._client.get_children_async(current))
+                        for current in level]
+            level = []
+            for current, request in requests:
+                try:
+                    children = request.get()
+                except NoNodeError:
+                    children = []
+                    if not exists.get(current):
+                        continue
+                nodes.append(current)
+                level.extend("{0}/{1}".format(current, child)
+                             for child in children)
+        prefix = node_path + "/"
+        listed = set(nodes)
+        nodes.extend(path for path, created in exists.items()
+                     if created and path.startswith(prefix) and
+                     path not in listed)
+        # deeper paths are deleted first
+        return sorted(nodes, key=lambda path: path.count("/"), reverse=True)
+
+    def _chunk(self, operations):
+        chunk = []
+        size = 0
+        for operation in operations:
+            _, node_path, data, _ = operation
+            operation_size = \
+                OPERATION_OVERHEAD + len(node_path) + len(data or b"")
+            if chunk and size + operation_size > self._max_bytes:
+                yield chunk
+                chunk = []
+                size = 0
+            chunk.append(operation)
+            size += operation_size
+        if chunk:
+            yield chunk
+
+    def _commit_chunk(self, chunk):
+        transaction = self._client.transaction()
+        for op, node_path, data, version in chunk:
+            if op == CREATE:
+                transaction.create(node_path, data)
+            elif op == SET:
+                transaction.set_data(node_path, data,
+                                     -1 if version is None else version)
+            else:
+                transaction.delete(node_path)
+        results = transaction.commit()
+        for result in results:
+            if isinstance(result, Exception) and \
+                    not isinstance(result, RolledBackError):
+                raise result
+        for (op, node_path, _, _), result in zip(chunk, results):
+            if op == CREATE:
+                self._versions[node_path] = 0
+            elif op == SET:
+                # set results carry the node stat
+                self._versions[node_path] = getattr(result, "version", None)
+            else:
+                self._versions.pop(node_path, None)
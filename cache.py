@@ -0,0 +1,116 @@
+"""
+    Client side cache of zookeeper node data and children lists
+
+"""
+from collections import OrderedDict
+from threading import RLock
+
+
+DEFAULT_CACHE_SIZE = 10000
+
+# kinds of entries kept per node path
+DATA = "data"
+CHILDREN = "children"
+
+
+class ZookeeperCache(object):
+
+    """ LRU cache of zookeeper reads keyed by node path
+
+    Entries are expected to be invalidated by zookeeper watches, since a
+    watch may fire while a read is still in flight, entries are only added
+    when no invalidation took place after the read was issued, see
+    `generation`
+    """
+
+    def __init__(self, max_size=DEFAULT_CACHE_SIZE):
+        self._max_size = max(1, max_size)
+        self._entries = OrderedDict()
+        self._lock = RLock()
+        self._generation = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        self.evictions = 0
+
+    @property
+    def generation(self):
+        """ Counter incremented on every invalidation
+
+        Take it before issuing a read and pass it to `put` once the read
+        completes
+        """
+        return self._generation
+
+    def get(self, kind, node_path):
+        """ Looks up an entry
+
+        Returns:
+            tuple: (found, value)
+        """
+        key = (kind, node_path)
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, self._entries[key]
+            self.misses += 1
+        return False, None
+
+    def put(self, kind, node_path, value, generation):
+        """ Adds an entry unless an invalidation happened since generation
+
+        Returns:
+            bool: True if entry was added
+        """
+        key = (kind, node_path)
+        with self._lock:
+            if generation != self._generation:
+                return False
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+        return True
+
+    def invalidate(self, kind, node_path):
+        with self._lock:
+            self._generation += 1
+            if self._entries.pop((kind, node_path), None) is not None:
+                self.invalidations += 1
+
+    def invalidate_tree(self, node_path):
+        """ Invalidates all entries for node_path and its descendants
+        """
+        prefix = node_path.rstrip("/") + "/"
+        with self._lock:
+            self._generation += 1
+            for key in [key for key in self._entries
+                        if key[1] == node_path or key[1].startswith(prefix)]:
+                del self._entries[key]
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._generation += 1
+            self.invalidations += len(self._entries)
+            self._entries.clear()
+
+    def get_stats(self):
+        with self._lock:
+            return {"size": len(self._entries),
+                    "max_size": self._max_size,
+                    "hits": self.hits,
+                    "misses": self.misses,
+                    "invalidations": self.invalidations,
+                    "evictions": self.evictions}
+
+    def reset_stats(self):
+        with self._lock:
+            self.hits = self.misses = 0
+            self.invalidations = self.evictions = 0
+
+    def __len__(self):
+        return len(self._entries)
@@ -0,0 +1,100 @@
+"""
+    Chunked storage of payloads larger than a zookeeper node can hold
+
+"""
+import json
+from hashlib import sha256
+from uuid import uuid4
+
+from .codec import MAGIC, VERSION, MANIFEST
+
+
+# zookeeper rejects nodes larger than jute.maxbuffer (1MB by default)
+DEFAULT_MAX_NODE_BYTES = 960 * 1024
+
+# name of the node under root path holding chunks, for a node
+# /root/1/services/big they are kept under /root/.chunks/1/services/big
+CHUNKS_NODE = ".chunks"
+
+MANIFEST_HEADER = MAGIC + bytes((VERSION, MANIFEST))
+
+
+class ChunkMismatchError(ValueError):
+
+    """ Chunks read do not match the manifest referencing them
+
+    Happens when chunks are replaced by a newer write while being read
+    """
+
+
+class ChunkManifest(object):
+
+    """ Describes a payload stored as chunks
+
+    The manifest is stored in the node itself while chunks are stored under
+    a directory unique to each write, the manifest carries the size and
+    hash of the whole payload so a reader never combines chunks coming from
+    different writes.
+    """
+
+    def __init__(self, write_id, chunks, size, digest):
+        self.write_id = write_id
+        self.chunks = chunks
+        self.size = size
+        self.digest = digest
+
+    @staticmethod
+    def create(payload, chunk_size):
+        """ Splits payload into chunks
+
+        Returns:
+            tuple: (ChunkManifest, list of chunks)
+        """
+        chunks = [payload[offset:offset + chunk_size]
+                  for offset in range(0, len(payload), chunk_size)]
+        manifest = ChunkManifest(uuid4().hex, len(chunks), len(payload),
+                                 sha256(payload).hexdigest())
+        return manifest, chunks
+
+    @staticmethod
+    def is_write_id(name):
+        """ Tells chunk directories of writes apart from those of children
+        """
+        return len(name) == 32 and \
+            all(char in "0123456789abcdef" for char in name)
+
+    @staticmethod
+    def is_manifest(data):
+        return bool(data) and data.startswith(MANIFEST_HEADER)
+
+    @staticmethod
+    def decode(data):
+        manifest = json.loads(data[len(MANIFEST_HEADER):].decode())
+        return ChunkManifest(manifest["id"], manifest["chunks"],
+                             manifest["size"], manifest["sha256"])
+
+    def encode(self):
+        return MANIFEST_HEADER + json.dumps({
+            "id": self.write_id,
+            "chunks": self.chunks,
+            "size": self.size,
+            "sha256": self.digest
+        }).encode()
+
+    def join(self, chunks):
+        """ Puts payload back together verifying it against the manifest
+
+        Raises:
+            ChunkMismatchError: when chunks do not produce the payload
+                described by the manifest
+        """
+        payload = b"".join(chunks)
+        if len(payload) != self.size or \
+                sha256(payload).hexdigest() != self.digest:
+            raise ChunkMismatchError(
+                "Chunks do not match manifest {}".format(self.write_id))
+        return payload
+
+    @staticmethod
+    def chunk_name(index):
+        return "{0:05d}".format(index)
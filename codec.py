@@ -0,0 +1,128 @@
+"""
+    Encoding of payloads stored in zookeeper nodes
+
+"""
+import bz2
+import lzma
+import zlib
+
+from .serializers import get_serializer, get_deserializer, JSON, \
+    DEFAULT_SERIALIZER
+
+
+# encoded payloads start with a zero byte, which plain json never does,
+# allowing plain and encoded nodes to coexist in the same tree
+MAGIC = b"\x00NZ"
+# header versions:
+#   VERSION: MAGIC, version, compression id - json payload
+#   TAGGED_VERSION: MAGIC, version, compression id, serializer format id
+VERSION = 1
+TAGGED_VERSION = 2
+
+DEFAULT_COMPRESSION_THRESHOLD = 1024
+
+NONE = "none"
+NO_COMPRESSION = 0
+
+# format id of chunked storage manifests, see chunks module
+MANIFEST = 0x7F
+# format id of references to content-addressed payloads, see dedup module
+REFERENCE = 0x7E
+
+_compressors = {
+    # name: (id, compress, decompress)
+    "zlib": (1, zlib.compress, zlib.decompress),
+    "bz2": (2, bz2.compress, bz2.decompress),
+    "lzma": (3, lzma.compress, lzma.decompress),
+}
+_decompressors = {compression_id: decompress for
+                  compression_id, _, decompress in _compressors.values()}
+
+
+class ZookeeperCodec(object):
+
+    """ Turns configuration data into node data and back
+
+    Data is serialized with the configured serializer and optionally
+    compressed. Plain json is stored as it is, anything else is prefixed
+    with a header made of MAGIC, a format version, the compression id and,
+    when not json, the serializer format. Payloads smaller than threshold,
+    or that do not shrink when compressed, are stored uncompressed.
+    Decoding detects the format so nodes can be read regardless of the
+    serializer and compression configured.
+    """
+
+    def __init__(self, compression=NONE,
+                 threshold=DEFAULT_COMPRESSION_THRESHOLD,
+                 serializer=DEFAULT_SERIALIZER):
+        """ Constructor for zookeeper codec
+
+        Args:
+            compression (str): "none", "zlib", "bz2" or "lzma"
+            threshold (int): payloads smaller than this many bytes are not
+                compressed
+            serializer (str): "json", "orjson" or "msgpack", json is used
+                when the package backing the serializer is not installed
+        """
+        if compression != NONE and compression not in _compressors:
+            raise ValueError(
+                "Unsupported compression: {}".format(compression))
+        self._compression = compression
+        self._threshold = threshold
+        self._serializer = get_serializer(serializer)
+
+    def encode(self, data):
+        """ Encodes data for storage
+
+        Args:
+            data (dict): configuration data
+
+        Returns:
+            bytes: data to store
+        """
+        payload = self._serializer.dumps(data)
+        compression_id = NO_COMPRESSION
+        if self._compression != NONE and len(payload) >= self._threshold:
+            compressor_id, compress, _ = _compressors[self._compression]
+            compressed = compress(payload)
+            if len(compressed) + len(MAGIC) + 3 < len(payload):
+                payload = compressed
+                compression_id = compressor_id
+
+        format_id = self._serializer.format_id
+        if format_id == JSON:
+            if compression_id == NO_COMPRESSION:
+                return payload
+            return MAGIC + bytes((VERSION, compression_id)) + payload
+        return MAGIC + bytes((TAGGED_VERSION, compression_id, format_id)) + \
+            payload
+
+    def decode(self, data):
+        """ Decodes stored data
+
+        Args:
+            data (bytes): data as stored
+
+        Returns:
+            dict: configuration data
+        """
+        format_id = JSON
+        if data.startswith(MAGIC):
+            version = data[len(MAGIC)]
+            if version == VERSION:
+                compression_id = data[len(MAGIC) + 1]
+                offset = len(MAGIC) + 2
+            elif version == TAGGED_VERSION:
+                compression_id, format_id = \
+                    data[len(MAGIC) + 1:len(MAGIC) + 3]
+                offset = len(MAGIC) + 3
+            else:
+                raise ValueError(
+                    "Unsupported payload format version: {}".format(version))
+            data = data[offset:]
+            if compression_id != NO_COMPRESSION:
+                if compression_id not in _decompressors:
+                    raise ValueError("Unsupported compression id: {}".format(
+                        compression_id))
+                data = _decompressors[compression_id](data)
+        return get_deserializer(format_id, self._serializer).loads(data)
@@ -0,0 +1,81 @@
+"""
+    Content-addressed storage of payloads shared by several nodes
+
+"""
+from collections import OrderedDict
+from threading import Lock
+
+from .codec import MAGIC, VERSION, REFERENCE
+
+
+# name of the node under root path holding payloads, keyed by their sha256,
+# i.e., /root/.blobs/<sha256 hex>
+BLOBS_NODE = ".blobs"
+
+REFERENCE_HEADER = MAGIC + bytes((VERSION, REFERENCE))
+
+# payloads smaller than this are stored in the node itself
+DEFAULT_DEDUP_THRESHOLD = 256
+DEFAULT_BLOB_CACHE_SIZE = 1000
+# seconds a payload is kept after last modified, whether referenced or not
+DEFAULT_BLOB_MIN_AGE = 600
+
+
+def is_reference(data):
+    return bool(data) and data.startswith(REFERENCE_HEADER)
+
+
+def encode_reference(digest):
+    """ Provides data of a node referencing the payload with given digest
+    """
+    return REFERENCE_HEADER + digest.encode()
+
+
+def decode_reference(data):
+    """ Provides digest of the payload a node references
+    """
+    return data[len(REFERENCE_HEADER):].decode()
+
+
+class BlobCache(object):
+
+    """ Payloads as stored, keyed by digest
+
+    Payloads are immutable, entries never need to be invalidated, least
+    recently used ones are evicted beyond max_size. Payloads are kept
+    encoded so that each node read decodes its own copy.
+    """
+
+    def __init__(self, max_size=DEFAULT_BLOB_CACHE_SIZE):
+        self._max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest):
+        """ Provides a payload
+
+        Returns:
+            tuple: (found, data)
+        """
+        with self._lock:
+            data = self._entries.get(digest)
+            if data is None:
+                self.misses += 1
+                return False, None
+            self._entries.move_to_end(digest)
+            self.hits += 1
+        return True, data
+
+    def put(self, digest, data):
+        """ Keeps a payload
+        """
+        with self._lock:
+            self._entries[digest] = data
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self._max_size:
+                self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
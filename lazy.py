@@ -0,0 +1,123 @@
+"""
+    Multiple configurations whose children are fetched on first access
+
+"""
+from threading import RLock, Thread
+
+
+class _Pending(object):
+
+    """ Placeholder of a child not fetched yet
+    """
+
+    def __repr__(self):
+        return "<pending>"
+
+
+PENDING = _Pending()
+
+_lazy_classes = {}
+
+
+class LazyConfiguration(object):
+
+    """ Mixin making a configuration fetch its children on first access
+
+    Children are known up front, each starts as a placeholder replaced by
+    the configuration loaded the first time it is accessed. Combined with
+    the configuration class in use, see get_lazy_class.
+    """
+
+    def set_loader(self, children, loader):
+        """ Lists children to be loaded on access
+
+        Args:
+            children (iterable): child names
+            loader (callable): receives a child name, returns its
+                configuration
+        """
+        self._lazy_lock = RLock()
+        self._lazy_loader = loader
+        for child in children:
+            super().__setitem__(child, PENDING)
+
+    def is_loaded(self, key):
+        return super().__getitem__(key) is not PENDING
+
+    def get_pending(self):
+        """ Provides names of children not loaded yet
+        """
+        return [key for key in list(self.keys())
+                if super(LazyConfiguration, self).__getitem__(key) is
+                PENDING]
+
+    def set_loaded(self, key, value):
+        """ Provides a child loaded elsewhere, kept only if still pending
+
+        Returns:
+            bool: True if value was kept
+        """
+        with self._lazy_lock:
+            if super().__getitem__(key) is not PENDING:
+                return False
+            super().__setitem__(key, value)
+            return True
+
+    def __getitem__(self, key):
+        value = super().__getitem__(key)
+        if value is not PENDING:
+            return value
+        with self._lazy_lock:
+            value = super().__getitem__(key)
+            if value is PENDING:
+                value = self._lazy_loader(key)
+                super().__setitem__(key, value)
+        return value
+
+    def get(self, key, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def items(self):
+        return [(key, self[key]) for key in list(self.keys())]
+
+    def values(self):
+        return [self[key] for key in list(self.keys())]
+
+
+def get_lazy_class(config_class):
+    """ Provides lazy variant of a configuration class
+    """
+    lazy_class = _lazy_classes.get(config_class)
+    if lazy_class is None:
+        lazy_class = type("Lazy{}".format(config_class.__name__),
+                          (LazyConfiguration, config_class), {})
+        _lazy_classes[config_class] = lazy_class
+    return lazy_class
+
+
+def read_ahead(config, fetch_many, logger):
+    """ Loads pending children of a lazy configuration in the background
+
+    Args:
+        config (LazyConfiguration): configuration to populate
+        fetch_many (callable): receives child names, yields
+            (child name, configuration) as they are loaded
+        logger: logger to report failures with
+
+    Returns:
+        Thread: thread loading children
+    """
+    def run():
+        try:
+            for child, value in fetch_many(config.get_pending()):
+                config.set_loaded(child, value)
+        except Exception:
+            # children not loaded are fetched on access
+            logger.exception("Read ahead failed")
+
+    thread = Thread(target=run, name="ZookeeperReadAhead", daemon=True)
+    thread.start()
+    return thread
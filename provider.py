@@ -3,16 +3,47 @@
 
 """
 import json
+import time
+from threading import Lock
 
 from nio.util.logging import get_nio_logger
 from niocore.configuration.providers import ConfigurationProvider
 from niocore.configuration import Configuration
-from .proxy import ZookeeperProxy
+from .batch import DEFAULT_MAX_BATCH_BYTES
+from .cache import DEFAULT_CACHE_SIZE
+from .chunks import DEFAULT_MAX_NODE_BYTES
+from .serializers import DEFAULT_SERIALIZER
+from .sharding import get_child_path, get_layout, is_bucket, list_children
+from .codec import NONE, DEFAULT_COMPRESSION_THRESHOLD
+from .dedup import DEFAULT_DEDUP_THRESHOLD, DEFAULT_BLOB_CACHE_SIZE, \
+    DEFAULT_BLOB_MIN_AGE
+from .lazy import get_lazy_class, read_ahead, LazyConfiguration
+from .proxy import ZookeeperProxy, DEFAULT_MAX_IN_FLIGHT, \
+    DEFAULT_START_TIMEOUT
+from .resilience import is_stale, DEFAULT_RETRY_DELAY, \
+    DEFAULT_RETRY_MAX_DELAY
+from .subscriptions import SubscriptionEvent, REMOVED
+from .write_behind import DEFAULT_MAX_PENDING
 
 
 __all__ = ['ZookeeperConfigurationProvider']
 
 
+# seconds a prefetched configuration is handed out for
+DEFAULT_PREFETCH_TTL = 60
+
+
+def _as_bool(value):
+    """ Interprets a setting value as a boolean
+
+    Settings read from a file arrive as strings, so "False" must not be
+    taken as a true value
+    """
+    if isinstance(value, str):
+        return value.strip().lower() in ("true", "yes", "on", "1")
+    return bool(value)
+
+
 class ZookeeperConfigurationData(object):
 
     """ Private configuration data
@@ -20,9 +51,23 @@ class ZookeeperConfigurationData(object):
     Stores data specific to the Zookeeper implementation
     """
 
-    def __init__(self, path, multiple):
+    def __init__(self, path, multiple, version=None, digest=None,
+                 children=None, buckets=None, stale=False):
         self.path = path
         self.multiple = multiple
+        # node version as fetched or saved, used to detect concurrent
+        # modifications when optimistic concurrency is enabled
+        self.version = version
+        # digest of data as fetched or saved, kept for children of multiple
+        # configurations to find out which changed when the parent is saved
+        self.digest = digest
+        # names of children as fetched or saved, multiple configurations
+        self.children = children
+        # number of buckets children are spread across, 0 when flat, None
+        # when unknown, see sharding module
+        self.buckets = buckets
+        # served as last read while the zookeeper session was interrupted
+        self.stale = stale
 
 
 class ZookeeperConfigurationProvider(ConfigurationProvider):
@@ -63,36 +108,159 @@ class ZookeeperConfigurationProvider(ConfigurationProvider):
         super().__init__(settings)
         self._config_class = config_class
         self.logger = get_nio_logger("ZookeeperConfigurationProvider")
+        # when enabled, children of a multiple configuration are fetched
+        # through pipelined asynchronous requests
+        self._parallel_fetch = _as_bool(
+            settings.providers.get("parallel_fetch", False))
+        self._max_in_flight = int(
+            settings.providers.get("max_in_flight", DEFAULT_MAX_IN_FLIGHT))
+        # when enabled, children of a multiple configuration are fetched
+        # when first accessed, optionally reading ahead in the background
+        self._lazy_fetch = _as_bool(
+            settings.providers.get("lazy_fetch", False))
+        self._read_ahead = _as_bool(
+            settings.providers.get("read_ahead", False))
+        # seconds changes delivered to subscribers are merged for
+        self._subscribe_debounce = float(
+            settings.providers.get("subscribe_debounce", 0))
+        # when enabled, saving a configuration fails if its node was
+        # modified since it was fetched or saved
+        self._optimistic_concurrency = _as_bool(
+            settings.providers.get("optimistic_concurrency", False))
+        # name -> (substitute, configuration, expiry time) fetched by
+        # prefetch, handed out by the next fetch of that name until expired
+        self._prefetch_ttl = float(
+            settings.providers.get("prefetch_ttl", DEFAULT_PREFETCH_TTL))
+        self._prefetched = {}
+        self._prefetched_lock = Lock()
+        # name node path -> number of buckets children are spread across,
+        # as last read
+        self._layouts = {}
         if not self._get_proxy():
-            zk = ZookeeperProxy()
+            zk = ZookeeperProxy(**self._get_proxy_options(settings))
             self._parse_mappings(settings.providers.get("mappings",
                                                         {"default": 1}))
             zk.connect(settings.providers.get("ip_address", "127.0.0.1"),
                        settings.providers.get("port", 2181),
                        settings.providers.get("root_path",
                                               "/nio_configuration"),
-                       self.logger)
+                       self.logger,
+                       hosts=self._get_hosts(settings))
             self._set_proxy(zk)
 
-    def _fetch(self, child_node_path, substitute=True):
+    @staticmethod
+    def _get_proxy_options(settings):
+        """ Translates provider settings into zookeeper proxy options
+        """
+        providers = settings.providers
+        options = {
+            "max_batch_bytes": int(providers.get("max_batch_bytes",
+                                                 DEFAULT_MAX_BATCH_BYTES)),
+            "compression": providers.get("compression", NONE),
+            "compression_threshold": int(providers.get(
+                "compression_threshold", DEFAULT_COMPRESSION_THRESHOLD)),
+            "max_node_bytes": int(providers.get("max_node_bytes",
+                                                DEFAULT_MAX_NODE_BYTES)),
+            "serializer": providers.get("serializer", DEFAULT_SERIALIZER),
+            "write_elision": _as_bool(providers.get("write_elision", False)),
+            "track_versions": _as_bool(providers.get(
+                "optimistic_concurrency", False)),
+            # baselines of children of multiple configurations
+            "track_digests": True,
+            "snapshot_file": providers.get("snapshot_file"),
+            "read_sessions": int(providers.get("read_sessions", 0)),
+            "sync_reads": _as_bool(providers.get("sync_reads", False)),
+            "write_behind_interval": float(providers.get(
+                "write_behind_interval", 0)),
+            "write_behind_max_pending": int(providers.get(
+                "write_behind_max_pending", DEFAULT_MAX_PENDING)),
+            "dedup": _as_bool(providers.get("dedup", False)),
+            "dedup_threshold": int(providers.get("dedup_threshold",
+                                                 DEFAULT_DEDUP_THRESHOLD)),
+            "blob_cache_size": int(providers.get("blob_cache_size",
+                                                 DEFAULT_BLOB_CACHE_SIZE)),
+            "blob_min_age": float(providers.get("blob_min_age",
+                                                DEFAULT_BLOB_MIN_AGE)),
+            "background_connect": _as_bool(providers.get(
+                "background_connect", False)),
+            "start_timeout": float(providers.get("start_timeout",
+                                                 DEFAULT_START_TIMEOUT)),
+            "retry_max_tries": int(providers.get("retry_max_tries", 0)),
+            "retry_delay": float(providers.get("retry_delay",
+                                               DEFAULT_RETRY_DELAY)),
+            "retry_max_delay": float(providers.get("retry_max_delay",
+                                                   DEFAULT_RETRY_MAX_DELAY)),
+            "retry_deadline": float(providers.get("retry_deadline", 0)),
+            "serve_stale": _as_bool(providers.get("serve_stale", False)),
+            "stale_size": int(providers.get("stale_size",
+                                            DEFAULT_CACHE_SIZE)),
+            "max_offline_writes": int(providers.get("max_offline_writes", 0))
+        }
+        if _as_bool(providers.get("cache", False)):
+            options["cache_size"] = int(providers.get("cache_size",
+                                                      DEFAULT_CACHE_SIZE))
+        return options
+
+    @staticmethod
+    def _get_hosts(settings):
+        """ Provides ensemble host list from settings, if any
+
+        Returns:
+            str: comma separated host:port list, None when not set
+        """
+        hosts = settings.providers.get("hosts")
+        if isinstance(hosts, (list, tuple)):
+            hosts = ",".join(hosts)
+        return hosts or None
+
+    def _fetch(self, child_node_path, substitute=True, baseline=False):
         """ Fetches a zookeeper single configuration
 
         Args:
             child_node_path (str): path to child node
+            baseline (bool): keep digest of data, for children of multiple
+                configurations
 
         Returns:
             Configuration: with config values
         """
         data = self._get_proxy().fetch(child_node_path)
+        return self._create_config(child_node_path, data, substitute,
+                                   baseline)
+
+    def _create_config(self, child_node_path, data, substitute,
+                       baseline=False):
+        """ Creates a single configuration out of fetched data
+
+        Args:
+            child_node_path (str): path to child node
+            data (dict): data fetched from child node
+            baseline (bool): keep digest of data, for children of multiple
+                configurations
+
+        Returns:
+            Configuration: with config values
+        """
         config = \
             self._config_class(fetch_on_create=False,
                                data=data,
                                substitute=substitute)
         config['_private'] = \
-            ZookeeperConfigurationData(child_node_path, False)
+            ZookeeperConfigurationData(child_node_path, False,
+                                       self._get_version(child_node_path),
+                                       stale=is_stale(data))
+        if baseline:
+            # digest of data as read, data is not serialized again, an empty
+            # digest when unknown makes the child be written on save
+            config['_private'].digest = \
+                self._get_proxy().get_read_digest(child_node_path) or b""
 
         return config
 
+    def _get_version(self, node_path):
+        if self._optimistic_concurrency:
+            return self._get_proxy().get_version(node_path)
+
     def fetch(self, name, substitute=True):
         """ Fetches a zookeeper base configuration, multiple or single
 
@@ -103,26 +271,203 @@ class ZookeeperConfigurationProvider(ConfigurationProvider):
         Returns:
             Configuration: with config values
         """
+        config = self._take_prefetched(name, substitute)
+        if config is not None:
+            return config
 
-        node_path = "{0}/{1}/{2}".format(self._get_proxy().get_root_path(),
-                                         self._get_id(name),
-                                         name)
+        node_path = self._get_name_node_path(name)
         children = self._get_proxy().get_children(node_path)
         if children:
-            config = self._config_class(name=name,
-                                        fetch_on_create=False,
-                                        substitute=substitute)
-            config['_private'] = \
-                ZookeeperConfigurationData(node_path, True)
-
-            for child in children:
-                child_node_path = "{0}/{1}".format(node_path, child)
-                config[child] = self._fetch(child_node_path, substitute)
+            buckets, child_paths = list_children(
+                self._get_proxy(), node_path, children, self._max_in_flight)
+            config_class = self._config_class
+            if self._lazy_fetch:
+                config_class = get_lazy_class(config_class)
+            config = self._create_multiple_config(
+                config_class, name, node_path, child_paths, buckets,
+                substitute, is_stale(children))
+
+            if self._lazy_fetch:
+                self._fetch_children_lazy(config, child_paths, substitute)
+            elif self._parallel_fetch:
+                self._fetch_children_parallel(config, child_paths,
+                                              substitute)
+            else:
+                for child, child_node_path in child_paths.items():
+                    config[child] = self._fetch(child_node_path, substitute,
+                                                baseline=True)
         else:
-            config = self._fetch(node_path, substitute)
+            config = self._create_single_config(
+                node_path, self._get_proxy().fetch(node_path), substitute)
+
+        return config
+
+    def _create_single_config(self, node_path, data, substitute):
+        """ Creates a single base configuration out of its name node data
+        """
+        config = self._create_config(node_path, data, substitute)
+        config['_private'].buckets = 0
+        return config
 
+    def _get_name_node_path(self, name):
+        return "{0}/{1}/{2}".format(self._get_proxy().get_root_path(),
+                                    self._get_id(name),
+                                    name)
+
+    def _create_multiple_config(self, config_class, name, node_path,
+                                child_paths, buckets, substitute,
+                                stale=False):
+        """ Creates a multiple configuration, children are added by caller
+
+        Args:
+            child_paths (dict): child node name -> child node path
+            buckets (int): number of buckets children are spread across
+        """
+        self._layouts[node_path] = buckets
+        config = config_class(name=name,
+                              fetch_on_create=False,
+                              substitute=substitute)
+        config['_private'] = \
+            ZookeeperConfigurationData(node_path, True,
+                                       children=set(child_paths),
+                                       buckets=buckets,
+                                       stale=stale)
         return config
 
+    def prefetch(self, names, substitute=True):
+        """ Fetches several base configurations ahead of their fetch
+
+        Each name is resolved through the mappings and all of their
+        subtrees are read in one pipelined sweep, keeping at most
+        max_in_flight requests outstanding: name nodes are listed together,
+        then every child, or name node of a single configuration, is
+        fetched together, the nodes of each subtree one after the other.
+        The next fetch of each name, with the same substitute, returns its
+        configuration without reading zookeeper, unless prefetch_ttl
+        seconds went by. A configuration prefetched is dropped when it, or
+        any of its children, is registered, saved or removed through this
+        provider.
+
+        Args:
+            names (iterable): node names, e.g., "blocks", "services"
+            substitute (bool): substitute variables
+
+        Returns:
+            dict: name -> seconds the sweep waited for nodes of its subtree,
+                from the completion of the node read before each of them
+                to their own completion
+        """
+        proxy = self._get_proxy()
+        node_paths = {name: self._get_name_node_path(name) for name in names}
+        names = {node_path: name for name, node_path in node_paths.items()}
+        timings = dict.fromkeys(node_paths, 0.0)
+        completed = [time.perf_counter()]
+
+        def account(name):
+            now = time.perf_counter()
+            timings[name] += now - completed[0]
+            completed[0] = now
+
+        configs = {}
+        # path of each node fetched -> (name, child name or None), nodes
+        # of a subtree in a row
+        owners = {}
+        for node_path, children in proxy.get_children_many(
+                names, self._max_in_flight):
+            name = names[node_path]
+            if not children:
+                owners[node_path] = (name, None)
+                account(name)
+                continue
+            buckets, child_paths = list_children(
+                proxy, node_path, children, self._max_in_flight)
+            configs[name] = self._create_multiple_config(
+                self._config_class, name, node_path, child_paths, buckets,
+                substitute, is_stale(children))
+            owners.update({child_node_path: (name, child)
+                           for child, child_node_path in child_paths.items()})
+            account(name)
+
+        for node_path, data in proxy.fetch_many(owners, self._max_in_flight):
+            name, child = owners[node_path]
+            if child is None:
+                configs[name] = self._create_single_config(node_path, data,
+                                                           substitute)
+            else:
+                configs[name][child] = self._create_config(
+                    node_path, data, substitute, baseline=True)
+            account(name)
+
+        expires = time.monotonic() + self._prefetch_ttl
+        with self._prefetched_lock:
+            for name, config in configs.items():
+                self._prefetched[name] = (substitute, config, expires)
+        for name, seconds in timings.items():
+            self.logger.info("Prefetched {} from mapping {} in {:.3f}s".format(
+                name, self._get_id(name), seconds))
+        return timings
+
+    def _take_prefetched(self, name, substitute):
+        with self._prefetched_lock:
+            prefetched = self._prefetched.pop(name, None)
+        if prefetched is not None and prefetched[0] == substitute and \
+                time.monotonic() < prefetched[2]:
+            return prefetched[1]
+
+    def _discard_prefetched(self, node_path):
+        """ Drops the configuration prefetched that node_path belongs to
+        """
+        with self._prefetched_lock:
+            for name, prefetched in list(self._prefetched.items()):
+                name_path = prefetched[1]['_private'].path
+                if node_path == name_path or \
+                        node_path.startswith(name_path + "/"):
+                    del self._prefetched[name]
+
+    def _fetch_children_parallel(self, config, child_paths, substitute):
+        """ Fetches all children of a multiple configuration concurrently
+
+        Args:
+            config (Configuration): parent configuration to populate
+            child_paths (dict): child node name -> child node path
+            substitute (bool): substitute variables
+        """
+        for child, child_config in self._fetch_many(child_paths,
+                                                    substitute):
+            config[child] = child_config
+
+    def _fetch_many(self, child_paths, substitute):
+        """ Fetches children of a multiple configuration concurrently
+
+        Args:
+            child_paths (dict): child node name -> child node path
+
+        Yields:
+            tuple: (child name, Configuration)
+        """
+        children = {child_node_path: child
+                    for child, child_node_path in child_paths.items()}
+        for child_node_path, data in self._get_proxy().fetch_many(
+                children, self._max_in_flight):
+            yield children[child_node_path], \
+                self._create_config(child_node_path, data, substitute,
+                                    baseline=True)
+
+    def _fetch_children_lazy(self, config, child_paths, substitute):
+        """ Sets up a multiple configuration to fetch children on access
+
+        Args:
+            config (LazyConfiguration): parent configuration
+            child_paths (dict): child node name -> child node path
+            substitute (bool): substitute variables
+        """
+        config.set_loader(list(child_paths), lambda child: self._fetch(
+            child_paths[child], substitute, baseline=True))
+        if self._read_ahead:
+            read_ahead(config, lambda pending: self._fetch_many(
+                {child: child_paths[child] for child in pending},
+                substitute), self.logger)
+
     def register(self, config, sub_config, name):
         """Register a configuration as a child.
 
@@ -132,32 +477,241 @@ class ZookeeperConfigurationProvider(ConfigurationProvider):
                 the configuration provider data
             name (str): The name under which to register.
         """
-        node_path = "{0}/{1}/{2}/{3}".format(self._get_proxy().get_root_path(),
-                                             self._get_id(config.name),
-                                             config.name,
-                                             name)
+        node_path = self._get_child_node_path(config, name)
+        self._discard_prefetched(node_path)
         sub_config['_private'] = ZookeeperConfigurationData(node_path,
                                                             False)
-        self._get_proxy().register(node_path, sub_config)
+        proxy = self._get_proxy()
+        proxy.register(node_path, sub_config)
+        # within a batch, version is known once committed
+        proxy.after_commit(
+            lambda: self._registered(config, sub_config, name, node_path))
+
+    def _registered(self, config, sub_config, name, node_path):
+        """ Updates private data once sub_config was registered as a child
+        of config
+        """
+        sub_config['_private'].version = self._get_version(node_path)
+        private = self._get_private(config)
+        if private is not None and private.children is not None:
+            # keep baseline of a fetched multiple configuration current
+            private.children.add(name)
+            sub_config['_private'].digest = \
+                self._get_proxy().get_digest(sub_config)
+
+    def _get_child_node_path(self, config, name, buckets=None):
+        """ Provides path to register a child of config under, following
+        its layout, read from its node unless buckets is given
+        """
+        node_path = self._get_name_node_path(config.name)
+        if buckets is None:
+            buckets = self._get_buckets(config, node_path)
+        return get_child_path(node_path, name, buckets)
+
+    def _get_buckets(self, config, node_path):
+        """ Provides number of buckets children of config are spread
+        across, read from its node unless known since it was fetched
+        """
+        buckets = self._get_known_buckets(config, node_path)
+        if buckets is None:
+            buckets = self._layouts[node_path] = \
+                get_layout(self._get_proxy().fetch(node_path))
+        return buckets
+
+    def _get_known_buckets(self, config, node_path):
+        """ Provides number of buckets children of config are spread
+        across, as fetched with config or last read, None if unknown
+        """
+        private = self._get_private(config) if config is not None else None
+        if private is not None and private.path == node_path and \
+                private.buckets is not None:
+            return private.buckets
+        return self._layouts.get(node_path)
 
     def save(self, config):
         """Save the configuration details.
 
         This method will update the configuration source with its current
-        internal configuration state.
+        internal configuration state. Saving a fetched multiple
+        configuration writes only children added, changed or removed since
+        it was fetched or saved, in a single batch.
 
         Args:
             config (Configuration): The configuration to save.
 
         Returns:
             None
+
+        Raises:
+            BadVersionError: when optimistic concurrency is enabled and the
+                configuration was modified since it was fetched or saved
         """
         node_path = self._get_node_path(config)
-        self._get_proxy().save(node_path, config)
+        self._discard_prefetched(node_path)
+        private = self._get_private(config)
+        if private is not None and private.multiple and \
+                private.children is not None:
+            self._save_children(config, private)
+            return
+
+        proxy = self._get_proxy()
+        proxy.save(node_path, config, **self._get_save_options(private))
+        proxy.after_commit(lambda: self._saved(config, private, node_path))
+
+    def _get_save_options(self, private):
+        """ Provides version to save a single configuration with, when
+        checked
+        """
+        if self._optimistic_concurrency:
+            return {"version": private.version if private else None}
+        return {}
+
+    def _saved(self, config, private, node_path):
+        """ Updates private data once a single configuration was saved
+        """
+        if private:
+            private.version = self._get_version(node_path)
+            if private.digest is not None:
+                private.digest = self._get_proxy().get_digest(config)
+
+    def _save_children(self, config, private):
+        """ Saves changes made to a multiple configuration
+
+        Children are compared against the digest of their data as fetched
+        or saved, children not loaded yet by a lazy configuration are
+        unchanged
+
+        Args:
+            config (Configuration): multiple configuration
+            private (ZookeeperConfigurationData): its private data
+        """
+        proxy = self._get_proxy()
+        children = [child for child in config if not child.startswith("_")]
+        written = []
+        with proxy.batch():
+            for child in children:
+                if isinstance(config, LazyConfiguration) and \
+                        not config.is_loaded(child):
+                    continue
+                sub_config = config[child]
+                child_node_path = get_child_path(private.path, child,
+                                                 private.buckets or 0)
+                digest = proxy.get_digest(sub_config)
+                child_private = self._get_private(sub_config)
+                if child not in private.children or child_private is None \
+                        or child_private.path != child_node_path:
+                    sub_config['_private'] = ZookeeperConfigurationData(
+                        child_node_path, False)
+                    proxy.register(child_node_path, sub_config)
+                elif child_private.digest != digest:
+                    if self._optimistic_concurrency:
+                        proxy.save(child_node_path, sub_config,
+                                   version=child_private.version)
+                    else:
+                        proxy.save(child_node_path, sub_config)
+                else:
+                    continue
+                written.append((child_node_path, sub_config, digest))
+            for child in private.children.difference(children):
+                proxy.remove(get_child_path(private.path, child,
+                                            private.buckets or 0))
+
+        for child_node_path, sub_config, digest in written:
+            sub_config['_private'].digest = digest
+            sub_config['_private'].version = \
+                self._get_version(child_node_path)
+        private.children = set(children)
 
     def remove(self, config):
         node_path = self._get_node_path(config)
+        self._discard_prefetched(node_path)
         self._get_proxy().remove(node_path)
+        self._layouts.pop(node_path, None)
+
+    def subscribe(self, name, callback, child=None, debounce=None):
+        """ Delivers changes made to a configuration by any instance
+
+        Args:
+            name (str): configuration name
+            callback (callable): receives a SubscriptionEvent with kind of
+                change (ADDED, CHANGED or REMOVED), name, child name (None
+                for the configuration itself) and the new configuration
+                (None when removed)
+            child (str): restrict changes to this child of a multiple
+                configuration
+            debounce (float): seconds changes to a node are merged for,
+                subscribe_debounce setting by default
+
+        Returns:
+            ZookeeperSubscription: subscription, call cancel to stop
+
+        Example:
+            subscription = provider.subscribe(
+                "blocks", lambda event: print(event.kind, event.child))
+        """
+        name_path = self._get_name_node_path(name)
+        # layout is known from now on, kept current by fetch
+        buckets = self._get_buckets(None, name_path)
+        node_path = name_path
+        if child is not None:
+            node_path = get_child_path(name_path, child, buckets)
+        if debounce is None:
+            debounce = self._subscribe_debounce
+
+        def deliver(kind, child_name, data):
+            child_name = child if child is not None else child_name
+            config = None
+            if kind != REMOVED:
+                config = self._create_config(
+                    node_path if child_name is None or child is not None
+                    else get_child_path(
+                        name_path, child_name,
+                        self._get_known_buckets(None, name_path) or 0),
+                    data or {}, True)
+            callback(SubscriptionEvent(kind, name, child_name, config))
+
+        # children of a sharded configuration are found in its buckets
+        return self._get_proxy().subscribe(node_path, deliver,
+                                           children=child is None,
+                                           debounce=debounce,
+                                           groups=is_bucket)
+
+    def batch(self):
+        """ Groups registrations, saves and removes into transactions
+
+        Writes issued by current thread within the returned context are
+        sent when it exits, as transactions each applied atomically
+
+        Example:
+            with provider.batch():
+                for name, block in blocks.items():
+                    provider.register(config, block, name)
+        """
+        return self._get_proxy().batch()
+
+    def flush(self):
+        """ Sends saves queued when write-behind is enabled, waiting until
+        they are sent
+        """
+        return self._get_proxy().flush()
+
+    def get_stats(self):
+        """ Provides latency, call, error and byte counts of operations
+
+        Returns:
+            dict: operation -> mapping id -> name -> statistics
+        """
+        return self._get_proxy().get_stats()
+
+    def reset_stats(self):
+        self._get_proxy().reset_stats()
+
+    @staticmethod
+    def _get_private(config):
+        try:
+            return config['_private']
+        except KeyError:
+            return None
 
     def _get_node_path(self, config):
         try:
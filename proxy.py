@@ -1,98 +1,1839 @@
 import atexit
-import json
+import time
+from collections import deque
+from itertools import count
+from contextlib import contextmanager
+from hashlib import sha256
+from threading import Event, Lock, Thread, local
 
-from kazoo.client import KazooClient, KazooState
-from kazoo.exceptions import NodeExistsError, NoNodeError
+from kazoo.exceptions import BadVersionError, NodeExistsError, NoNodeError, \
+    NotEmptyError
+from kazoo.protocol.states import EventType, KazooState
 
 from niocore.util.hooks import Hooks
 
+from .batch import ZookeeperBatch, DEFAULT_MAX_BATCH_BYTES, REMOVE
+from .cache import ZookeeperCache, DATA, CHILDREN, DEFAULT_CACHE_SIZE
+from .chunks import ChunkManifest, ChunkMismatchError, CHUNKS_NODE, \
+    DEFAULT_MAX_NODE_BYTES
+from .codec import ZookeeperCodec, NONE, DEFAULT_COMPRESSION_THRESHOLD
+from .resilience import OfflineWriteQueue, StaleData, StaleChildren, \
+    CONNECTION_ERRORS, STALE, DEFAULT_RETRY_DELAY, DEFAULT_RETRY_MAX_DELAY, \
+    create_retry
+from .dedup import BlobCache, BLOBS_NODE, DEFAULT_DEDUP_THRESHOLD, \
+    DEFAULT_BLOB_CACHE_SIZE, DEFAULT_BLOB_MIN_AGE, is_reference, \
+    encode_reference, decode_reference
+from .serializers import DEFAULT_SERIALIZER
+from .single_flight import SingleFlight
+from .snapshot import ZookeeperSnapshot
+from .stats import ZookeeperStats
+from .subscriptions import ZookeeperSubscription
+from .write_behind import WriteBehindQueue, DEFAULT_MAX_PENDING
+
+
+DEFAULT_MAX_IN_FLIGHT = 32
+# times a chunked node is read when chunks are replaced while reading
+CHUNK_READ_ATTEMPTS = 3
+# times a subtree is listed and deleted again when nodes are created in it
+# while removing it
+REMOVE_ATTEMPTS = 3
+# seconds to wait for a session to be established
+DEFAULT_START_TIMEOUT = 15
+
+
+def create_client(**kwargs):
+    """ Creates a kazoo client
+
+    kazoo.client accounts for most of kazoo's import time, it is imported
+    once a client is needed
+    """
+    from kazoo.client import KazooClient
+    return KazooClient(**kwargs)
+
 
 class ZookeeperProxy(object):
 
-    hook_points = ['kazoo_state_change']
+    hook_points = ['kazoo_state_change', 'operation_complete']
+
+    def __init__(self, cache_size=None,
+                 max_batch_bytes=DEFAULT_MAX_BATCH_BYTES,
+                 compression=NONE,
+                 compression_threshold=DEFAULT_COMPRESSION_THRESHOLD,
+                 max_node_bytes=DEFAULT_MAX_NODE_BYTES,
+                 serializer=DEFAULT_SERIALIZER,
+                 write_elision=False,
+                 track_versions=False,
+                 track_digests=False,
+                 snapshot_file=None,
+                 read_sessions=0,
+                 sync_reads=False,
+                 write_behind_interval=0,
+                 write_behind_max_pending=DEFAULT_MAX_PENDING,
+                 dedup=False,
+                 dedup_threshold=DEFAULT_DEDUP_THRESHOLD,
+                 blob_cache_size=DEFAULT_BLOB_CACHE_SIZE,
+                 blob_min_age=DEFAULT_BLOB_MIN_AGE,
+                 background_connect=False,
+                 start_timeout=DEFAULT_START_TIMEOUT,
+                 retry_max_tries=0,
+                 retry_delay=DEFAULT_RETRY_DELAY,
+                 retry_max_delay=DEFAULT_RETRY_MAX_DELAY,
+                 retry_deadline=None,
+                 serve_stale=False,
+                 stale_size=DEFAULT_CACHE_SIZE,
+                 max_offline_writes=0):
+        """ Constructor for zookeeper proxy
 
-    def __init__(self):
+        Args:
+            cache_size (int): when specified, node data and children lists
+                are kept in memory, invalidated through zookeeper watches and
+                flushed when the session is suspended or lost. Least
+                recently used entries are evicted beyond this size
+            max_batch_bytes (int): maximum size of a batch transaction
+            compression (str): compression applied to written data, nodes
+                are read regardless of how they were written
+            compression_threshold (int): data smaller than this many bytes
+                is written uncompressed
+            max_node_bytes (int): data larger than this is stored as a
+                manifest node referencing chunks no larger than this
+            serializer (str): serializer used for written data, "json",
+                "orjson" or "msgpack". Each node records its format so
+                nodes are read regardless of how they were written
+            write_elision (bool): skip writes of data a node is known to
+                hold already, node version is checked before skipping
+            track_versions (bool): remember version of nodes read and
+                written, see get_version. Implied by write_elision
+            track_digests (bool): remember digest of data of nodes read and
+                written, see get_read_digest. Implies track_versions
+            snapshot_file (str): when specified, nodes read are saved to
+                this file on disconnect, and served from it on the next
+                connection as long as they did not change
+            read_sessions (int): number of additional sessions reads are
+                spread across, each preferring a different ensemble member.
+                Writes are sent through the primary session, reads from
+                read sessions may lag them unless sync_reads is enabled
+            sync_reads (bool): sync the server a session is connected to
+                with the leader before each read, so that reads observe
+                every write committed before them
+            write_behind_interval (float): when specified, saves return
+                once queued and are sent from a background thread, as
+                batches, within this many seconds. Saves to a node not sent
+                yet are replaced by later ones, and served to reads from
+                this proxy. Saves specifying a version are sent right away
+            write_behind_max_pending (int): number of nodes with queued
+                saves that triggers sending them
+            dedup (bool): store data of dedup_threshold bytes or more once,
+                under a node named after its sha256, nodes holding a
+                reference to it. Nodes are read regardless of how they were
+                written
+            dedup_threshold (int): data smaller than this many bytes is
+                stored in the node itself
+            blob_cache_size (int): number of referenced payloads kept in
+                memory, decoded for each node read
+            blob_min_age (float): seconds a payload is kept after last
+                modified, see collect_blobs. Payloads referenced are touched
+                when last modified more than half of this ago
+            background_connect (bool): connect returns right away, sessions
+                are established from a background thread and operations
+                wait until they are
+            start_timeout (float): seconds to wait for a session to be
+                established
+            retry_max_tries (int): times reads and writes failing because
+                the connection was lost are retried, -1 for unlimited
+            retry_delay (float): seconds before the first retry, doubled
+                after each one up to retry_max_delay
+            retry_max_delay (float): maximum seconds between retries
+            retry_deadline (float): seconds after which retrying stops
+            serve_stale (bool): while the session is suspended or lost,
+                serve reads from the data last read, up to stale_size
+                entries, as StaleData and StaleChildren
+            stale_size (int): number of reads kept to be served stale
+            max_offline_writes (int): when specified, registrations and
+                saves not specifying a version are queued while the
+                session is suspended or lost, up to this many nodes, and
+                sent in order once reconnected
+        """
         self._zk = None
+        self._read_session_count = read_sessions
+        self._read_sessions = []
+        self._read_counter = count()
+        self._sync_reads = sync_reads
+        self._background_connect = background_connect
+        self._start_timeout = start_timeout
+        # set once sessions are established, or failed to
+        self._ready = Event()
+        self._starter = None
+        self._start_error = None
         self.logger = None
         self._root_path = None
+        self._cache = ZookeeperCache(cache_size) if cache_size else None
+        self._max_batch_bytes = max_batch_bytes
+        self._codec = ZookeeperCodec(compression, compression_threshold,
+                                     serializer)
+        self._max_node_bytes = max_node_bytes
+        self._write_elision = write_elision
+        self._dedup = dedup
+        self._dedup_threshold = dedup_threshold
+        self._blob_cache = BlobCache(blob_cache_size)
+        self._blob_min_age = blob_min_age
+        # digest -> time payload was known to be last modified
+        self._known_blobs = {}
+        # node path -> (version, digest of data) as last read or written
+        self._versions = {} \
+            if write_elision or track_versions or track_digests else None
+        self.elided_writes = 0
+        # concurrent identical reads share one request
+        self._flights = SingleFlight()
+        self._retry_policy = create_retry(retry_max_tries, retry_delay,
+                                          retry_max_delay, retry_deadline)
+        self._connected = False
+        # reads as last read, served while the session is interrupted
+        self._last_good = ZookeeperCache(stale_size) if serve_stale else None
+        self._offline_writes = OfflineWriteQueue(max_offline_writes) \
+            if max_offline_writes else None
+        self._replay_lock = Lock()
+        self._snapshot = \
+            ZookeeperSnapshot(snapshot_file) if snapshot_file else None
+        # batch in progress, if any, for each thread
+        self._local = local()
+        self._stats = ZookeeperStats()
+        self._write_behind = None
+        if write_behind_interval:
+            self._write_behind = WriteBehindQueue(
+                self._flush_writes, write_behind_interval,
+                write_behind_max_pending)
         self._hooks = Hooks(ZookeeperProxy.hook_points)
 
+    @property
+    def cache(self):
+        return self._cache
+
+    def get_stats(self):
+        """ Provides latency, call, error and byte counts of operations
+
+        Returns:
+            dict: operation -> mapping id -> name -> statistics, see
+                ZookeeperStats
+        """
+        return self._stats.snapshot()
+
+    def reset_stats(self):
+        self._stats.reset()
+
+    @property
+    def coalesced_reads(self):
+        """ Number of reads served by joining an identical read in flight
+        """
+        return self._flights.coalesced
+
+    @contextmanager
+    def _measure(self, operation, node_path):
+        """ Accounts an operation in stats and runs operation_complete hook
+
+        Yields:
+            list: [bytes sent, bytes received], to be set by the operation
+        """
+        transferred = [0, 0]
+        error = None
+        start = time.perf_counter()
+        try:
+            yield transferred
+        except BaseException as e:
+            # cancellation of asynchronous operations included
+            error = e
+            raise
+        finally:
+            self._complete(operation, node_path, start, transferred[0],
+                           transferred[1], error)
+
+    def _complete(self, operation, node_path, start, bytes_sent,
+                  bytes_received, error=None):
+        duration = time.perf_counter() - start
+        mapping_id, name = ZookeeperStats.get_key(self._root_path, node_path)
+        self._stats.record(operation, mapping_id, name, duration, bytes_sent,
+                           bytes_received, error is not None)
+        self.hooks.run('operation_complete', operation, node_path, duration,
+                       bytes_sent, bytes_received, error)
+
     def listener(self, state):
         if state == KazooState.LOST:
             # Register somewhere that the session was lost
             self.logger.info("listener, KazooState.LOST")
+            self._connected = False
+            self._flush_cache()
         elif state == KazooState.SUSPENDED:
             # Handle being disconnected from Zookeeper
             self.logger.info("listener, KazooState.SUSPENDED")
+            self._connected = False
+            # watches can't be relied upon while disconnected
+            self._flush_cache()
         elif state == KazooState.CONNECTED:
             # Handle being connected/reconnected to Zookeeper
             self.logger.info("listener, KazooState.CONNECTED")
+            self._connected = True
+            self._start_replay()
         else:
             self.logger.info("listener, KazooState unknown")
 
         self.hooks.run('kazoo_state_change', state)
 
-    def connect(self, ip_address, port, root_path, logger):
+    def connect(self, ip_address, port, root_path, logger, hosts=None):
+        """ Connects to zookeeper
+
+        Args:
+            ip_address (str): zookeeper server address, used when hosts is
+                not specified
+            port (int): zookeeper server port
+            root_path (str): path configuration data is kept under
+            logger: logger to use
+            hosts (str): comma separated host:port list of ensemble members
+        """
         if not self._zk:
-            # establish zookeeper connection
-            self._zk = KazooClient(hosts='{0}:{1}'.format(
-                ip_address, port, logger=logger))
-            self._zk.start()
+            hosts = hosts or '{0}:{1}'.format(ip_address, port)
+            self._zk = create_client(hosts=hosts)
+            self._root_path = root_path
+            self.logger = logger
+            self._ready.clear()
+            self._start_error = None
+            if self._background_connect:
+                self._starter = Thread(target=self._start_in_background,
+                                       args=(hosts,),
+                                       name="ZookeeperConnect", daemon=True)
+                self._starter.start()
+            else:
+                self._start(hosts)
+            # make sure finalize is called when stopping nio
+            atexit.register(self.disconnect)
+
+    def _start(self, hosts):
+        """ Establishes sessions and prepares root path
+        """
+        try:
+            self._zk.start(timeout=self._start_timeout)
+            self._connected = True
             self._zk.add_listener(self.listener)
+            self._start_read_sessions(hosts)
 
             # Ensure a path, create if necessary
-            self._root_path = root_path
             self._zk.ensure_path(self._root_path)
 
-            self.logger = logger
-            # make sure finalize is called when stopping nio
-            atexit.register(self.disconnect)
+            if self._snapshot is not None:
+                self._load_snapshot()
+            if self._write_behind is not None:
+                self._write_behind.start()
+        finally:
+            self._ready.set()
+
+    def _start_in_background(self, hosts):
+        try:
+            self._start(hosts)
+            self.logger.info("Connected in background")
+        except Exception as e:
+            self._start_error = e
+            self.logger.exception("Failed to connect in background")
+
+    def wait_ready(self):
+        """ Waits for sessions being established in background, if any
+
+        Raises:
+            Exception: error establishing sessions failed with, e.g.,
+                KazooTimeoutError when not established within start_timeout
+        """
+        self._ready.wait()
+        if self._start_error is not None:
+            raise self._start_error
 
     def disconnect(self):
         self.logger.info("Disconnecting")
+        if self._starter is not None:
+            self._starter.join()
+            self._starter = None
         if self._zk:
+            if self._write_behind is not None and self._start_error is None:
+                # send saves still queued
+                self._write_behind.stop()
+            if self._offline_writes is not None and \
+                    len(self._offline_writes):
+                self.logger.warning(
+                    "{} queued writes not sent".format(
+                        len(self._offline_writes)))
+            self.save_snapshot()
+            for session in self._read_sessions:
+                session.stop()
+            self._read_sessions = []
             self._zk.stop()
             self._zk = None
 
-    def get_children(self, node_path):
+    def _start_read_sessions(self, hosts):
+        """ Starts sessions reads are spread across, if any
+
+        Each session is given the host list rotated by one more position so
+        that sessions connect to different ensemble members first
+        """
+        members = [host.strip() for host in hosts.split(",") if host.strip()]
+        for index in range(self._read_session_count):
+            offset = (index + 1) % len(members)
+            session = create_client(
+                hosts=",".join(members[offset:] + members[:offset]),
+                randomize_hosts=False)
+            session.start(timeout=self._start_timeout)
+            session.add_listener(self._read_session_listener)
+            self._read_sessions.append(session)
+
+    def _read_session_listener(self, state):
+        if state in (KazooState.LOST, KazooState.SUSPENDED):
+            self.logger.info("read session listener, {}".format(state))
+            # watches set through the session can't be relied upon
+            self._flush_cache()
+
+    def _get_reader(self, node_path):
+        """ Provides session to read node_path with
+
+        Sessions are picked round robin, the primary session is used when
+        there are no read sessions. When sync_reads is enabled a sync is
+        issued first, requests of a session are processed in order so the
+        read that follows observes it without waiting for it
+
+        Returns:
+            KazooClient: session to read with
+        """
+        if self._read_sessions:
+            reader = self._read_sessions[
+                next(self._read_counter) % len(self._read_sessions)]
+        else:
+            reader = self._zk
+        if self._sync_reads:
+            reader.sync_async(node_path)
+        return reader
+
+    def _load_snapshot(self):
+        loaded = self._snapshot.load()
+        if loaded:
+            current, stale = self._snapshot.validate(self._zk,
+                                                     DEFAULT_MAX_IN_FLIGHT)
+            self.logger.info(
+                "Snapshot loaded, {} entries current, {} stale".format(
+                    current, stale))
+
+    def save_snapshot(self):
+        """ Writes nodes read so far to snapshot file, when enabled
+        """
+        if self._snapshot is None:
+            return
         try:
-            children = self._zk.get_children(node_path)
-            return children
-        except NoNodeError:
-            pass  # pragma: no cover
+            saved = self._snapshot.save()
+            self.logger.info("Snapshot saved, {} entries".format(saved))
+        except OSError:
+            self.logger.exception("Failed to save snapshot")
+
+    def get_children(self, node_path):
+        self.wait_ready()
+        with self._measure("get_children", node_path) as transferred:
+            try:
+                children = self._get_children(node_path)
+                transferred[1] = sum(len(child) for child in children)
+                return children
+            except NoNodeError:
+                pass  # pragma: no cover
 
         return None
 
     def fetch(self, node_path):
+        self.wait_ready()
+        with self._measure("fetch", node_path) as transferred:
+            try:
+                data, stat = self._get(node_path)
+                transferred[1] = len(data or b"")
+                data = self._decode_read(data, stat)
+            except NoNodeError:
+                data = {}  # pragma: no cover
+        return data
+
+    def _get(self, node_path):
+        """ Reads node data and stat, through the snapshot and cache when
+        enabled
+        """
+        found, result = self._take_queued_data(node_path)
+        if found:
+            return result
+
+        found, result = self._take_snapshot_data(node_path)
+        if found:
+            return result
+
+        found, result = self._take_stale_data(node_path)
+        if found:
+            return result
+
+        if self._cache is None:
+            return self._flights.do(
+                ("get", node_path), lambda: self._retry(self._read, node_path))
+
+        found, result = self._cache.get(DATA, node_path)
+        if not found:
+            # generation the read was issued at, shared with joiners
+            result, generation = self._flights.do(
+                ("get", node_path),
+                lambda _: self._retry(self._read, node_path,
+                                      watch=self._data_watcher),
+                self._get_generation)
+            self._cache.put(DATA, node_path, result, generation)
+        return result
+
+    def _read(self, node_path, watch=None):
+        reader = self._get_reader(node_path)
+        data, stat = self._resolve_chunks(
+            node_path, *reader.get(node_path, watch=watch), reader=reader)
+        self._on_read(node_path, data, stat)
+        return data, stat
+
+    def _on_read(self, node_path, data, stat):
+        """ Keeps track of node data read from zookeeper
+        """
+        self._record_version(node_path, self._get_stat_version(stat), data)
+        if self._snapshot is not None:
+            self._snapshot.record_data(node_path, data, stat)
+        if self._last_good is not None:
+            self._last_good.put(DATA, node_path, (data, stat),
+                                self._last_good.generation)
+
+    def _take_queued_data(self, node_path):
+        """ Serves node data saved but not sent yet, when write-behind is
+        enabled
+
+        Returns:
+            tuple: (found, (data, stat))
+        """
+        found = False
+        if self._offline_writes is not None:
+            found, data = self._offline_writes.get(node_path)
+        if not found and self._write_behind is not None:
+            found, data = self._write_behind.get(node_path)
+        return found, (data, None) if found else None
+
+    def _take_stale_data(self, node_path):
+        """ Serves node data as last read while the session is interrupted,
+        when enabled
+
+        Returns:
+            tuple: (found, (data, STALE))
+        """
+        if self._last_good is None or self._connected:
+            return False, None
+        found, result = self._last_good.get(DATA, node_path)
+        return found, (result[0], STALE) if found else None
+
+    def _decode_read(self, data, stat):
+        """ Deserializes node data read, flagging it when served stale
+        """
+        data = self._process_for_deserialization(data)
+        if stat is STALE and isinstance(data, dict):
+            data = StaleData(data)
+        return data
+
+    def _retry(self, func, *args, **kwargs):
+        """ Calls func through the retry policy, when enabled
+        """
+        if self._retry_policy is None:
+            return func(*args, **kwargs)
+        return self._retry_policy.copy()(func, *args, **kwargs)
+
+    def _take_snapshot_data(self, node_path):
+        """ Serves node data from snapshot, when loaded and still current
+
+        Returns:
+            tuple: (found, (data, stat))
+        """
+        if self._snapshot is None:
+            return False, None
+        found, result = self._snapshot.take_data(node_path)
+        if found:
+            data, stat = result
+            self._record_version(node_path, self._get_stat_version(stat),
+                                 data)
+        return found, result
+
+    def _get_stat_version(self, stat):
+        return stat.version if self._versions is not None else None
+
+    def _resolve_chunks(self, node_path, data, stat, reader=None):
+        """ Replaces a chunk manifest with the payload it references
+
+        Chunks are read through the session the manifest was read with, so
+        that they are at least as recent as the manifest
+
+        Returns:
+            tuple: (data, stat)
+        """
+        reader = reader or self._zk
+        attempts = 1
+        while ChunkManifest.is_manifest(data):
+            manifest = ChunkManifest.decode(data)
+            try:
+                return self._read_chunks(node_path, manifest, reader), stat
+            except ChunkMismatchError:
+                if attempts >= CHUNK_READ_ATTEMPTS:
+                    raise
+                attempts += 1
+                # chunks were replaced while being read, start over
+                data, stat = reader.get(node_path)
+        return data, stat
+
+    def _read_chunks(self, node_path, manifest, reader):
+        chunk_set_path = self._get_chunk_path(node_path, manifest.write_id)
+        requests = [reader.get_async("{0}/{1}".format(
+            chunk_set_path, ChunkManifest.chunk_name(index)))
+            for index in range(manifest.chunks)]
         try:
-            data, stat = self._zk.get(node_path)
-            if data:
-                data = json.loads(data.decode())
+            chunks = [request.get()[0] for request in requests]
         except NoNodeError:
-            data = {}  # pragma: no cover
-        return data
+            raise ChunkMismatchError(
+                "Chunks missing for manifest {}".format(manifest.write_id))
+        return manifest.join(chunks)
+
+    def _write_chunks(self, node_path, payload):
+        """ Stores payload as chunks
+
+        Chunks go under a directory unique to this write, the returned
+        manifest is what gets written to node_path, switching readers to the
+        new chunks at once.
+
+        Returns:
+            tuple: (manifest data, callable removing chunks just written)
+        """
+        manifest, chunks = ChunkManifest.create(payload, self._max_node_bytes)
+        chunk_set_path = self._get_chunk_path(node_path, manifest.write_id)
+        self._zk.ensure_path(chunk_set_path)
+        requests = [self._zk.create_async("{0}/{1}".format(
+            chunk_set_path, ChunkManifest.chunk_name(index)), chunk)
+            for index, chunk in enumerate(chunks)]
+        for request in requests:
+            request.get()
+
+        def rollback():
+            self._delete_chunks(node_path, manifest.write_id)
+        return manifest.encode(), rollback
+
+    def _delete_replaced_chunks(self, node_path, listed, write_id=None):
+        """ Removes chunks of writes to node_path replaced by a write
+
+        Chunks of the write node_path references once written are kept,
+        whether the write's or a later one's
+
+        Args:
+            listed: result of listing chunks of node_path before writing it
+            write_id (str): id of the chunks written, if any
+        """
+        try:
+            replaced = {child for child in listed.get()
+                        if ChunkManifest.is_write_id(child)}
+        except NoNodeError:
+            return
+        replaced.discard(write_id)
+        if not replaced:
+            return
+        data_request = self._zk.get_async(node_path)
+        children_request = self._zk.get_children_async(node_path)
+        try:
+            data, _ = data_request.get()
+            # chunks of children are kept under their names
+            replaced.difference_update(children_request.get())
+        except NoNodeError:
+            # removed along with its chunks
+            return
+        if ChunkManifest.is_manifest(data):
+            replaced.discard(ChunkManifest.decode(data).write_id)
+        for replaced_id in replaced:
+            self._delete_chunks(node_path, replaced_id)
+
+    def _delete_chunks(self, node_path, write_id=None):
+        """ Removes chunks of a single write or all chunks under node_path
+        """
+        self._delete_tree(self._get_chunk_path(node_path, write_id))
+
+    def _get_chunk_path(self, node_path, write_id=None):
+        root_path = self._root_path.rstrip("/")
+        if node_path.startswith(root_path + "/"):
+            node_path = node_path[len(root_path):]
+        chunk_path = "{0}/{1}{2}".format(root_path, CHUNKS_NODE, node_path)
+        if write_id:
+            chunk_path = "{0}/{1}".format(chunk_path, write_id)
+        return chunk_path
+
+    def _get_children(self, node_path):
+        """ Reads node children, through the snapshot and cache when enabled
+        """
+        found, children = self._take_children(node_path)
+        if found:
+            return children
+        children, generation = self._flights.do(
+            ("get_children", node_path),
+            lambda _: self._retry(self._list_children, node_path,
+                                  watch=self._get_watch(
+                                      self._children_watcher)),
+            self._get_generation)
+        self._store_children(node_path, children, generation)
+        return list(children)
+
+    def get_children_many(self, node_paths,
+                          max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        """ Lists children of several nodes concurrently
+
+        Issues asynchronous reads keeping at most max_in_flight requests
+        outstanding, see fetch_many
+
+        Yields:
+            tuple: (node_path, children), children being None when the
+                node does not exist
+        """
+        self.wait_ready()
+
+        def issue(node_path):
+            start = time.perf_counter()
+            found, children = self._take_children(node_path)
+            generation = None
+            if not found:
+                children, generation = self._list_children_async(
+                    node_path, watch=self._get_watch(self._children_watcher))
+            return start, found, children, generation
+
+        for node_path, (start, found, result, generation) in self._pipeline(
+                node_paths, issue, max_in_flight):
+            children = None
+            try:
+                if found:
+                    children = result
+                else:
+                    children = self._on_children(node_path, result.get())
+                    self._store_children(node_path, children, generation)
+                    children = list(children)
+            except NoNodeError:
+                pass
+            except Exception as e:
+                self._complete("get_children", node_path, start, 0, 0, e)
+                raise
+            self._complete("get_children", node_path, start, 0,
+                           sum(len(child) for child in children or []))
+            yield node_path, children
+
+    def _take_children(self, node_path):
+        """ Serves node children from snapshot or cache when possible
+
+        Returns:
+            tuple: (found, children)
+        """
+        if self._snapshot is not None:
+            found, children = self._snapshot.take_children(node_path)
+            if found:
+                return True, children
+
+        if self._last_good is not None and not self._connected:
+            found, children = self._last_good.get(CHILDREN, node_path)
+            if found:
+                return True, StaleChildren(children)
+
+        if self._cache is None:
+            return False, None
+        found, children = self._cache.get(CHILDREN, node_path)
+        if found:
+            return True, list(children)
+        return False, None
+
+    def _get_generation(self):
+        """ Provides cache generation to store data about to be read with
+        """
+        if self._cache is not None:
+            return self._cache.generation
+
+    def _store_children(self, node_path, children, generation):
+        if generation is not None:
+            self._cache.put(CHILDREN, node_path, children, generation)
+        if self._last_good is not None:
+            self._last_good.put(CHILDREN, node_path, children,
+                                self._last_good.generation)
+
+    def _get_watch(self, watcher):
+        """ Provides watcher to read with, only needed by the cache
+        """
+        return watcher if self._cache is not None else None
+
+    def _list_children(self, node_path, watch=None):
+        reader = self._get_reader(node_path)
+        if self._snapshot is None:
+            return reader.get_children(node_path, watch=watch)
+        return self._on_children(node_path, reader.get_children(
+            node_path, watch=watch, include_data=True))
+
+    def _list_children_async(self, node_path, watch=None):
+        """ Issues an asynchronous children read, see _on_children
+
+        Returns:
+            tuple: (async result, cache generation the read was issued at)
+        """
+        return self._flights.share(
+            ("get_children", node_path),
+            lambda _: self._get_reader(node_path).get_children_async(
+                node_path, watch=watch,
+                include_data=self._snapshot is not None),
+            self._get_generation)
+
+    def _on_children(self, node_path, result):
+        """ Keeps track of node children read from zookeeper
+
+        Args:
+            result: children, or (children, stat) when read including data
+
+        Returns:
+            list: children
+        """
+        if self._snapshot is None:
+            return result
+        children, stat = result
+        self._snapshot.record_children(node_path, children, stat)
+        return children
+
+    def _data_watcher(self, event):
+        if self._cache is not None:
+            self._cache.invalidate(DATA, event.path)
+            if event.type == EventType.DELETED:
+                self._cache.invalidate(CHILDREN, event.path)
+
+    def _children_watcher(self, event):
+        if self._cache is not None:
+            self._cache.invalidate(CHILDREN, event.path)
+            if event.type == EventType.DELETED:
+                self._cache.invalidate(DATA, event.path)
+
+    def _flush_cache(self):
+        if self._cache is not None:
+            self._cache.clear()
+
+    def _invalidate(self, node_path, tree=False):
+        """ Drops cache and snapshot entries affected by a local write
+
+        Watches would invalidate cache entries eventually, doing it right
+        away makes the write visible to reads issued from this process.
+        Reads in flight are not joined anymore for the same reason
+        """
+        self._flights.discard(node_path, tree)
+        self._flights.discard(node_path.rsplit("/", 1)[0])
+        if self._last_good is not None:
+            if tree:
+                self._last_good.invalidate_tree(node_path)
+            else:
+                self._last_good.invalidate(DATA, node_path)
+        if self._snapshot is not None:
+            self._snapshot.discard(node_path, tree)
+            self._snapshot.discard(node_path.rsplit("/", 1)[0])
+        if self._cache is None:
+            return
+        if tree:
+            self._cache.invalidate_tree(node_path)
+        else:
+            self._cache.invalidate(DATA, node_path)
+        self._cache.invalidate(CHILDREN, node_path.rsplit("/", 1)[0])
+
+    def fetch_many(self, node_paths, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        """ Fetches several nodes concurrently
+
+        Issues asynchronous gets keeping at most max_in_flight requests
+        outstanding, results are yielded in node_paths order as they
+        arrive. A node that does not exist is yielded as {}, same as fetch
+
+        Args:
+            node_paths (iterable): paths to fetch
+            max_in_flight (int): maximum number of outstanding requests
+
+        Yields:
+            tuple: (node_path, data)
+        """
+        self.wait_ready()
+        max_in_flight = max(1, max_in_flight)
+        pending = deque()
+        for node_path in node_paths:
+            if len(pending) >= max_in_flight:
+                yield self._fetch_result(*pending.popleft())
+            pending.append((node_path, time.perf_counter()) +
+                           self._get_async(node_path))
+        while pending:
+            yield self._fetch_result(*pending.popleft())
+
+    def _get_async(self, node_path):
+        """ Issues an asynchronous read unless it can be served from cache
+
+        Returns:
+            tuple: (async result or cached (data, stat), cache generation,
+                session read with)
+        """
+        found, result = self._take_queued_data(node_path)
+        if found:
+            return result, None, None
+
+        found, result = self._take_snapshot_data(node_path)
+        if found:
+            return result, None, None
+
+        found, result = self._take_stale_data(node_path)
+        if found:
+            return result, None, None
+
+        watch = None
+        if self._cache is not None:
+            found, result = self._cache.get(DATA, node_path)
+            if found:
+                return result, None, None
+            watch = self._data_watcher
+        # generation and session the read was issued with, shared with
+        # joiners
+        async_result, (generation, reader) = self._flights.share(
+            ("get", node_path),
+            lambda captured: captured[1].get_async(node_path, watch=watch),
+            lambda: (self._get_generation(), self._get_reader(node_path)))
+        return async_result, generation, reader
+
+    def _fetch_result(self, node_path, start, async_result, generation,
+                      reader):
+        received = 0
+        try:
+            if isinstance(async_result, tuple):
+                # served from cache
+                data, stat = async_result
+            else:
+                try:
+                    data, stat = self._resolve_chunks(
+                        node_path, *async_result.get(), reader=reader)
+                except CONNECTION_ERRORS:
+                    if self._retry_policy is None:
+                        raise
+                    data, stat = self.read(node_path)
+                self._store_read(node_path, data, stat, generation)
+            received = len(data or b"")
+            data = self._decode_read(data, stat)
+        except NoNodeError:
+            data = {}
+        except Exception as e:
+            self._complete("fetch", node_path, start, 0, received, e)
+            raise
+        self._complete("fetch", node_path, start, 0, received)
+        return node_path, data
+
+    def _store_read(self, node_path, data, stat, generation):
+        """ Keeps track of node data read asynchronously
+        """
+        self._on_read(node_path, data, stat)
+        if generation is not None:
+            self._cache.put(DATA, node_path, (data, stat), generation)
+
+    @contextmanager
+    def batch(self):
+        """ Collects writes issued by current thread into transactions
+
+        register, save and remove calls made within the context are
+        deferred and sent when the context exits, as multi-op transactions
+        split into chunks that fit zookeeper's request size limit. Nothing
+        is sent if the context exits with an exception, chunks stored for
+        writes not committed are removed. Nested calls join the batch
+        already in progress.
+
+        Yields:
+            ZookeeperBatch: batch collecting operations
+        """
+        current = self._get_batch()
+        if current is not None:
+            yield current
+            return
+
+        batch = ZookeeperBatch(self._zk, self._max_batch_bytes)
+        self._local.batch = batch
+        try:
+            yield batch
+        except BaseException:
+            batch.rollback()
+            raise
+        finally:
+            self._local.batch = None
+        # commit clears operations
+        paths = batch.paths
+        try:
+            batch.commit()
+        finally:
+            for kind, node_path in paths:
+                self._invalidate(node_path, tree=kind == REMOVE)
+
+    def _get_batch(self):
+        return getattr(self._local, "batch", None)
+
+    def after_commit(self, callback):
+        """ Invokes callback once writes issued so far by current thread
+        are applied, when its batch is committed within a batch, right away
+        otherwise
+        """
+        batch = self._get_batch()
+        if batch is None:
+            callback()
+        else:
+            batch.add_callback(callback)
 
     def register(self, node_path, config):
+        self.wait_ready()
+        with self._measure("register", node_path) as transferred:
+            transferred[0] = self._write(node_path, config, create=True)
+
+    def save(self, node_path, config, version=None):
+        """ Saves config to an existing node
+
+        Args:
+            node_path (str): path to node
+            config (dict): data to save
+            version (int): when specified, data is saved only if the node
+                version still matches it
+
+        Raises:
+            BadVersionError: node was modified since version
+        """
+        with self._measure("save", node_path) as transferred:
+            if self._write_behind is not None and version is None and \
+                    self._get_batch() is None:
+                # serialized right away, later changes to config are not
+                # part of this save
+                self._write_behind.put(
+                    node_path, self._process_for_serialization(config))
+                return
+            self.wait_ready()
+            transferred[0] = self._write(node_path, config, version=version)
+
+    def flush(self):
+        """ Sends saves queued by write-behind, waiting until sent
+
+        Returns:
+            int: number of nodes written
+        """
+        self.wait_ready()
+        if self._write_behind is None:
+            return 0
+        return self._write_behind.flush()
+
+    def _flush_writes(self, writes):
+        """ Sends saves queued by write-behind as a batch
+
+        Writes are sent one by one when the batch fails, so that a node
+        that can't be written does not prevent writing the others
+        """
+        try:
+            with self.batch():
+                for node_path, serialized_config in writes:
+                    self._write_serialized(node_path, serialized_config)
+            return
+        except Exception:
+            self.logger.warning("Failed to send queued saves as a batch, "
+                                "sending them one by one")
+        for node_path, serialized_config in writes:
+            try:
+                self._write_serialized(node_path, serialized_config)
+            except Exception:
+                self.logger.exception(
+                    "Failed to send queued save to {}".format(node_path))
+
+    def _write(self, node_path, config, create=False, version=None):
+        """ Writes config to node_path
+
+        Args:
+            node_path (str): path to node
+            config (dict): data to write
+            create (bool): create node when it does not exist
+            version (int): expected node version, if any
+
+        Returns:
+            int: number of bytes written, 0 when write was elided or queued
+                while the session is interrupted
+        """
         serialized_config = self._process_for_serialization(config)
+        self._discard_queued(node_path)
+        offline = self._offline_writes is not None and version is None and \
+            self._get_batch() is None
+        if offline and (not self._connected or len(self._offline_writes)):
+            # queued writes are sent first, in order
+            if self._offline_writes.put(node_path, serialized_config, create):
+                self._invalidate(node_path)
+                self._start_replay()
+                return 0
+        try:
+            return self._write_serialized(node_path, serialized_config,
+                                          create, version)
+        except CONNECTION_ERRORS:
+            if not offline or not self._offline_writes.put(
+                    node_path, serialized_config, create):
+                raise
+            self.logger.warning(
+                "Connection lost writing {}, write queued".format(node_path))
+            return 0
+
+    def _discard_queued(self, node_path, tree=False):
+        """ Drops saves queued by write-behind for node_path, superseded by
+        a write or removal sent right away
+        """
+        if self._write_behind is not None:
+            self._write_behind.discard(node_path, tree)
+
+    def _start_replay(self):
+        """ Sends queued offline writes from a thread when connected
+        """
+        if self._offline_writes is None or not self._connected or \
+                not len(self._offline_writes):
+            return
+        # listener must not block kazoo's event thread
+        Thread(target=self._replay_writes, name="ZookeeperReplay",
+               daemon=True).start()
+
+    def _replay_writes(self):
+        """ Sends writes queued while the session was interrupted, in order
+
+        Stops when the connection is lost again, remaining writes are sent
+        on next reconnection. Writes failing otherwise are dropped
+        """
+        if not self._replay_lock.acquire(blocking=False):
+            # already replaying
+            return
         try:
-            self._zk.create(node_path, serialized_config)
-        except NodeExistsError:
-            self._zk.set(node_path, serialized_config)
+            while self._connected:
+                write = self._offline_writes.first()
+                if write is None:
+                    return
+                node_path, serialized_config, create = write
+                try:
+                    self._write_serialized(node_path, serialized_config,
+                                           create)
+                except CONNECTION_ERRORS:
+                    self.logger.warning(
+                        "Connection lost replaying queued writes, {} "
+                        "left".format(len(self._offline_writes)))
+                    return
+                except Exception:
+                    self.logger.exception(
+                        "Failed to replay queued write to {}".format(
+                            node_path))
+                self._offline_writes.done(node_path, serialized_config)
+        finally:
+            self._replay_lock.release()
+
+    def _write_serialized(self, node_path, serialized_config, create=False,
+                          version=None):
+        """ Writes serialized config to node_path, see _write
+        """
+        batch = self._get_batch()
+        if batch is None and \
+                self._is_unchanged(node_path, serialized_config, version):
+            self.elided_writes += 1
+            return 0
+
+        data, cleanup, rollback = \
+            self._prepare_write(node_path, serialized_config)
+        if batch is not None:
+            if create:
+                batch.register(node_path, data)
+            else:
+                batch.save(node_path, data, version)
+            batch.add_callback(cleanup)
+            batch.add_rollback(node_path, rollback)
+            # known again once committed, from the transaction results
+            self._forget_versions(node_path)
+            batch.add_callback(lambda: self._record_version(
+                node_path, batch.get_version(node_path), serialized_config))
+            return len(serialized_config)
+        try:
+            new_version = self._retry(self._send_write, node_path, data,
+                                      create, version, count())
+        except Exception:
+            if rollback:
+                rollback()
+            raise
+        finally:
+            self._invalidate(node_path)
+        self._record_version(node_path, new_version, serialized_config)
+        cleanup()
+        return len(serialized_config)
+
+    def _send_write(self, node_path, data, create, version, attempts=None):
+        """ Sends a write to zookeeper
+
+        Args:
+            attempts (iterator): counts attempts of a write retried, see
+                _check_applied
+
+        Returns:
+            int: node version after write, None if unknown
+        """
+        retried = attempts is not None and next(attempts) > 0
+        if create:
+            try:
+                self._zk.create(node_path, data)
+                return 0
+            except NodeExistsError:
+                pass
+        try:
+            stat = self._zk.set(node_path, data,
+                                version=-1 if version is None else version)
+        except BadVersionError:
+            if not retried or version is None:
+                raise
+            stat = self._check_applied(node_path, data, version)
+        return stat.version if self._versions is not None else None
+
+    def _check_applied(self, node_path, data, version):
+        """ Finds out if a versioned write whose response was lost was
+        applied, a retry of it failing with BadVersionError
+
+        Returns:
+            ZnodeStat: stat of node as written
+
+        Raises:
+            BadVersionError: node was modified by someone else
+        """
+        current, stat = self._zk.get(node_path)
+        if current != data or stat.version != version + 1:
+            raise BadVersionError()
+        return stat
+
+    def _is_unchanged(self, node_path, serialized_config, version):
+        """ Finds out if writing data to node_path would change nothing
+
+        Node has to be known to hold the same data, which is confirmed by
+        checking that its version did not change since it was last read or
+        written
+        """
+        if not self._write_elision:
+            return False
+        known = self._versions.get(node_path)
+        if known is None or known[1] != self._digest(serialized_config):
+            return False
+        stat = self._zk.exists(node_path)
+        return stat is not None and stat.version == known[0] and \
+            version in (None, stat.version)
+
+    def get_version(self, node_path):
+        """ Provides version of node as last read or written
+
+        Versions are tracked when write elision or version tracking are
+        enabled
+
+        Returns:
+            int: version, None if unknown
+        """
+        if self._versions is None:
+            return None
+        known = self._versions.get(node_path)
+        return known[0] if known else None
+
+    def get_read_digest(self, node_path):
+        """ Provides digest of node data as last read or written
+
+        Digests are tracked along with versions, they match get_digest of
+        the data read as long as it was written with the same serializer and
+        compression
 
-    def save(self, node_path, config):
-        self._zk.set(node_path, self._process_for_serialization(config))
+        Returns:
+            bytes: sha256 digest, None if unknown
+        """
+        if self._versions is None:
+            return None
+        known = self._versions.get(node_path)
+        return known[1] if known else None
 
-    def remove(self, node_path):
-        self._zk.delete(node_path, recursive=True)
+    def _record_version(self, node_path, version, data):
+        if self._versions is not None and version is not None:
+            self._versions[node_path] = (version, self._get_data_digest(data))
+
+    def _get_data_digest(self, data):
+        """ Provides digest of the payload data holds, the one a reference
+        embeds for deduplicated data, so that it matches get_digest
+        """
+        if is_reference(data):
+            return bytes.fromhex(decode_reference(data))
+        return self._digest(data)
+
+    def _forget_versions(self, node_path, tree=False):
+        if self._versions is None:
+            return
+        self._versions.pop(node_path, None)
+        if tree:
+            prefix = node_path + "/"
+            # listed at once, other threads may be adding versions
+            for path in list(self._versions):
+                if path.startswith(prefix):
+                    self._versions.pop(path, None)
+
+    def get_digest(self, config):
+        """ Provides digest of config as it would be written
+
+        Returns:
+            bytes: sha256 digest
+        """
+        return self._digest(self._process_for_serialization(config))
+
+    @staticmethod
+    def _digest(data):
+        return sha256(data).digest()
+
+    def remove(self, node_path, progress=None):
+        """ Removes node and its descendants
+
+        Args:
+            node_path (str): path to node
+            progress (callable): invoked with the number of nodes deleted
+                so far and the number of nodes found, as nodes are deleted.
+                Not invoked within a batch
+        """
+        self.wait_ready()
+        with self._measure("remove", node_path):
+            self._remove(node_path, progress)
+
+    def _remove(self, node_path, progress):
+        batch = self._get_batch()
+        self.forget_removed(node_path)
+        self._discard_queued(node_path, tree=True)
+        if batch is not None:
+            batch.remove(node_path)
+            batch.remove(self._get_chunk_path(node_path))
+            return
+        try:
+            self._retry(self._delete_tree, node_path, progress)
+        finally:
+            self._invalidate(node_path, tree=True)
+        self._delete_chunks(node_path)
+
+    def _delete_tree(self, node_path, progress=None, counts=None,
+                     attempt=1):
+        """ Deletes node_path and its descendants
+
+        The subtree is listed level by level and deleted deepest level
+        first, the requests of each level are pipelined. Nodes deleted by
+        others meanwhile are skipped, a node that can't be deleted because
+        children were created under it meanwhile has its subtree listed and
+        deleted again, up to REMOVE_ATTEMPTS times
+
+        Args:
+            node_path (str): path to node
+            progress (callable): see remove
+            counts (list): [nodes deleted, nodes found] so far
+
+        Raises:
+            NotEmptyError: nodes kept being created under node_path
+        """
+        counts = counts or [0, 0]
+        levels = self._list_levels(node_path)
+        counts[1] += sum(len(level) for level in levels)
+        for level in reversed(levels):
+            for path, request in self._pipeline(level, self._zk.delete_async):
+                try:
+                    request.get()
+                except NoNodeError:
+                    pass
+                except NotEmptyError:
+                    if attempt >= REMOVE_ATTEMPTS:
+                        raise
+                    # found again when listing its subtree
+                    counts[1] -= 1
+                    self._delete_tree(path, progress, counts, attempt + 1)
+                    continue
+                counts[0] += 1
+                if progress:
+                    progress(*counts)
+
+    def _list_levels(self, node_path):
+        """ Lists a subtree through pipelined requests
+
+        Returns:
+            list: lists of paths, one per level, node_path's level first
+        """
+        levels = []
+        level = [node_path]
+        while level:
+            levels.append(level)
+            next_level = []
+            for path, request in self._pipeline(
+                    level, self._zk.get_children_async):
+                try:
+                    next_level.extend("{0}/{1}".format(path, child)
+                                      for child in request.get())
+                except NoNodeError:
+                    pass
+            level = next_level
+        return levels
 
     @staticmethod
-    def _process_for_serialization(config):
+    def _pipeline(node_paths, issue, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        """ Issues a request per path keeping at most max_in_flight
+        outstanding
+
+        Yields:
+            tuple: (node_path, async result), in node_paths order
+        """
+        pending = deque()
+        for node_path in node_paths:
+            if len(pending) >= max_in_flight:
+                yield pending.popleft()
+            pending.append((node_path, issue(node_path)))
+        while pending:
+            yield pending.popleft()
+
+    def _prepare_write(self, node_path, serialized_config):
+        """ Stores serialized config as a shared payload when deduplicating,
+        or as chunks when too large for a node
+
+        Chunks of node_path stored before the write are removed once
+        written, whatever is written in their place
+
+        Returns:
+            tuple: (data to write to node_path, callable to invoke once
+                written, callable to invoke if write fails or None)
+        """
+        # listed through the primary session, ahead of the write, missing
+        # unless node_path was ever chunked
+        listed = self._zk.get_children_async(self._get_chunk_path(node_path))
+        write_id = None
+        if self._is_deduplicated(node_path, serialized_config):
+            data, rollback = self._write_blob(serialized_config), None
+        else:
+            data, rollback = self._store(node_path, serialized_config)
+            if ChunkManifest.is_manifest(data):
+                write_id = ChunkManifest.decode(data).write_id
+
+        def cleanup():
+            self._delete_replaced_chunks(node_path, listed, write_id)
+        return data, cleanup, rollback
+
+    def _store(self, node_path, payload):
+        """ Stores payload as chunks when too large for a node
+
+        Returns:
+            tuple: (data to write to node_path, callable to invoke if write
+                fails or None)
+        """
+        if len(payload) > self._max_node_bytes:
+            return self._write_chunks(node_path, payload)
+        return payload, None
+
+    def _is_deduplicated(self, node_path, serialized_config):
+        return self._dedup and \
+            len(serialized_config) >= self._dedup_threshold and \
+            not node_path.startswith(self._get_blob_path(""))
+
+    def _write_blob(self, payload):
+        """ Stores payload under its digest unless stored already
+
+        Payload data is never modified, nodes holding the same data share
+        one. A payload is touched when last modified more than half of
+        blob_min_age ago, so that collect_blobs doesn't remove it while the
+        reference is written
+
+        Returns:
+            bytes: reference to write in place of payload
+        """
+        digest = sha256(payload).hexdigest()
+        modified = self._known_blobs.get(digest)
+        if modified is None or \
+                time.time() - modified >= self._blob_min_age / 2:
+            self._known_blobs[digest] = self._keep_blob(digest, payload)
+        return encode_reference(digest)
+
+    def _keep_blob(self, digest, payload):
+        """ Stores payload unless stored already, touching it when old
+
+        Returns:
+            float: time payload was last modified
+        """
+        blob_path = self._get_blob_path(digest)
+        stat = self._zk.exists(blob_path)
+        if stat is not None:
+            modified = stat.mtime / 1000.0
+            if time.time() - modified < self._blob_min_age / 2:
+                return modified
+            try:
+                data, stat = self._zk.get(blob_path)
+                self._zk.set(blob_path, data, version=stat.version)
+            except BadVersionError:
+                # touched meanwhile by another writer
+                pass
+            except NoNodeError:
+                # collected meanwhile
+                stat = None
+        if stat is None:
+            data, rollback = self._store(blob_path, payload)
+            try:
+                self._zk.create(blob_path, data, makepath=True)
+            except NodeExistsError:
+                # stored meanwhile by another writer
+                if rollback:
+                    rollback()
+        return time.time()
+
+    def collect_blobs(self, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+        """ Removes payloads no node references
+
+        Payloads modified within blob_min_age are kept, so is a payload
+        touched by a writer referencing it while references are listed.
+        Payloads are stored again when referenced after being removed
+
+        Args:
+            max_in_flight (int): maximum number of outstanding requests
+
+        Returns:
+            int: number of payloads removed
+        """
+        self.wait_ready()
+        blobs_path = self._get_blob_path("").rstrip("/")
+        try:
+            digests = self._zk.get_children(blobs_path)
+        except NoNodeError:
+            return 0
+        # stats are taken before references are listed, a payload touched
+        # after that fails to be deleted
+        now = time.time()
+        stats = {}
+        for digest, request in self._pipeline(
+                digests, lambda digest: self._zk.exists_async(
+                    self._get_blob_path(digest)), max_in_flight):
+            stat = request.get()
+            if stat is not None and \
+                    now - stat.mtime / 1000.0 >= self._blob_min_age:
+                stats[digest] = stat
+        if stats:
+            for digest in self._list_references(max_in_flight):
+                stats.pop(digest, None)
+
+        removed = 0
+        for digest, stat in stats.items():
+            blob_path = self._get_blob_path(digest)
+            try:
+                self._zk.delete(blob_path, version=stat.version)
+            except (BadVersionError, NoNodeError, NotEmptyError):
+                continue
+            self._known_blobs.pop(digest, None)
+            self._delete_chunks(blob_path)
+            removed += 1
+        return removed
+
+    def _list_references(self, max_in_flight):
+        """ Reads every node under root path but chunks and payloads
+
+        Yields:
+            str: digest of each payload referenced
+        """
+        root_path = self._root_path.rstrip("/")
+        level = [root_path]
+        while level:
+            next_level = []
+            for node_path, (data_request, children_request) in \
+                    self._pipeline(level, lambda node_path: (
+                        self._zk.get_async(node_path),
+                        self._zk.get_children_async(node_path)),
+                        max_in_flight):
+                try:
+                    data, _ = data_request.get()
+                    children = children_request.get()
+                except NoNodeError:
+                    continue
+                if is_reference(data):
+                    yield decode_reference(data)
+                if node_path == root_path:
+                    children = [child for child in children
+                                if child not in (CHUNKS_NODE, BLOBS_NODE)]
+                next_level.extend("{0}/{1}".format(node_path, child)
+                                  for child in children)
+            level = next_level
+
+    def _forget_blobs(self, node_path):
+        """ Drops payloads known to be stored that removing node_path
+        deletes
+        """
+        blobs_path = self._get_blob_path("")
+        if blobs_path.startswith(node_path.rstrip("/") + "/"):
+            self._known_blobs.clear()
+        elif node_path.startswith(blobs_path):
+            self._known_blobs.pop(
+                node_path[len(blobs_path):].split("/", 1)[0], None)
+
+    def _fetch_blob(self, digest):
+        """ Provides a referenced payload decoded, through the blob cache
+        """
+        found, data = self._blob_cache.get(digest)
+        if not found:
+            data, _ = self._get(self._get_blob_path(digest))
+            self._blob_cache.put(digest, data)
+        # each node read gets its own copy, nested values included
+        return self._codec.decode(data)
+
+    def _get_blob_path(self, digest):
+        return "{0}/{1}/{2}".format(self._root_path.rstrip("/"), BLOBS_NODE,
+                                    digest)
+
+    def _process_for_serialization(self, config):
         data = {k: config[k] for k in config if not k.startswith('_')}
-        return json.dumps(data).encode()
+        return self._codec.encode(data)
+
+    def _process_for_deserialization(self, data):
+        if is_reference(data):
+            return self._fetch_blob(decode_reference(data))
+        if data:
+            data = self._codec.decode(data)
+        return data
+
+    def subscribe(self, node_path, callback, children=True, debounce=0,
+                  groups=None):
+        """ Delivers changes made to a node, and optionally its children
+
+        Args:
+            node_path (str): path to node
+            callback (callable): receives kind of change (ADDED, CHANGED or
+                REMOVED), child name (None for the node itself) and node
+                data (None when removed)
+            children (bool): deliver changes to children as well
+            debounce (float): seconds changes to a node are merged for
+            groups (callable): tells children holding children of the node,
+                see ZookeeperSubscription
+
+        Returns:
+            ZookeeperSubscription: subscription, to be cancelled when no
+                longer needed
+        """
+        self.wait_ready()
+
+        def deliver(kind, child, data):
+            if data is not None:
+                data, _ = self._resolve_chunks(
+                    subscription.get_path(child), data, None)
+                data = self._process_for_deserialization(data)
+            callback(kind, child, data)
+
+        subscription = ZookeeperSubscription(
+            self._zk, node_path, deliver, children, debounce, self.logger,
+            groups)
+        return subscription.start()
 
     def get_root_path(self):
         return self._root_path
 
+    def get_client(self):
+        """ Provides the kazoo client of the primary session, for requests
+        the proxy does not offer, e.g., pipelined reads of a whole tree
+
+        Nodes written through it are unknown to the proxy until forget_tree
+        is invoked
+        """
+        return self._zk
+
+    def ensure_path(self, node_path):
+        """ Creates node_path, and missing parents, holding no data unless
+        it exists
+        """
+        self.wait_ready()
+        self._retry(self._zk.ensure_path, node_path)
+        self._invalidate(node_path)
+
+    def resolve_chunks(self, node_path, data, stat, reader=None):
+        """ Replaces data read from a chunk manifest with its payload
+
+        Args:
+            reader (KazooClient): session the manifest was read with, the
+                primary session by default
+
+        Returns:
+            tuple: (data, stat)
+        """
+        return self._resolve_chunks(node_path, data, stat, reader)
+
+    def serialize(self, config):
+        """ Encodes config as it would be written, private keys excluded
+
+        Returns:
+            bytes: serialized config
+        """
+        return self._process_for_serialization(config)
+
+    def deserialize(self, data):
+        """ Decodes data read from a node, chunks resolved already
+
+        Returns:
+            dict: config
+        """
+        return self._process_for_deserialization(data)
+
+    def prepare_write(self, node_path, serialized_config):
+        """ Provides data to write to node_path, see _prepare_write
+
+        Returns:
+            tuple: (data to write to node_path, callable to invoke once
+                written, callable to invoke if write fails or None)
+        """
+        return self._prepare_write(node_path, serialized_config)
+
+    def forget_tree(self, node_path):
+        """ Drops whatever is known of node_path and its descendants, once
+        written through the client
+        """
+        self._invalidate(node_path, tree=True)
+        self._forget_versions(node_path, tree=True)
+
+    # steps of operations, for proxies issuing requests on their own, e.g.,
+    # AsyncZookeeperProxy
+
+    def is_ready(self):
+        """ Tells whether sessions are established, or failed to, see
+        wait_ready
+        """
+        return self._ready.is_set()
+
+    def measure(self, operation, node_path):
+        """ Accounts an operation in stats and runs operation_complete hook
+
+        Returns:
+            context manager yielding [bytes sent, bytes received], to be set
+                by the operation
+        """
+        return self._measure(operation, node_path)
+
+    @property
+    def retries(self):
+        """ Tells whether operations failing because the connection was
+        lost are retried
+        """
+        return self._retry_policy is not None
+
+    def get_async(self, node_path):
+        """ Issues an asynchronous read unless it can be served from cache,
+        see store_read
+
+        Returns:
+            tuple: (async result or cached (data, stat), cache generation,
+                session read with)
+        """
+        return self._get_async(node_path)
+
+    def read(self, node_path):
+        """ Reads node data and stat, chunks resolved, retried when
+        enabled, e.g., after an asynchronous read failed
+
+        Returns:
+            tuple: (data, stat)
+        """
+        return self._retry(self._read, node_path,
+                           watch=self._get_watch(self._data_watcher))
+
+    def store_read(self, node_path, data, stat, generation):
+        """ Keeps track of node data read asynchronously, chunks resolved
+        """
+        self._store_read(node_path, data, stat, generation)
+
+    def decode_read(self, data, stat):
+        """ Decodes node data read, flagging it when served stale
+
+        Returns:
+            dict: config
+        """
+        return self._decode_read(data, stat)
+
+    def take_children(self, node_path):
+        """ Serves node children from snapshot or cache when possible
+
+        Returns:
+            tuple: (found, children)
+        """
+        return self._take_children(node_path)
+
+    def get_children_async(self, node_path):
+        """ Issues an asynchronous children read, see complete_children
+
+        Returns:
+            tuple: (async result, cache generation the read was issued at)
+        """
+        return self._list_children_async(
+            node_path, watch=self._get_watch(self._children_watcher))
+
+    def complete_children(self, node_path, result, generation):
+        """ Keeps track of node children read asynchronously
+
+        Args:
+            result: value of the read issued by get_children_async
+
+        Returns:
+            list: children
+        """
+        children = self._on_children(node_path, result)
+        self._store_children(node_path, children, generation)
+        return list(children)
+
+    @property
+    def queues_saves(self):
+        """ Tells whether saves not specifying a version are queued, see
+        write_behind_interval
+        """
+        return self._write_behind is not None
+
+    def writes_directly(self, node_path, serialized_config):
+        """ Tells whether serialized_config is written to node_path by a
+        single request of data known up front, see prepare_write
+
+        Data stored as chunks or as a shared payload, and writes subject to
+        write elision or offline queueing, need requests of their own
+        """
+        return not self._write_elision and self._offline_writes is None \
+            and len(serialized_config) <= self._max_node_bytes and \
+            not self._is_deduplicated(node_path, serialized_config)
+
+    def write(self, node_path, config, create=False, version=None):
+        """ Writes config to node_path, see register and save, neither
+        waiting for sessions nor measured
+
+        Returns:
+            int: number of bytes written
+        """
+        return self._write(node_path, config, create, version)
+
+    def send_write(self, node_path, data, create, version, attempts=None):
+        """ Sends data prepared by prepare_write, retried when enabled
+
+        Args:
+            attempts (iterator): counts attempts of the write, a versioned
+                write found applied already when retried succeeds
+
+        Returns:
+            int: node version after write, None if unknown
+        """
+        return self._retry(self._send_write, node_path, data, create,
+                           version, attempts)
+
+    def discard_queued(self, node_path, tree=False):
+        """ Drops saves queued for node_path, and its descendants when tree
+        is set, superseded by a write or removal sent right away
+        """
+        self._discard_queued(node_path, tree)
+
+    def invalidate(self, node_path, tree=False):
+        """ Drops what is cached of node_path, and its descendants when
+        tree is set, once written or removed
+        """
+        self._invalidate(node_path, tree)
+
+    def record_version(self, node_path, version, serialized_config):
+        """ Keeps track of the version a node was written at
+        """
+        self._record_version(node_path, version, serialized_config)
+
+    def forget_removed(self, node_path):
+        """ Drops versions, payloads and offline writes of node_path and its
+        descendants, about to be removed
+        """
+        self._forget_versions(node_path, tree=True)
+        self._forget_blobs(node_path)
+        if self._offline_writes is not None:
+            self._offline_writes.discard(node_path, tree=True)
+
+    def get_chunk_path(self, node_path):
+        """ Provides path chunks of node_path and its descendants are kept
+        under
+        """
+        return self._get_chunk_path(node_path)
+
     @property
     def hooks(self):
         return self._hooks
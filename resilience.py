@@ -0,0 +1,132 @@
+"""
+    Retries, stale reads and offline writes while the session is
+    interrupted
+
+"""
+from collections import OrderedDict
+from threading import Lock
+
+from kazoo.exceptions import ConnectionClosedError, ConnectionLoss, \
+    OperationTimeoutError, SessionExpiredError
+from kazoo.retry import KazooRetry, RetryFailedError
+
+
+# errors telling a request did not reach zookeeper or got no response
+CONNECTION_ERRORS = (ConnectionLoss, OperationTimeoutError,
+                     SessionExpiredError, ConnectionClosedError,
+                     RetryFailedError)
+
+# stat of node data served stale, i.e., read before the session was
+# interrupted
+STALE = object()
+
+DEFAULT_RETRY_DELAY = 0.1
+DEFAULT_RETRY_MAX_DELAY = 30
+DEFAULT_MAX_OFFLINE_WRITES = 1000
+
+
+class StaleData(dict):
+
+    """ Node data served while the session is interrupted, as last read
+    """
+
+
+class StaleChildren(list):
+
+    """ Node children served while the session is interrupted, as last read
+    """
+
+
+def is_stale(value):
+    return isinstance(value, (StaleData, StaleChildren))
+
+
+def create_retry(max_tries, delay=DEFAULT_RETRY_DELAY,
+                 max_delay=DEFAULT_RETRY_MAX_DELAY, deadline=None):
+    """ Provides the retry policy for proxy operations
+
+    Args:
+        max_tries (int): attempts after the first one, -1 for unlimited,
+            no retry policy when 0
+        delay (float): seconds before the first retry, doubled after each
+            one up to max_delay
+        max_delay (float): maximum seconds between retries
+        deadline (float): seconds after which retrying stops, if any
+
+    Returns:
+        KazooRetry: policy, None when retries are disabled
+    """
+    if not max_tries:
+        return None
+    return KazooRetry(max_tries=max_tries, delay=delay, backoff=2,
+                      max_delay=max_delay, deadline=deadline or None)
+
+
+class OfflineWriteQueue(object):
+
+    """ Writes kept while the session is interrupted, sent on reconnection
+
+    Writes to a node replace any write to the same node not sent yet,
+    creating it if any of them did, and are sent in order of first write so
+    that parents are created before their children. At most max_size nodes
+    are kept.
+    """
+
+    def __init__(self, max_size=DEFAULT_MAX_OFFLINE_WRITES):
+        self._max_size = max(1, max_size)
+        self._lock = Lock()
+        # node path -> (data, create)
+        self._pending = OrderedDict()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._pending)
+
+    def put(self, node_path, data, create=False):
+        """ Keeps a write
+
+        Returns:
+            bool: whether it was kept, False when queue is full
+        """
+        with self._lock:
+            if node_path in self._pending:
+                create = create or self._pending[node_path][1]
+            elif len(self._pending) >= self._max_size:
+                return False
+            self._pending[node_path] = (data, create)
+            return True
+
+    def get(self, node_path):
+        """ Provides data written to node_path not sent yet
+
+        Returns:
+            tuple: (found, data)
+        """
+        with self._lock:
+            if node_path in self._pending:
+                return True, self._pending[node_path][0]
+        return False, None
+
+    def first(self):
+        """ Provides the write to send next
+
+        Returns:
+            tuple: (node_path, data, create), None when queue is empty
+        """
+        with self._lock:
+            for node_path, (data, create) in self._pending.items():
+                return node_path, data, create
+
+    def done(self, node_path, data):
+        """ Drops a write once sent, unless replaced meanwhile
+        """
+        with self._lock:
+            if self._pending.get(node_path, (None,))[0] is data:
+                del self._pending[node_path]
+
+    def discard(self, node_path, tree=False):
+        prefix = node_path + "/"
+        with self._lock:
+            for path in list(self._pending):
+                if path == node_path or (tree and path.startswith(prefix)):
+                    del self._pending[path]
@@ -0,0 +1,129 @@
+"""
+    Serializers turning configuration data into bytes and back
+
+"""
+import json
+
+from nio.util.logging import get_nio_logger
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+
+__all__ = ['get_serializer', 'get_deserializer', 'JSON', 'MSGPACK']
+
+
+# wire formats, a node stores the format it was written with
+JSON = 0
+MSGPACK = 1
+
+DEFAULT_SERIALIZER = "json"
+
+
+class JsonSerializer(object):
+
+    """ Stdlib json serializer
+    """
+
+    name = "json"
+    format_id = JSON
+
+    @staticmethod
+    def dumps(data):
+        return json.dumps(data).encode()
+
+    @staticmethod
+    def loads(data):
+        return json.loads(data.decode())
+
+
+class OrjsonSerializer(object):
+
+    """ orjson serializer, produces the same wire format as json
+    """
+
+    name = "orjson"
+    format_id = JSON
+
+    @staticmethod
+    def dumps(data):
+        return orjson.dumps(data)
+
+    @staticmethod
+    def loads(data):
+        return orjson.loads(data)
+
+
+class MsgpackSerializer(object):
+
+    """ msgpack serializer
+    """
+
+    name = "msgpack"
+    format_id = MSGPACK
+
+    @staticmethod
+    def dumps(data):
+        return msgpack.packb(data, use_bin_type=True)
+
+    @staticmethod
+    def loads(data):
+        return msgpack.unpackb(data, raw=False)
+
+
+_serializers = {
+    # name: (serializer, available)
+    JsonSerializer.name: (JsonSerializer, True),
+    OrjsonSerializer.name: (OrjsonSerializer, orjson is not None),
+    MsgpackSerializer.name: (MsgpackSerializer, msgpack is not None),
+}
+
+
+def get_serializer(name=DEFAULT_SERIALIZER):
+    """ Provides serializer by name
+
+    Falls back to stdlib json when the package backing the serializer
+    requested is not installed
+
+    Args:
+        name (str): "json", "orjson" or "msgpack"
+
+    Returns:
+        serializer class
+    """
+    if name not in _serializers:
+        raise ValueError("Unsupported serializer: {}".format(name))
+    serializer, available = _serializers[name]
+    if not available:
+        get_nio_logger("ZookeeperSerializers").warning(
+            "{} is not installed, falling back to json".format(name))
+        return JsonSerializer
+    return serializer
+
+
+def get_deserializer(format_id, preferred):
+    """ Provides serializer able to read a given wire format
+
+    Args:
+        format_id (int): format data was written with
+        preferred: serializer to use when it reads format_id
+
+    Returns:
+        serializer class
+    """
+    if preferred.format_id == format_id:
+        return preferred
+    if format_id == JSON:
+        return JsonSerializer
+    if format_id == MSGPACK:
+        if msgpack is None:
+            raise ValueError("msgpack is required to read node data")
+        return MsgpackSerializer
+    raise ValueError("Unsupported serializer format: {}".format(format_id))
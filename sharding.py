@@ -0,0 +1,195 @@
+"""
+    Hash-bucketed layout of very wide multiple configurations
+
+    Children of a sharded configuration are spread across a fixed number of
+    bucket nodes by a hash of their name, so no single node has to list all
+    of them:
+
+        /<root>/<id>/blocks                     {"zookeeper_layout": ...}
+        /<root>/<id>/blocks/.bucket64.0/b1
+        /<root>/<id>/blocks/.bucket64.1/b2
+
+    The name node's data records the bucket count in use. Bucket names carry
+    it as well, so a configuration can be moved to another bucket count, or
+    back to the flat layout, without its children being read from both
+    layouts at once.
+
+    Usage:
+
+        python -m <package>.sharding /1/blocks --buckets 64 \\
+            --hosts zk1:2181,zk2:2181 --root-path /nio_configuration
+
+"""
+import argparse
+import logging
+from hashlib import sha256
+
+from .proxy import ZookeeperProxy, DEFAULT_MAX_IN_FLIGHT
+
+
+__all__ = ['migrate', 'get_child_path', 'get_bucket_paths', 'is_bucket',
+           'get_layout', 'LAYOUT_KEY']
+
+
+# key of name node data holding its layout
+LAYOUT_KEY = "zookeeper_layout"
+BUCKET_PREFIX = ".bucket"
+
+
+def is_bucket(child):
+    return child.startswith(BUCKET_PREFIX)
+
+
+def get_layout(data):
+    """ Provides number of buckets recorded in name node data, 0 when flat
+    """
+    if isinstance(data, dict):
+        layout = data.get(LAYOUT_KEY)
+        if isinstance(layout, dict):
+            return int(layout.get("buckets", 0))
+    return 0
+
+
+def encode_layout(buckets):
+    """ Provides name node data recording a layout
+    """
+    if not buckets:
+        return {}
+    return {LAYOUT_KEY: {"type": "hashed", "buckets": buckets}}
+
+
+def _get_bucket(child, buckets):
+    index = int.from_bytes(sha256(child.encode()).digest()[:4], "big") % \
+        buckets
+    return "{0}{1}.{2}".format(BUCKET_PREFIX, buckets, index)
+
+
+def get_bucket_paths(node_path, buckets):
+    return ["{0}/{1}{2}.{3}".format(node_path, BUCKET_PREFIX, buckets, index)
+            for index in range(buckets)]
+
+
+def get_child_path(node_path, child, buckets):
+    """ Provides path to a child of a multiple configuration
+
+    Args:
+        node_path (str): path to name node
+        child (str): child name
+        buckets (int): number of buckets, 0 when flat
+    """
+    if not buckets:
+        return "{0}/{1}".format(node_path, child)
+    return "{0}/{1}/{2}".format(node_path, _get_bucket(child, buckets), child)
+
+
+def list_children(proxy, node_path, children=None,
+                  max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    """ Lists children of a multiple configuration along with their paths
+
+    Buckets are listed concurrently
+
+    Args:
+        proxy (ZookeeperProxy): connected proxy
+        node_path (str): path to name node
+        children (list): children of name node, when listed already
+
+    Returns:
+        tuple: (number of buckets, dict of child name -> child path)
+    """
+    if children is None:
+        children = proxy.get_children(node_path) or []
+    if not any(is_bucket(child) for child in children):
+        return 0, {child: "{0}/{1}".format(node_path, child)
+                   for child in children}
+    buckets = get_layout(proxy.fetch(node_path))
+    child_paths = {}
+    if buckets:
+        for bucket_path, bucket_children in proxy.get_children_many(
+                get_bucket_paths(node_path, buckets), max_in_flight):
+            for child in bucket_children or []:
+                child_paths[child] = "{0}/{1}".format(bucket_path, child)
+    else:
+        # flat, leftovers of a migration are not children
+        child_paths = {child: "{0}/{1}".format(node_path, child)
+                       for child in children if not is_bucket(child)}
+    return buckets, child_paths
+
+
+def migrate(proxy, node_path, buckets, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    """ Moves children of a multiple configuration to another layout
+
+    Children are written to their new location first, then the layout is
+    switched in the name node's data, then the previous location is removed.
+    Readers observe either layout whole, configuration should not be written
+    to while migrating. Only children's data is moved, as read by the
+    provider.
+
+    Args:
+        proxy (ZookeeperProxy): connected proxy
+        node_path (str): path to name node
+        buckets (int): number of buckets, 0 for the flat layout
+        max_in_flight (int): maximum number of outstanding requests
+
+    Returns:
+        int: number of children moved
+    """
+    proxy.ensure_path(node_path)
+    current, child_paths = list_children(proxy, node_path,
+                                         max_in_flight=max_in_flight)
+    if current == buckets:
+        return 0
+    if buckets:
+        conflicts = [child for child in child_paths if is_bucket(child)]
+        if conflicts:
+            raise ValueError("Children {} can't be told apart from "
+                             "buckets".format(", ".join(sorted(conflicts))))
+
+    names = {path: child for child, path in child_paths.items()}
+    with proxy.batch():
+        for bucket_path in get_bucket_paths(node_path, buckets):
+            proxy.register(bucket_path, {})
+        for path, data in proxy.fetch_many(list(names), max_in_flight):
+            proxy.register(get_child_path(node_path, names[path], buckets),
+                           data)
+    proxy.save(node_path, encode_layout(buckets))
+    proxy.flush()
+
+    with proxy.batch():
+        if current:
+            for bucket_path in get_bucket_paths(node_path, current):
+                proxy.remove(bucket_path)
+        else:
+            for path in names:
+                proxy.remove(path)
+    return len(names)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Moves children of a zookeeper configuration to a "
+                    "hash-bucketed or flat layout")
+    parser.add_argument("path",
+                        help="name node path relative to root path, "
+                             "e.g., /1/blocks")
+    parser.add_argument("--buckets", type=int, required=True,
+                        help="number of buckets, 0 for the flat layout")
+    parser.add_argument("--hosts", default="127.0.0.1:2181")
+    parser.add_argument("--root-path", default="/nio_configuration")
+    parser.add_argument("--max-in-flight", type=int,
+                        default=DEFAULT_MAX_IN_FLIGHT)
+    args = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO)
+    proxy = ZookeeperProxy()
+    proxy.connect(None, None, args.root_path,
+                  logging.getLogger("ZookeeperSharding"), hosts=args.hosts)
+    try:
+        moved = migrate(proxy, args.root_path.rstrip("/") + args.path,
+                        args.buckets, args.max_in_flight)
+        print("{} children moved".format(moved))
+    finally:
+        proxy.disconnect()
+
+
+if __name__ == "__main__":
+    main()
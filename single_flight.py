@@ -0,0 +1,135 @@
+"""
+    Coalescing of concurrent identical reads
+
+"""
+from threading import Event, Lock
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.done = Event()
+        self.result = None
+        self.error = None
+        self.captured = None
+
+
+class SingleFlight(object):
+
+    """ Shares one in-flight request among callers asking for the same key
+
+    Blocking calls are shared through do, asynchronous requests through
+    share. A caller arriving while a request for its key is in flight gets
+    that request's result instead of issuing its own, a caller arriving once
+    it completed issues a new one. Keys discarded, e.g., because their node
+    was written to, are not joined anymore, callers already waiting still
+    get the result of the request they joined. State a result depends on,
+    e.g., a cache generation, is captured once by the caller issuing the
+    request and handed to every caller sharing it.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        # key -> _Call of blocking calls in flight
+        self._calls = {}
+        # key -> (asynchronous result, value captured) in flight
+        self._results = {}
+        # requests issued and requests shared instead of being issued
+        self.issued = 0
+        self.coalesced = 0
+
+    def do(self, key, func, capture=None):
+        """ Runs func, unless running already for key, providing its result
+
+        Args:
+            key: identifies the call
+            func (callable): call to share
+            capture (callable): invoked by the caller running func, its
+                value is passed to func and provided to every caller
+                sharing the call
+
+        Returns:
+            result of func, (result, value captured) when capture is given
+
+        Raises:
+            Exception: exception func raised
+        """
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+                self.issued += 1
+            else:
+                self.coalesced += 1
+        if leader:
+            try:
+                if capture is None:
+                    call.result = func()
+                else:
+                    call.captured = capture()
+                    call.result = func(call.captured)
+            except BaseException as e:
+                call.error = e
+            finally:
+                with self._lock:
+                    if self._calls.get(key) is call:
+                        del self._calls[key]
+                call.done.set()
+        else:
+            call.done.wait()
+        if call.error is not None:
+            raise call.error
+        if capture is not None:
+            return call.result, call.captured
+        return call.result
+
+    def share(self, key, issue, capture=None):
+        """ Issues an asynchronous request, unless in flight already for key
+
+        Args:
+            key: identifies the request
+            issue (callable): issues the request, returning its kazoo
+                asynchronous result
+            capture (callable): invoked by the caller issuing the request,
+                its value is passed to issue and provided to every caller
+                sharing the request
+
+        Returns:
+            IAsyncResult: result of request issued or joined,
+                (IAsyncResult, value captured) when capture is given
+        """
+        with self._lock:
+            flight = self._results.get(key)
+            leader = flight is None
+            if leader:
+                if capture is None:
+                    flight = (issue(), None)
+                else:
+                    captured = capture()
+                    flight = (issue(captured), captured)
+                self._results[key] = flight
+                self.issued += 1
+            else:
+                self.coalesced += 1
+        if leader:
+            flight[0].rawlink(lambda _: self._release(key, flight))
+        if capture is not None:
+            return flight
+        return flight[0]
+
+    def _release(self, key, flight):
+        with self._lock:
+            if self._results.get(key) is flight:
+                del self._results[key]
+
+    def discard(self, path, tree=False):
+        """ Stops sharing requests for path, keys being (operation, path),
+        and for its descendants when tree is set
+        """
+        prefix = path + "/"
+        with self._lock:
+            for requests in (self._calls, self._results):
+                for key in list(requests):
+                    if key[1] == path or (tree and key[1].startswith(prefix)):
+                        del requests[key]
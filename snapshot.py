@@ -0,0 +1,303 @@
+"""
+    On-disk snapshot of zookeeper nodes read, used to speed up startup
+
+"""
+import mmap
+import os
+import struct
+from collections import deque, namedtuple
+from threading import RLock
+
+
+# header: magic, number of records
+HEADER = struct.Struct("<8sI")
+MAGIC = b"NZSNAP\x00\x01"
+# record: mzxid, pzxid, version, flags, path offset and length, data offset
+# and length, children offset and length. Offsets are absolute within file
+RECORD = struct.Struct("<qqiI" + "QI" * 3)
+
+HAS_DATA = 0x1
+HAS_CHILDREN = 0x2
+
+# children names can't contain a slash
+CHILDREN_SEPARATOR = b"/"
+
+
+SnapshotStat = namedtuple("SnapshotStat", ["version", "mzxid", "pzxid"])
+
+
+def _decode_children(children):
+    """ Provides children as a list, when still a view of a snapshot file
+    """
+    if isinstance(children, memoryview):
+        return [child.decode() for child in
+                bytes(children).split(CHILDREN_SEPARATOR) if child]
+    return list(children)
+
+
+class _Entry(object):
+
+    """ Data and children of a node along with the zxids they were read at
+    """
+
+    __slots__ = ["mzxid", "pzxid", "version", "data", "children"]
+
+    def __init__(self, mzxid=-1, pzxid=-1, version=-1, data=None,
+                 children=None):
+        self.mzxid = mzxid
+        self.pzxid = pzxid
+        self.version = version
+        self.data = data
+        self.children = children
+
+    @property
+    def stat(self):
+        return SnapshotStat(self.version, self.mzxid, self.pzxid)
+
+
+class ZookeeperSnapshot(object):
+
+    """ Snapshot of node data and children lists kept in a local file
+
+    Nodes read during a session are recorded and written to file when
+    saved. When loaded, entries are checked against zookeeper through
+    pipelined `exists` calls comparing the zxids they were read at, only
+    entries still current are served, each of them once, so that only nodes
+    that changed have to be downloaded again. Checks leave watches behind,
+    an entry is dropped as soon as its node changes after being checked.
+
+    File layout is a fixed size header, fixed size records and a blob with
+    paths, data and children, allowing it to be memory mapped. Loaded data
+    and children are kept as views of the mapping, only entries served are
+    copied, the file is unmapped once no entry refers to it.
+    """
+
+    def __init__(self, file_path):
+        self._file_path = file_path
+        self._lock = RLock()
+        # entries to save
+        self._entries = {}
+        # validated entries not served yet
+        self._loaded = {}
+
+    def load(self):
+        """ Loads snapshot file, if any
+
+        Returns:
+            int: number of entries loaded
+        """
+        try:
+            with open(self._file_path, "rb") as f:
+                mapping = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            entries = self._parse(memoryview(mapping))
+        except (OSError, ValueError, struct.error):
+            # missing, empty or corrupt snapshot, start from scratch
+            entries = {}
+        with self._lock:
+            self._loaded = entries
+        return len(entries)
+
+    @staticmethod
+    def _parse(view):
+        magic, count = HEADER.unpack_from(view, 0)
+        if magic != MAGIC:
+            raise ValueError("Not a snapshot file")
+        entries = {}
+        for index in range(count):
+            (mzxid, pzxid, version, flags,
+             path_offset, path_length,
+             data_offset, data_length,
+             children_offset, children_length) = \
+                RECORD.unpack_from(view, HEADER.size + index * RECORD.size)
+            entry = _Entry(mzxid, pzxid, version)
+            if flags & HAS_DATA:
+                entry.data = view[data_offset:data_offset + data_length]
+            if flags & HAS_CHILDREN:
+                # decoded when served
+                entry.children = \
+                    view[children_offset:children_offset + children_length]
+            path = str(view[path_offset:path_offset + path_length], "utf-8")
+            entries[path] = entry
+        return entries
+
+    def validate(self, client, max_in_flight):
+        """ Keeps loaded entries whose node did not change since recorded
+
+        Entries kept are watched, see expire
+
+        Args:
+            client (KazooClient): client to check nodes with
+            max_in_flight (int): maximum number of outstanding requests
+
+        Returns:
+            tuple: (number of current entries, number of stale entries)
+        """
+        with self._lock:
+            loaded = list(self._loaded.items())
+
+        current = {}
+        stale = 0
+        pending = deque()
+        for item in loaded:
+            if len(pending) >= max_in_flight:
+                stale += self._check(current, *pending.popleft())
+            pending.append(item + self._watch(client, *item))
+        while pending:
+            stale += self._check(current, *pending.popleft())
+
+        with self._lock:
+            self._loaded = current
+            self._entries.update(current)
+        return len(current), stale
+
+    def _watch(self, client, path, entry):
+        """ Requests node stat, watching node data and children loaded
+
+        Requests of a session are processed in order, children are watched
+        once the stat is received
+
+        Returns:
+            tuple: (stat request,)
+        """
+        if entry.children is not None:
+            # exists watches don't fire on children changes, the children
+            # request only sets a watch
+            client.get_children_async(path, watch=self.expire)
+        return (client.exists_async(path, watch=self.expire),)
+
+    @staticmethod
+    def _check(current, path, entry, request):
+        """ Checks an entry against node stat
+
+        Returns:
+            int: 1 if entry is stale, 0 otherwise
+        """
+        stat = request.get()
+        if stat is None:
+            return 1
+        if entry.data is not None and stat.mzxid != entry.mzxid:
+            entry.data = None
+        if entry.children is not None and stat.pzxid != entry.pzxid:
+            entry.children = None
+        if entry.data is None and entry.children is None:
+            return 1
+        current[path] = entry
+        return 0
+
+    def expire(self, event):
+        """ Drops the loaded entry of a node changed since validated
+
+        Args:
+            event (WatchedEvent): event of a watch set by validate
+        """
+        with self._lock:
+            self._loaded.pop(event.path, None)
+
+    def take_data(self, path):
+        """ Serves node data from snapshot, once
+
+        Returns:
+            tuple: (found, (data, stat))
+        """
+        with self._lock:
+            entry = self._loaded.get(path)
+            if entry is None or entry.data is None:
+                return False, None
+            data = bytes(entry.data)
+            entry.data = data
+            self._discard_loaded(path, entry, "data")
+            return True, (data, entry.stat)
+
+    def take_children(self, path):
+        """ Serves node children from snapshot, once
+
+        Returns:
+            tuple: (found, children)
+        """
+        with self._lock:
+            entry = self._loaded.get(path)
+            if entry is None or entry.children is None:
+                return False, None
+            children = _decode_children(entry.children)
+            self._discard_loaded(path, entry, "children")
+            return True, children
+
+    def _discard_loaded(self, path, entry, served):
+        served_entry = _Entry(entry.mzxid, entry.pzxid, entry.version,
+                              entry.data, entry.children)
+        setattr(served_entry, served, None)
+        if served_entry.data is None and served_entry.children is None:
+            del self._loaded[path]
+        else:
+            self._loaded[path] = served_entry
+
+    def record_data(self, path, data, stat):
+        with self._lock:
+            entry = self._entries.setdefault(path, _Entry())
+            entry.mzxid = stat.mzxid
+            entry.version = stat.version
+            entry.data = data
+
+    def record_children(self, path, children, stat):
+        with self._lock:
+            entry = self._entries.setdefault(path, _Entry())
+            entry.pzxid = stat.pzxid
+            entry.children = list(children)
+
+    def discard(self, path, tree=False):
+        """ Forgets path, and its descendants when tree is set
+        """
+        prefix = path + "/"
+        with self._lock:
+            for entries in (self._entries, self._loaded):
+                entries.pop(path, None)
+                if tree:
+                    for descendant in [descendant for descendant in entries
+                                       if descendant.startswith(prefix)]:
+                        del entries[descendant]
+
+    def save(self):
+        """ Writes recorded entries to file, replacing it atomically
+
+        Returns:
+            int: number of entries saved
+        """
+        with self._lock:
+            entries = [(path, entry) for path, entry in self._entries.items()
+                       if entry.data is not None or
+                       entry.children is not None]
+            entries = [(path, entry.mzxid, entry.pzxid, entry.version,
+                        None if entry.data is None else bytes(entry.data),
+                        None if entry.children is None else
+                        _decode_children(entry.children))
+                       for path, entry in entries]
+
+        records = []
+        blob = []
+        offset = HEADER.size + RECORD.size * len(entries)
+        for path, mzxid, pzxid, version, data, children in entries:
+            flags = 0
+            fields = []
+            values = [path.encode(), data,
+                      None if children is None else
+                      CHILDREN_SEPARATOR.join(child.encode()
+                                              for child in children)]
+            for value in values:
+                value = value or b""
+                fields.extend((offset, len(value)))
+                blob.append(value)
+                offset += len(value)
+            if data is not None:
+                flags |= HAS_DATA
+            if children is not None:
+                flags |= HAS_CHILDREN
+            records.append(RECORD.pack(mzxid, pzxid, version, flags,
+                                       *fields))
+
+        temp_path = "{}.tmp".format(self._file_path)
+        with open(temp_path, "wb") as f:
+            f.write(HEADER.pack(MAGIC, len(records)))
+            f.writelines(records)
+            f.writelines(blob)
+        os.replace(temp_path, self._file_path)
+        return len(entries)
@@ -0,0 +1,100 @@
+"""
+    Latency, call and byte statistics of zookeeper proxy operations
+
+"""
+from bisect import bisect_left
+from threading import Lock
+
+
+# upper bounds, in seconds, of latency histogram buckets, an extra bucket
+# counts anything slower
+LATENCY_BUCKETS = (0.0005, 0.001, 0.002, 0.005, 0.01, 0.025, 0.05, 0.1,
+                   0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+class _OperationStats(object):
+
+    __slots__ = ["calls", "errors", "bytes_sent", "bytes_received",
+                 "total_seconds", "max_seconds", "histogram"]
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.total_seconds = 0.0
+        self.max_seconds = 0.0
+        self.histogram = [0] * (len(LATENCY_BUCKETS) + 1)
+
+    def as_dict(self):
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "bytes_sent": self.bytes_sent,
+            "bytes_received": self.bytes_received,
+            "total_seconds": self.total_seconds,
+            "max_seconds": self.max_seconds,
+            "histogram": dict(zip([str(bound) for bound in LATENCY_BUCKETS] +
+                                  ["inf"], self.histogram))
+        }
+
+
+class ZookeeperStats(object):
+
+    """ Statistics of proxy operations
+
+    Operations are broken down by the mapping id and top level name found in
+    node paths, i.e., a fetch of /root/3/blocks/b1 is accounted under
+    ("fetch", "3", "blocks"). Paths outside of root path are accounted with
+    empty mapping id and name.
+    """
+
+    def __init__(self):
+        self._lock = Lock()
+        self._operations = {}
+
+    @staticmethod
+    def get_key(root_path, node_path):
+        """ Provides mapping id and name a node path belongs to
+
+        Returns:
+            tuple: (mapping id, name)
+        """
+        root_path = (root_path or "").rstrip("/")
+        if not node_path.startswith(root_path + "/"):
+            return "", ""
+        parts = node_path[len(root_path) + 1:].split("/", 2)
+        return parts[0], parts[1] if len(parts) > 1 else ""
+
+    def record(self, operation, mapping_id, name, seconds, bytes_sent=0,
+               bytes_received=0, error=False):
+        key = (operation, mapping_id, name)
+        with self._lock:
+            stats = self._operations.get(key)
+            if stats is None:
+                stats = self._operations[key] = _OperationStats()
+            stats.calls += 1
+            stats.errors += 1 if error else 0
+            stats.bytes_sent += bytes_sent
+            stats.bytes_received += bytes_received
+            stats.total_seconds += seconds
+            stats.max_seconds = max(stats.max_seconds, seconds)
+            stats.histogram[bisect_left(LATENCY_BUCKETS, seconds)] += 1
+
+    def snapshot(self):
+        """ Provides a copy of statistics collected
+
+        Returns:
+            dict: operation -> mapping id -> name -> statistics
+        """
+        result = {}
+        with self._lock:
+            for (operation, mapping_id, name), stats in \
+                    self._operations.items():
+                result.setdefault(operation, {}).setdefault(
+                    mapping_id, {})[name] = stats.as_dict()
+        return result
+
+    def reset(self):
+        with self._lock:
+            self._operations = {}
@@ -0,0 +1,220 @@
+"""
+    Subscriptions to changes of configuration nodes
+
+"""
+from collections import namedtuple
+from threading import RLock, Timer
+
+
+__all__ = ['ZookeeperSubscription', 'SubscriptionEvent', 'ADDED', 'CHANGED',
+           'REMOVED']
+
+
+# kinds of events delivered
+ADDED = "added"
+CHANGED = "changed"
+REMOVED = "removed"
+
+# event delivered to provider subscribers, config is None when removed
+SubscriptionEvent = namedtuple("SubscriptionEvent",
+                               ["kind", "name", "child", "config"])
+
+# resulting kind when an event of a given kind follows another one within
+# the debounce window, None when they cancel each other out
+_MERGED = {
+    (ADDED, CHANGED): ADDED,
+    (ADDED, REMOVED): None,
+    (CHANGED, CHANGED): CHANGED,
+    (CHANGED, REMOVED): REMOVED,
+    (REMOVED, ADDED): CHANGED,
+}
+
+
+class ZookeeperSubscription(object):
+
+    """ Watches a node, and optionally its children, delivering changes
+
+    Watches are kept through kazoo's DataWatch and ChildrenWatch recipes,
+    which set them again each time they fire. The node's and each child's
+    own data is watched, children being added are found through the
+    children watch. Children telling apart groups, e.g., hash buckets, have
+    their own children watched as children of the node instead. Children
+    watches stop when the node doesn't exist, they are set again whenever
+    the node is added. Current state is not delivered, only changes made
+    after the subscription started.
+
+    Events for the same node within debounce seconds of the first one are
+    merged into one carrying the latest data, i.e., an update burst results
+    in a single changed event, a node added and removed in no event.
+    Without debounce, events are delivered from kazoo's callback thread,
+    from a timer thread otherwise.
+    """
+
+    def __init__(self, client, node_path, deliver, children=True,
+                 debounce=0, logger=None, groups=None):
+        """ Constructor for zookeeper subscription
+
+        Args:
+            client (KazooClient): session to watch through
+            node_path (str): path to node
+            deliver (callable): receives kind, child name (None for the node
+                itself) and node data (None when removed)
+            children (bool): watch children of the node as well
+            debounce (float): seconds events are merged for
+            logger: logger to report delivery failures with
+            groups (callable): tells whether a child of the node is a group
+                holding children of the node, e.g., sharding.is_bucket
+        """
+        self._client = client
+        self._node_path = node_path
+        self._deliver = deliver
+        self._children = children
+        self._debounce = debounce
+        self._logger = logger
+        self._groups = groups
+        self._lock = RLock()
+        self._cancelled = False
+        # child name (None for node itself) -> node exists
+        self._present = {}
+        # child name -> path of its node, when held by a group
+        self._paths = {}
+        # paths of groups watched
+        self._watched_groups = set()
+        # children watches set before the node was last added stop
+        self._generation = 0
+        # child name -> (kind, data) and timer of debounced events
+        self._pending = {}
+        self._timers = {}
+
+    def start(self):
+        self._watch_data(None, initial=True)
+        if self._children:
+            self._watch_children(self._node_path, initial=True)
+        return self
+
+    def cancel(self):
+        """ Stops delivering events
+
+        Watches set already are released the next time they fire
+        """
+        with self._lock:
+            self._cancelled = True
+            for timer in self._timers.values():
+                timer.cancel()
+            self._pending.clear()
+            self._timers.clear()
+
+    @property
+    def cancelled(self):
+        return self._cancelled
+
+    def get_path(self, child):
+        """ Provides path of the node itself, when child is None, or of a
+        child
+        """
+        if child is None:
+            return self._node_path
+        return self._paths.get(child) or \
+            "{0}/{1}".format(self._node_path, child)
+
+    def _watch_children(self, parent_path, initial=False):
+        """ Watches children of the node, or of a group, children found by
+        the first initial report being present already
+        """
+        from kazoo.recipe.watchers import ChildrenWatch
+        first = [initial]
+        generation = self._generation
+
+        def on_children(children):
+            if self._cancelled or generation != self._generation:
+                return False
+            with self._lock:
+                initial, first[0] = first[0], False
+                for child in children:
+                    path = "{0}/{1}".format(parent_path, child)
+                    if parent_path == self._node_path and \
+                            self._groups is not None and self._groups(child):
+                        if path not in self._watched_groups:
+                            self._watched_groups.add(path)
+                            self._watch_children(path, initial)
+                    elif child not in self._present:
+                        if parent_path != self._node_path:
+                            self._paths[child] = path
+                        self._watch_data(child, initial)
+
+        ChildrenWatch(self._client, parent_path, on_children)
+
+    def _rewatch_children(self):
+        """ Watches children of the node added again, children found being
+        added
+        """
+        self._generation += 1
+        self._watched_groups.clear()
+        self._watch_children(self._node_path)
+
+    def _watch_data(self, child, initial=False):
+        """ Watches data of node itself, when child is None, or a child
+        """
+        from kazoo.recipe.watchers import DataWatch
+        # children found when subscribing are present, others are added
+        # when their watch reports their data for the first time
+        self._present[child] = False
+        first = [initial]
+
+        def on_data(data, stat):
+            if self._cancelled:
+                return False
+            with self._lock:
+                present = stat is not None
+                if first[0]:
+                    first[0] = False
+                    self._present[child] = present
+                    return
+                was_present = self._present.get(child, False)
+                self._present[child] = present
+                if present:
+                    self._push(child, CHANGED if was_present else ADDED,
+                               data)
+                    if child is None and not was_present and self._children:
+                        self._rewatch_children()
+                elif was_present:
+                    self._push(child, REMOVED, None)
+                    if child is not None:
+                        # a child created again is found by children watch
+                        del self._present[child]
+                        self._paths.pop(child, None)
+                        return False
+
+        DataWatch(self._client, self.get_path(child), on_data)
+
+    def _push(self, child, kind, data):
+        if not self._debounce:
+            self._call(child, kind, data)
+            return
+        pending = self._pending.get(child)
+        if pending is None:
+            self._pending[child] = (kind, data)
+            timer = Timer(self._debounce, self._flush, (child,))
+            timer.daemon = True
+            self._timers[child] = timer
+            timer.start()
+            return
+        merged = _MERGED.get((pending[0], kind), kind)
+        self._pending[child] = (merged, data)
+
+    def _flush(self, child):
+        with self._lock:
+            self._timers.pop(child, None)
+            kind, data = self._pending.pop(child, (None, None))
+            if kind is None or self._cancelled:
+                return
+        self._call(child, kind, data)
+
+    def _call(self, child, kind, data):
+        try:
+            self._deliver(kind, child, data)
+        except Exception:
+            if self._logger:
+                self._logger.exception(
+                    "Failed to deliver {} event for {}".format(
+                        kind, self._node_path))
@@ -0,0 +1,248 @@
+"""
+    Benchmarks of zookeeper proxy and provider operations
+
+    Runs against the in-process fake zookeeper with configurable latency so
+    results are reproducible without a server, i.e.:
+
+        python -m <package>.tests.benchmarks.bench_zookeeper_provider \\
+            --latency 0.001 --jitter 0.0005 --output bench_output.json
+
+"""
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import time
+from types import SimpleNamespace
+
+from ... import proxy as proxy_module
+from ...async_provider import AsyncZookeeperConfigurationProvider
+from ...async_proxy import AsyncZookeeperProxy
+from ...provider import ZookeeperConfigurationProvider
+from ...proxy import ZookeeperProxy
+from ..fake_zookeeper import fake_kazoo_client
+
+
+ROOT_PATH = "/nio_configuration"
+MAPPING_ID = 1
+
+# tree shapes: children per node, levels below the name node and size of
+# each node payload
+SHAPES = {
+    "wide": {"fanout": 500, "depth": 1, "payload": 256},
+    "deep": {"fanout": 3, "depth": 6, "payload": 256},
+    "large": {"fanout": 10, "depth": 1, "payload": 200 * 1024},
+}
+
+
+def get_paths(name, fanout, depth):
+    """ Lists paths of a tree shape, parents before children
+    """
+    paths = []
+    level = ["{0}/{1}/{2}".format(ROOT_PATH, MAPPING_ID, name)]
+    for _ in range(depth):
+        level = ["{0}/{1}".format(parent, index)
+                 for parent in level for index in range(fanout)]
+        paths.extend(level)
+    return sorted(paths, key=lambda path: path.count("/"))
+
+
+def get_payload(size, seed=0):
+    return {"value": "{0:x}".format(seed) * (size // 8 + 1)}
+
+
+class Timer(object):
+
+    """ Collects operation latencies
+    """
+
+    def __init__(self):
+        self.samples = []
+        self._total_start = None
+        self._total = 0
+
+    def __enter__(self):
+        self._total_start = time.perf_counter()
+        return self
+
+    def __exit__(self, *_):
+        self._total = time.perf_counter() - self._total_start
+
+    def time(self, func, *args, **kwargs):
+        start = time.perf_counter()
+        result = func(*args, **kwargs)
+        self.samples.append(time.perf_counter() - start)
+        return result
+
+    async def time_async(self, coroutine_function, *args, **kwargs):
+        start = time.perf_counter()
+        result = await coroutine_function(*args, **kwargs)
+        self.samples.append(time.perf_counter() - start)
+        return result
+
+    def report(self, operations=None):
+        operations = operations or len(self.samples)
+        samples = sorted(self.samples) or [self._total]
+        return {
+            "operations": operations,
+            "seconds": round(self._total, 6),
+            "ops_per_second": round(operations / self._total, 1)
+            if self._total else None,
+            "p50_ms": round(statistics.median(samples) * 1000, 3),
+            "p95_ms": round(samples[int(len(samples) * 0.95) - 1] * 1000, 3)
+            if len(samples) > 1 else round(samples[0] * 1000, 3),
+            "max_ms": round(samples[-1] * 1000, 3),
+        }
+
+
+def bench_shape(shape_name, fanout, depth, payload, proxy_options,
+                client_options):
+    """ Runs every operation against a tree shape
+
+    Returns:
+        dict: operation -> report
+    """
+    results = {}
+    name = shape_name
+    paths = get_paths(name, fanout, depth)
+    name_path = "{0}/{1}/{2}".format(ROOT_PATH, MAPPING_ID, name)
+    data = get_payload(payload)
+
+    with fake_kazoo_client(proxy_module, **client_options) as server:
+        zk = ZookeeperProxy(**proxy_options)
+        zk.connect("127.0.0.1", 2181, ROOT_PATH,
+                   logging.getLogger("benchmark"))
+        zk._zk.ensure_path(name_path)
+        try:
+            with Timer() as timer:
+                for path in paths:
+                    timer.time(zk.register, path, data)
+            results["register"] = timer.report()
+
+            with Timer() as timer:
+                with zk.batch():
+                    for path in paths:
+                        zk.register(path, get_payload(payload, 1))
+            results["register_batch"] = timer.report(len(paths))
+
+            with Timer() as timer:
+                for path in paths:
+                    timer.time(zk.fetch, path)
+            results["fetch"] = timer.report()
+
+            with Timer() as timer:
+                for _ in zk.fetch_many(paths):
+                    pass
+            results["fetch_many"] = timer.report(len(paths))
+
+            with Timer() as timer:
+                asyncio.run(AsyncZookeeperProxy(zk).fetch_many(paths))
+            results["async_fetch_many"] = timer.report(len(paths))
+
+            if depth == 1:
+                results["provider_fetch"] = \
+                    bench_provider_fetch(zk, name, len(paths))
+                results["async_provider_fetch"] = \
+                    bench_async_provider_fetch(zk, name, len(paths))
+
+            with Timer() as timer:
+                for path in paths:
+                    timer.time(zk.save, path, get_payload(payload, 2))
+            results["save"] = timer.report()
+
+            server.reset_requests()
+            with Timer() as timer:
+                timer.time(zk.remove, name_path)
+            results["remove"] = timer.report(len(paths) + 1)
+            results["remove"]["requests"] = sum(server.requests.values())
+        finally:
+            zk.disconnect()
+    return results
+
+
+def bench_provider_fetch(zk, name, children, repeat=3):
+    """ Measures provider fetch of a multiple configuration
+    """
+    ZookeeperConfigurationProvider.reset()
+    ZookeeperConfigurationProvider._set_proxy(zk)
+    ZookeeperConfigurationProvider._parse_mappings({"default": MAPPING_ID})
+    provider = ZookeeperConfigurationProvider(
+        SimpleNamespace(providers={"parallel_fetch": True}))
+    try:
+        with Timer() as timer:
+            for _ in range(repeat):
+                timer.time(provider.fetch, name)
+        return timer.report(children * repeat)
+    finally:
+        ZookeeperConfigurationProvider.reset()
+
+
+def bench_async_provider_fetch(zk, name, children, repeat=3):
+    """ Measures asyncio provider fetch of a multiple configuration, same
+    workload as bench_provider_fetch
+    """
+    AsyncZookeeperConfigurationProvider.reset()
+    AsyncZookeeperConfigurationProvider._set_proxy(zk)
+    AsyncZookeeperConfigurationProvider._parse_mappings(
+        {"default": MAPPING_ID})
+    provider = AsyncZookeeperConfigurationProvider(
+        SimpleNamespace(providers={}))
+
+    async def fetch(timer):
+        for _ in range(repeat):
+            await timer.time_async(provider.fetch, name)
+    try:
+        with Timer() as timer:
+            asyncio.run(fetch(timer))
+        return timer.report(children * repeat)
+    finally:
+        AsyncZookeeperConfigurationProvider.reset()
+
+
+def run(shapes, proxy_options, client_options):
+    return {shape: bench_shape(shape, proxy_options=proxy_options,
+                               client_options=client_options,
+                               **SHAPES[shape])
+            for shape in shapes}
+
+
+def print_results(results):
+    print("{0:<8} {1:<20} {2:>8} {3:>10} {4:>12} {5:>9} {6:>9} {7:>9}"
+          .format("shape", "operation", "ops", "seconds", "ops/s",
+                  "p50 ms", "p95 ms", "max ms"))
+    for shape, operations in results.items():
+        for operation, report in operations.items():
+            print("{0:<8} {1:<20} {2:>8} {3:>10} {4:>12} {5:>9} {6:>9} "
+                  "{7:>9}".format(shape, operation, report["operations"],
+                                  report["seconds"],
+                                  report["ops_per_second"],
+                                  report["p50_ms"], report["p95_ms"],
+                                  report["max_ms"]))
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip())
+    parser.add_argument("--shapes", nargs="+", default=sorted(SHAPES),
+                        choices=sorted(SHAPES))
+    parser.add_argument("--latency", type=float, default=0.0005,
+                        help="seconds each request takes")
+    parser.add_argument("--jitter", type=float, default=0.0,
+                        help="maximum random seconds added to latency")
+    parser.add_argument("--proxy-options", type=json.loads, default={},
+                        help="json object of ZookeeperProxy options")
+    parser.add_argument("--output", help="file to write json results to")
+    args = parser.parse_args(args)
+
+    results = run(args.shapes, args.proxy_options,
+                  {"latency": args.latency, "jitter": args.jitter,
+                   "seed": 0})
+    print_results(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+    return results
+
+
+if __name__ == "__main__":
+    main()
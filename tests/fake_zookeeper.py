@@ -0,0 +1,523 @@
+"""
+    In-process fake of the zookeeper server and kazoo client
+
+    Implements the kazoo client surface used by ZookeeperProxy on top of an
+    in-memory tree: reads, writes, transactions, one-shot watches and their
+    asynchronous variants. Each client may be given a per-request latency
+    and jitter, requests are applied in the order they are sent and their
+    results delivered once the latency elapses, so pipelined requests
+    overlap the way they do over a network connection.
+
+"""
+import heapq
+import random
+import time
+from collections import Counter
+from contextlib import contextmanager
+from threading import Condition, RLock, Thread
+from unittest.mock import patch
+
+from kazoo.client import KazooState
+from kazoo.exceptions import BadVersionError, ConnectionLoss, \
+    NoNodeError, NodeExistsError, NotEmptyError, RolledBackError
+from kazoo.handlers.threading import SequentialThreadingHandler
+from kazoo.protocol.states import EventType, KeeperState, WatchedEvent, \
+    ZnodeStat
+from kazoo.retry import KazooRetry
+
+
+# default zookeeper jute.maxbuffer
+JUTE_MAX_BUFFER = 0xfffff
+
+
+class _Node(object):
+
+    __slots__ = ["data", "czxid", "mzxid", "pzxid", "ctime", "mtime",
+                 "version", "cversion", "children"]
+
+    def __init__(self, data, zxid):
+        self.data = data
+        self.czxid = self.mzxid = self.pzxid = zxid
+        self.ctime = self.mtime = int(time.time() * 1000)
+        self.version = 0
+        self.cversion = 0
+        self.children = set()
+
+    @property
+    def stat(self):
+        return ZnodeStat(self.czxid, self.mzxid, self.ctime, self.mtime,
+                         self.version, self.cversion, 0, 0, len(self.data),
+                         len(self.children), self.pzxid)
+
+
+class FakeZookeeper(object):
+
+    """ In-memory zookeeper tree shared by fake clients
+    """
+
+    def __init__(self, max_buffer=JUTE_MAX_BUFFER):
+        self.max_buffer = max_buffer
+        self._lock = RLock()
+        self._zxid = 0
+        self._nodes = {"/": _Node(b"", 0)}
+        self._data_watches = {}
+        self._child_watches = {}
+        # number of requests received, by operation
+        self.requests = Counter()
+
+    @property
+    def nodes(self):
+        """ Copy of node data keyed by path
+        """
+        with self._lock:
+            return {path: node.data for path, node in self._nodes.items()}
+
+    def reset_requests(self):
+        self.requests.clear()
+
+    # operations, each returns (result, events to fire)
+
+    def get(self, path, watch=None):
+        with self._lock:
+            node = self._get_node(path)
+            if watch:
+                self._data_watches.setdefault(path, set()).add(watch)
+            return (node.data, node.stat), []
+
+    def exists(self, path, watch=None):
+        with self._lock:
+            if watch:
+                self._data_watches.setdefault(path, set()).add(watch)
+            node = self._nodes.get(path)
+            return (node.stat if node else None), []
+
+    def get_children(self, path, watch=None, include_data=False):
+        with self._lock:
+            node = self._get_node(path)
+            if watch:
+                self._child_watches.setdefault(path, set()).add(watch)
+            children = sorted(node.children)
+            return ((children, node.stat) if include_data else children), []
+
+    def create(self, path, value=b"", makepath=False):
+        with self._lock:
+            self._check_size(len(value))
+            events = []
+            if makepath:
+                parent = _parent(path)
+                if parent not in self._nodes:
+                    events.extend(self.create(parent, makepath=True)[1])
+            return path, events + self._create(path, value)
+
+    def set(self, path, value, version=-1):
+        with self._lock:
+            self._check_size(len(value))
+            return self._set(path, value, version)
+
+    def delete(self, path, version=-1, recursive=False):
+        with self._lock:
+            events = []
+            if recursive:
+                node = self._get_node(path)
+                for child in sorted(node.children):
+                    events.extend(self.delete(_join(path, child),
+                                              recursive=True)[1])
+            return True, events + self._delete(path, version)
+
+    def sync(self, path):
+        return path, []
+
+    def multi(self, operations):
+        """ Applies operations atomically
+
+        Returns:
+            tuple: (list of results, events to fire)
+        """
+        with self._lock:
+            self._check_size(sum(len(operation[2] or b"")
+                                 for operation in operations))
+            undo = []
+            events = []
+            results = []
+            for op, path, value, version in operations:
+                try:
+                    if op == "create":
+                        undo.append(("create", path, None))
+                        events.extend(self._create(path, value))
+                        results.append(path)
+                    elif op == "set":
+                        undo.append(("set", path, self._copy(path)))
+                        events.extend(self._set(path, value, version)[1])
+                        results.append(self._nodes[path].stat)
+                    elif op == "delete":
+                        undo.append(("delete", path, self._copy(path)))
+                        events.extend(self._delete(path, version))
+                        results.append(True)
+                    else:
+                        undo.append(("check", path, None))
+                        node = self._get_node(path)
+                        if version != node.version:
+                            raise BadVersionError()
+                        results.append(True)
+                except (NoNodeError, NodeExistsError, NotEmptyError,
+                        BadVersionError) as e:
+                    self._undo(undo[:len(results)])
+                    return [RolledBackError()] * len(results) + [e] + \
+                        [RolledBackError()] * \
+                        (len(operations) - len(results) - 1), []
+            return results, events
+
+    # internals
+
+    def _check_size(self, size):
+        if size > self.max_buffer:
+            # the server drops connections sending requests over the limit
+            raise ConnectionLoss("Request exceeds jute.maxbuffer")
+
+    def _get_node(self, path):
+        node = self._nodes.get(path)
+        if node is None:
+            raise NoNodeError()
+        return node
+
+    def _next_zxid(self):
+        self._zxid += 1
+        return self._zxid
+
+    def _create(self, path, value):
+        if path in self._nodes:
+            raise NodeExistsError()
+        parent = self._get_node(_parent(path))
+        zxid = self._next_zxid()
+        self._nodes[path] = _Node(value, zxid)
+        parent.children.add(path.rsplit("/", 1)[1])
+        parent.cversion += 1
+        parent.pzxid = zxid
+        return self._pop_watches(self._data_watches, path,
+                                 EventType.CREATED) + \
+            self._pop_watches(self._child_watches, _parent(path),
+                              EventType.CHILD)
+
+    def _set(self, path, value, version):
+        node = self._get_node(path)
+        if version not in (-1, node.version):
+            raise BadVersionError()
+        node.data = value
+        node.version += 1
+        node.mzxid = self._next_zxid()
+        node.mtime = int(time.time() * 1000)
+        return node.stat, self._pop_watches(self._data_watches, path,
+                                            EventType.CHANGED)
+
+    def _delete(self, path, version):
+        node = self._get_node(path)
+        if version not in (-1, node.version):
+            raise BadVersionError()
+        if node.children:
+            raise NotEmptyError()
+        del self._nodes[path]
+        parent = self._nodes[_parent(path)]
+        parent.children.discard(path.rsplit("/", 1)[1])
+        parent.cversion += 1
+        parent.pzxid = self._next_zxid()
+        return self._pop_watches(self._data_watches, path,
+                                 EventType.DELETED) + \
+            self._pop_watches(self._child_watches, path,
+                              EventType.DELETED) + \
+            self._pop_watches(self._child_watches, _parent(path),
+                              EventType.CHILD)
+
+    def _copy(self, path):
+        node = self._nodes.get(path)
+        if node is None:
+            return None
+        copy = _Node(node.data, node.czxid)
+        for attribute in _Node.__slots__:
+            setattr(copy, attribute, getattr(node, attribute))
+        copy.children = set(node.children)
+        return copy
+
+    def _undo(self, undo):
+        for op, path, previous in reversed(undo):
+            if op == "create":
+                self._nodes.pop(path, None)
+                self._nodes[_parent(path)].children.discard(
+                    path.rsplit("/", 1)[1])
+            elif op != "check" and previous is not None:
+                self._nodes[path] = previous
+                self._nodes[_parent(path)].children.add(
+                    path.rsplit("/", 1)[1])
+
+    @staticmethod
+    def _pop_watches(watches, path, event_type):
+        event = WatchedEvent(event_type, KeeperState.CONNECTED, path)
+        return [(watch, event) for watch in watches.pop(path, ())]
+
+
+class FakeTransactionRequest(object):
+
+    """ Fake of kazoo TransactionRequest
+    """
+
+    def __init__(self, client):
+        self._client = client
+        self.operations = []
+        self.committed = False
+
+    def create(self, path, value=b"", acl=None, ephemeral=False,
+               sequence=False):
+        self.operations.append(("create", path, value, -1))
+
+    def set_data(self, path, value, version=-1):
+        self.operations.append(("set", path, value, version))
+
+    def delete(self, path, version=-1):
+        self.operations.append(("delete", path, None, version))
+
+    def check(self, path, version):
+        self.operations.append(("check", path, None, version))
+
+    def commit_async(self):
+        if self.committed:
+            raise ValueError("Transaction already committed")
+        self.committed = True
+        return self._client._call("multi", self._client.server.multi,
+                                  self.operations)
+
+    def commit(self):
+        return self.commit_async().get()
+
+
+class FakeKazooClient(object):
+
+    """ Fake of the kazoo client bound to a FakeZookeeper
+
+    Args:
+        server (FakeZookeeper): tree to operate on
+        latency (float): seconds each request takes to complete
+        jitter (float): maximum random seconds added to latency
+        seed: random seed for jitter
+    """
+
+    def __init__(self, server=None, latency=0.0, jitter=0.0, seed=None,
+                 **_):
+        self.server = server or FakeZookeeper()
+        self.latency = latency
+        self.jitter = jitter
+        self.handler = SequentialThreadingHandler()
+        self.retry = KazooRetry(max_tries=1)
+        self.state = KazooState.LOST
+        self._random = random.Random(seed)
+        self._listeners = []
+        self._pending = []
+        self._sequence = 0
+        self._last_due = 0
+        self._condition = Condition()
+        self._connection = None
+
+    @property
+    def connected(self):
+        return self.state == KazooState.CONNECTED
+
+    # session
+
+    def start(self, timeout=15):
+        self.start_async().wait(timeout)
+
+    def start_async(self):
+        if self._connection is None:
+            self.handler.start()
+            self._connection = Thread(target=self._deliver, daemon=True)
+            self._connection.start()
+        self.set_state(KazooState.CONNECTED)
+        event = self.handler.event_object()
+        event.set()
+        return event
+
+    def stop(self):
+        if self._connection is not None:
+            with self._condition:
+                heapq.heappush(self._pending, (0, -1, None, None))
+                self._condition.notify()
+            self._connection.join()
+            self._connection = None
+            self.handler.stop()
+        self.set_state(KazooState.LOST)
+
+    def close(self):
+        pass
+
+    def add_listener(self, listener):
+        self._listeners.append(listener)
+
+    def remove_listener(self, listener):
+        if listener in self._listeners:
+            self._listeners.remove(listener)
+
+    def set_state(self, state):
+        """ Changes session state notifying listeners, as kazoo does
+        """
+        if state != self.state:
+            self.state = state
+            for listener in list(self._listeners):
+                listener(state)
+
+    # operations
+
+    def get(self, path, watch=None):
+        return self.get_async(path, watch).get()
+
+    def get_async(self, path, watch=None):
+        return self._call("get", self.server.get, path, watch)
+
+    def exists(self, path, watch=None):
+        return self.exists_async(path, watch).get()
+
+    def exists_async(self, path, watch=None):
+        return self._call("exists", self.server.exists, path, watch)
+
+    def get_children(self, path, watch=None, include_data=False):
+        return self.get_children_async(path, watch, include_data).get()
+
+    def get_children_async(self, path, watch=None, include_data=False):
+        return self._call("get_children", self.server.get_children, path,
+                          watch, include_data)
+
+    def create(self, path, value=b"", acl=None, ephemeral=False,
+               sequence=False, makepath=False, include_data=False):
+        return self.create_async(path, value, makepath=makepath).get()
+
+    def create_async(self, path, value=b"", acl=None, ephemeral=False,
+                     sequence=False, makepath=False, include_data=False):
+        return self._call("create", self.server.create, path, value,
+                          makepath)
+
+    def ensure_path(self, path, acl=None):
+        try:
+            self.create(path, makepath=True)
+        except NodeExistsError:
+            pass
+        return True
+
+    def set(self, path, value, version=-1):
+        return self.set_async(path, value, version).get()
+
+    def set_async(self, path, value, version=-1):
+        return self._call("set", self.server.set, path, value, version)
+
+    def delete(self, path, version=-1, recursive=False):
+        if recursive:
+            # kazoo walks the tree client side, one request at a time
+            try:
+                for child in self.get_children(path):
+                    self.delete(_join(path, child), recursive=True)
+                self.delete(path)
+            except NoNodeError:
+                pass
+            return True
+        return self.delete_async(path, version).get()
+
+    def delete_async(self, path, version=-1):
+        return self._call("delete", self.server.delete, path, version)
+
+    def sync(self, path):
+        return self.sync_async(path).get()
+
+    def sync_async(self, path):
+        return self._call("sync", self.server.sync, path)
+
+    def transaction(self):
+        return FakeTransactionRequest(self)
+
+    # request delivery
+
+    def _call(self, operation, func, *args):
+        """ Applies an operation, delivering its result after latency
+        """
+        self.server.requests[operation] += 1
+        result = self.handler.async_result()
+        if self.state != KazooState.CONNECTED:
+            result.set_exception(ConnectionLoss())
+            return result
+        try:
+            value, events = func(*args)
+            outcome = (value, None)
+        except Exception as e:
+            outcome = (None, e)
+            events = []
+        for watch, event in events:
+            self.handler.spawn(watch, event)
+
+        delay = self.latency
+        if self.jitter:
+            delay += self._random.uniform(0, self.jitter)
+        if delay <= 0:
+            self._complete(result, outcome)
+        else:
+            with self._condition:
+                # responses arrive in the order requests were sent
+                self._last_due = max(self._last_due,
+                                     time.monotonic() + delay)
+                self._sequence += 1
+                heapq.heappush(self._pending, (self._last_due,
+                                               self._sequence, result,
+                                               outcome))
+                self._condition.notify()
+        return result
+
+    @staticmethod
+    def _complete(result, outcome):
+        value, exception = outcome
+        if exception is not None:
+            result.set_exception(exception)
+        else:
+            result.set(value)
+
+    def _deliver(self):
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+                due, _, result, outcome = self._pending[0]
+                if result is None:
+                    # stopping, deliver whatever is left right away
+                    heapq.heappop(self._pending)
+                    remaining, self._pending = self._pending, []
+                    break
+                wait = due - time.monotonic()
+                if wait > 0:
+                    self._condition.wait(wait)
+                    continue
+                heapq.heappop(self._pending)
+            self._complete(result, outcome)
+        for _, _, result, outcome in sorted(remaining):
+            self._complete(result, outcome)
+
+
+@contextmanager
+def fake_kazoo_client(proxy_module, server=None, **client_kwargs):
+    """ Makes proxies connect to fake clients sharing the same server
+
+    Args:
+        proxy_module: module clients are created through
+        server (FakeZookeeper): tree clients operate on
+
+    Yields:
+        FakeZookeeper: server clients are bound to
+    """
+    server = server or FakeZookeeper()
+
+    def create_client(**kwargs):
+        kwargs.update(client_kwargs)
+        return FakeKazooClient(server, **kwargs)
+
+    with patch.object(proxy_module, "create_client", create_client):
+        yield server
+
+
+def _parent(path):
+    return path.rsplit("/", 1)[0] or "/"
+
+
+def _join(path, child):
+    return "{0}/{1}".format(path.rstrip("/"), child)
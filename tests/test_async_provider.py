@@ -0,0 +1,62 @@
+import asyncio
+import logging
+import unittest
+from types import SimpleNamespace
+
+try:
+    import kazoo
+    from ..async_provider import AsyncZookeeperConfigurationProvider
+    from ..proxy import ZookeeperProxy
+    from .. import proxy as proxy_module
+    from .fake_zookeeper import fake_kazoo_client
+    kazoo_installed = True
+except ImportError:
+    kazoo_installed = False
+
+from niocore.configuration import Configuration
+from niocore.testing.test_case import NIOCoreTestCaseNoModules
+
+
+@unittest.skipUnless(kazoo_installed, "kazoo is not installed")
+class TestAsyncZookeeperProvider(NIOCoreTestCaseNoModules):
+
+    def setUp(self):
+        super().setUp()
+        AsyncZookeeperConfigurationProvider.reset()
+
+    def tearDown(self):
+        AsyncZookeeperConfigurationProvider.reset()
+        super().tearDown()
+
+    def test_register_fetch_save_remove(self):
+        """ Asserts that awaitable provider operations are in sync
+        """
+        async def run(provider):
+            blocks = Configuration(name="blocks")
+            for name in ("b1", "b2", "b3"):
+                await provider.register(
+                    blocks, Configuration(data={"name": name}), name)
+
+            blocks = await provider.fetch("blocks", timeout=5)
+            self.assertEqual(blocks["b2"]["name"], "b2")
+            self.assertEqual(blocks["_private"].children, {"b1", "b2", "b3"})
+
+            blocks["b2"]["name"] = "changed"
+            await provider.save(blocks["b2"])
+            self.assertEqual((await provider.fetch("blocks"))["b2"]["name"],
+                             "changed")
+
+            await provider.remove(blocks)
+            self.assertNotIn("b1", await provider.fetch("blocks"))
+
+        with fake_kazoo_client(proxy_module, latency=0.001):
+            zk = ZookeeperProxy()
+            zk.connect("ip_address", 2181, "/root", logging.getLogger())
+            zk._zk.ensure_path("/root/1/blocks")
+            AsyncZookeeperConfigurationProvider._set_proxy(zk)
+            AsyncZookeeperConfigurationProvider._parse_mappings(
+                {"default": 1})
+            provider = AsyncZookeeperConfigurationProvider(
+                SimpleNamespace(providers={}))
+            asyncio.run(run(provider))
+            zk.disconnect()
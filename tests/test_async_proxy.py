@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import unittest
+from unittest.mock import patch
+
+try:
+    import kazoo
+    from kazoo.exceptions import ConnectionLoss
+    from ..async_proxy import AsyncZookeeperProxy
+    from ..proxy import ZookeeperProxy
+    from .. import proxy as proxy_module
+    from .fake_zookeeper import fake_kazoo_client
+    kazoo_installed = True
+except ImportError:
+    kazoo_installed = False
+
+from niocore.testing.test_case import NIOCoreTestCaseNoModules
+
+
+@unittest.skipUnless(kazoo_installed, "kazoo is not installed")
+class TestAsyncZookeeperProxy(NIOCoreTestCaseNoModules):
+
+    def setUp(self):
+        super().setUp()
+        self.logger = logging.getLogger('basic')
+
+    def test_operations(self):
+        """ Asserts that awaitable operations read and write the tree
+        """
+        async def run(zk):
+            await zk.register("/root/a", {"a": 1})
+            await zk.register("/root/a/b", {"b": 1})
+            await zk.register("/root/a/b/c", {"c": 1})
+            await zk.save("/root/a", {"a": 2})
+            self.assertEqual(await zk.fetch("/root/a"), {"a": 2})
+            self.assertEqual(await zk.get_children("/root/a"), ["b"])
+            self.assertEqual(
+                await zk.fetch_many(["/root/a/b", "/root/x", "/root/a"]),
+                [("/root/a/b", {"b": 1}), ("/root/x", {}),
+                 ("/root/a", {"a": 2})])
+            await zk.remove("/root/a")
+            self.assertIsNone(await zk.get_children("/root/a"))
+
+        with fake_kazoo_client(proxy_module, latency=0.001) as server:
+            proxy = ZookeeperProxy(cache_size=100)
+            proxy.connect("ip_address", 2181, "/root", self.logger)
+            asyncio.run(run(AsyncZookeeperProxy(proxy, max_in_flight=2)))
+            self.assertEqual(sorted(server.nodes), ["/", "/root"])
+            self.assertEqual(proxy.get_stats()["remove"]["a"][""]["calls"],
+                             1)
+            proxy.disconnect()
+
+    def test_write_behind(self):
+        """ Asserts that saves are queued and that removals discard them
+        """
+        async def run(zk):
+            await zk.register("/root/a", {"a": 1})
+            await zk.save("/root/a", {"a": 2})
+            self.assertEqual(await zk.fetch("/root/a"), {"a": 2})
+            self.assertEqual(server.nodes["/root/a"], b'{"a": 1}')
+            await zk.remove("/root/a")
+
+        with fake_kazoo_client(proxy_module) as server:
+            proxy = ZookeeperProxy(write_behind_interval=60)
+            proxy.connect("ip_address", 2181, "/root", self.logger)
+            asyncio.run(run(AsyncZookeeperProxy(proxy)))
+            self.assertEqual(proxy.flush(), 0)
+            self.assertNotIn("/root/a", server.nodes)
+            proxy.disconnect()
+
+    def test_retry(self):
+        """ Asserts that reads and writes failing because the connection
+        was lost are retried, a versioned write applied already succeeding
+        """
+        async def run(zk):
+            await zk.register("/root/a", {"a": 1})
+            version = proxy.get_version("/root/a")
+            with patch.object(server, "get", fail_once(server.get)), \
+                    patch.object(server, "set", fail_once(server.set)):
+                self.assertEqual(await zk.fetch("/root/a"), {"a": 1})
+                await zk.save("/root/a", {"a": 2}, version=version)
+            self.assertEqual(server.nodes["/root/a"], b'{"a": 2}')
+            self.assertEqual(proxy.get_version("/root/a"), version + 1)
+
+        def fail_once(func):
+            # applied, response lost
+            failed = []
+
+            def call(*args):
+                result = func(*args)
+                if not failed:
+                    failed.append(True)
+                    raise ConnectionLoss()
+                return result
+            return call
+
+        with fake_kazoo_client(proxy_module) as server:
+            proxy = ZookeeperProxy(track_versions=True, retry_max_tries=2,
+                                   retry_delay=0.001)
+            proxy.connect("ip_address", 2181, "/root", self.logger)
+            asyncio.run(run(AsyncZookeeperProxy(proxy)))
+            proxy.disconnect()
+
+    def test_timeout(self):
+        """ Asserts that operations time out and late results are discarded
+        """
+        async def run(zk):
+            with self.assertRaises(asyncio.TimeoutError):
+                await zk.fetch("/root", timeout=0.01)
+            # result arriving after cancellation is ignored
+            await asyncio.sleep(0.3)
+            self.assertEqual(await zk.fetch("/root/a", timeout=1), {})
+
+        with fake_kazoo_client(proxy_module, latency=0.2):
+            proxy = ZookeeperProxy()
+            proxy.connect("ip_address", 2181, "/root", self.logger)
+            asyncio.run(run(AsyncZookeeperProxy(proxy)))
+            self.assertEqual(proxy.get_stats()["fetch"][""][""]["errors"], 1)
+            proxy.disconnect()
@@ -0,0 +1,113 @@
+import unittest
+from unittest.mock import Mock
+
+try:
+    import kazoo
+    from kazoo.exceptions import NoNodeError, NodeExistsError, \
+        RolledBackError
+    from ..batch import ZookeeperBatch
+    kazoo_installed = True
+except ImportError:
+    kazoo_installed = False
+
+from niocore.testing.test_case import NIOCoreTestCaseNoModules
+
+
+class MyTransaction(object):
+    def __init__(self, client):
+        self._client = client
+        self.operations = []
+
+    def create(self, node_path, data):
+        self.operations.append(("create", node_path, data))
+
+    def set_data(self, node_path, data, version=-1):
+        self.operations.append(("set", node_path, data))
+
+    def delete(self, node_path):
+        self.operations.append(("delete", node_path, None))
+
+    def commit(self):
+        for node_path in self._client.created_concurrently:
+            self._client.nodes[node_path] = []
+        self._client.transactions.append(self.operations)
+        results = self._client.results.pop(0) \
+            if self._client.results else [True] * len(self.operations)
+        return results
+
+
+class MyTransactionKazooClient(object):
+    def __init__(self, nodes):
+        # node path -> children
+        self.nodes = nodes
+        self.transactions = []
+        self.results = []
+        self.created_concurrently = []
+
+    def exists_async(self, node_path):
+        return Mock(get=Mock(
+            return_value="stat" if node_path in self.nodes else None))
+
+    def get_children_async(self, node_path):
+        if node_path not in self.nodes:
+            return Mock(get=Mock(side_effect=NoNodeError()))
+        return Mock(get=Mock(return_value=self.nodes[node_path]))
+
+    def transaction(self):
+        return MyTransaction(self)
+
+
+@unittest.skipUnless(kazoo_installed, "kazoo is not installed")
+class TestZookeeperBatch(NIOCoreTestCaseNoModules):
+
+    def test_resolve(self):
+        """ Asserts operations translation into a single transaction
+        """
+        client = MyTransactionKazooClient({"/a": [], "/r": ["c"],
+                                           "/r/c": []})
+        batch = ZookeeperBatch(client)
+        batch.register("/a", b"a")
+        batch.register("/b", b"b")
+        batch.save("/a", b"a2")
+        batch.remove("/r")
+
+        self.assertEqual(batch.commit(), 1)
+        self.assertEqual(client.transactions, [[
+            ("set", "/a", b"a"),
+            ("create", "/b", b"b"),
+            ("set", "/a", b"a2"),
+            ("delete", "/r/c", None),
+            ("delete", "/r", None)]])
+
+    def test_chunks(self):
+        """ Asserts that transactions are split by size
+        """
+        client = MyTransactionKazooClient({})
+        batch = ZookeeperBatch(client, max_bytes=400)
+        for i in range(5):
+            batch.register("/n{}".format(i), b"x" * 100)
+
+        self.assertEqual(batch.commit(), 3)
+        self.assertEqual([len(t) for t in client.transactions], [2, 2, 1])
+
+    def test_failure(self):
+        """ Asserts that a failed operation is raised, retrying creates once
+        """
+        client = MyTransactionKazooClient({})
+        client.results = [[NodeExistsError(), RolledBackError()],
+                          [True, True]]
+        batch = ZookeeperBatch(client)
+        batch.register("/a", b"a")
+        batch.register("/b", b"b")
+        # node is created by someone else after being resolved
+        client.created_concurrently = ["/a"]
+        batch.commit()
+        # retried with the node resolved as existing
+        self.assertEqual(client.transactions[1], [("set", "/a", b"a"),
+                                                  ("create", "/b", b"b")])
+
+        client.results = [[RolledBackError(), NoNodeError()]]
+        batch.save("/a", b"a")
+        batch.save("/b", b"b")
+        with self.assertRaises(NoNodeError):
+            batch.commit()
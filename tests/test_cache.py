@@ -0,0 +1,46 @@
+from niocore.testing.test_case import NIOCoreTestCaseNoModules
+
+from ..cache import ZookeeperCache, DATA, CHILDREN
+
+
+class TestZookeeperCache(NIOCoreTestCaseNoModules):
+
+    def test_lru_eviction(self):
+        """ Asserts that least recently used entries are evicted first
+        """
+        cache = ZookeeperCache(max_size=2)
+        cache.put(DATA, "/a", "a", cache.generation)
+        cache.put(DATA, "/b", "b", cache.generation)
+        # touch "/a" so that "/b" becomes the least recently used
+        self.assertEqual(cache.get(DATA, "/a"), (True, "a"))
+        cache.put(CHILDREN, "/a", ["c"], cache.generation)
+
+        self.assertEqual(cache.get(DATA, "/b"), (False, None))
+        self.assertEqual(cache.get(CHILDREN, "/a"), (True, ["c"]))
+        stats = cache.get_stats()
+        self.assertEqual(stats["size"], 2)
+        self.assertEqual(stats["evictions"], 1)
+        self.assertEqual(stats["hits"], 2)
+        self.assertEqual(stats["misses"], 1)
+
+    def test_invalidation(self):
+        """ Asserts invalidation and that reads racing a watch are not cached
+        """
+        cache = ZookeeperCache()
+        cache.put(DATA, "/a", "a", cache.generation)
+        cache.put(DATA, "/a/b", "b", cache.generation)
+        cache.put(DATA, "/ab", "ab", cache.generation)
+
+        generation = cache.generation
+        cache.invalidate_tree("/a")
+        self.assertEqual(cache.get(DATA, "/a"), (False, None))
+        self.assertEqual(cache.get(DATA, "/a/b"), (False, None))
+        self.assertEqual(cache.get(DATA, "/ab"), (True, "ab"))
+        self.assertEqual(cache.get_stats()["invalidations"], 2)
+
+        # a read issued before the invalidation is discarded
+        self.assertFalse(cache.put(DATA, "/a", "stale", generation))
+        self.assertEqual(cache.get(DATA, "/a"), (False, None))
+
+        cache.clear()
+        self.assertEqual(len(cache), 0)
@@ -0,0 +1,33 @@
+from niocore.testing.test_case import NIOCoreTestCaseNoModules
+
+from ..chunks import ChunkManifest, ChunkMismatchError
+
+
+class TestChunkManifest(NIOCoreTestCaseNoModules):
+
+    def test_create_join(self):
+        """ Asserts that a payload is split and put back together
+        """
+        payload = bytes(range(256)) * 10
+        manifest, chunks = ChunkManifest.create(payload, 1000)
+        self.assertEqual(len(chunks), 3)
+        self.assertEqual(manifest.chunks, 3)
+
+        data = manifest.encode()
+        self.assertTrue(ChunkManifest.is_manifest(data))
+        self.assertFalse(ChunkManifest.is_manifest(payload))
+        decoded = ChunkManifest.decode(data)
+        self.assertEqual(decoded.write_id, manifest.write_id)
+        self.assertEqual(decoded.join(chunks), payload)
+        self.assertTrue(ChunkManifest.is_write_id(manifest.write_id))
+        self.assertFalse(ChunkManifest.is_write_id("services"))
+
+    def test_mismatch(self):
+        """ Asserts that chunks from a different write are rejected
+        """
+        manifest, chunks = ChunkManifest.create(b"a" * 100, 10)
+        _, other_chunks = ChunkManifest.create(b"b" * 100, 10)
+        with self.assertRaises(ChunkMismatchError):
+            manifest.join(chunks[:5] + other_chunks[5:])
+        with self.assertRaises(ChunkMismatchError):
+            manifest.join(chunks[:-1])
@@ -0,0 +1,70 @@
+import json
+import unittest
+
+from niocore.testing.test_case import NIOCoreTestCaseNoModules
+
+from ..codec import ZookeeperCodec, MAGIC
+
+try:
+    import msgpack
+    msgpack_installed = True
+except ImportError:
+    msgpack_installed = False
+
+
+class TestZookeeperCodec(NIOCoreTestCaseNoModules):
+
+    def setUp(self):
+        super().setUp()
+        self.data = {"key{}".format(i): "value" for i in range(100)}
+        self.payload = json.dumps(self.data).encode()
+
+    def test_compression(self):
+        """ Asserts that payloads over the threshold are compressed
+        """
+        for compression in ["zlib", "bz2", "lzma"]:
+            codec = ZookeeperCodec(compression, threshold=100)
+            encoded = codec.encode(self.data)
+            self.assertTrue(encoded.startswith(MAGIC))
+            self.assertLess(len(encoded), len(self.payload))
+            self.assertEqual(codec.decode(encoded), self.data)
+
+        # small payloads are kept as they are
+        codec = ZookeeperCodec("zlib", threshold=len(self.payload) + 1)
+        self.assertEqual(codec.encode(self.data), self.payload)
+
+    def test_detection(self):
+        """ Asserts that plain and compressed data are read by any codec
+        """
+        compressed = ZookeeperCodec("zlib", threshold=0).encode(self.data)
+        plain = ZookeeperCodec().encode(self.data)
+        self.assertEqual(plain, self.payload)
+
+        for codec in [ZookeeperCodec(), ZookeeperCodec("lzma"),
+                      ZookeeperCodec(serializer="orjson")]:
+            self.assertEqual(codec.decode(compressed), self.data)
+            self.assertEqual(codec.decode(plain), self.data)
+
+        with self.assertRaises(ValueError):
+            ZookeeperCodec().decode(MAGIC + b"\x09\x01")
+        with self.assertRaises(ValueError):
+            ZookeeperCodec("unknown")
+        with self.assertRaises(ValueError):
+            ZookeeperCodec(serializer="unknown")
+
+    def test_orjson(self):
+        """ Asserts that orjson writes plain json
+        """
+        codec = ZookeeperCodec(serializer="orjson")
+        self.assertEqual(json.loads(codec.encode(self.data).decode()),
+                         self.data)
+
+    @unittest.skipUnless(msgpack_installed, "msgpack is not installed")
+    def test_msgpack(self):
+        """ Asserts that msgpack data is tagged and read by any codec
+        """
+        for compression in ["none", "zlib"]:
+            encoded = ZookeeperCodec(compression, threshold=0,
+                                     serializer="msgpack").encode(self.data)
+            self.assertTrue(encoded.startswith(MAGIC))
+            self.assertEqual(ZookeeperCodec().decode(encoded), self.data)
@@ -0,0 +1,33 @@
+from niocore.testing.test_case import NIOCoreTestCaseNoModules
+
+from ..dedup import BlobCache, is_reference, encode_reference, \
+    decode_reference
+
+
+class TestDedup(NIOCoreTestCaseNoModules):
+
+    def test_reference(self):
+        """ Asserts that references are told apart from node data
+        """
+        reference = encode_reference("ab12")
+        self.assertTrue(is_reference(reference))
+        self.assertEqual(decode_reference(reference), "ab12")
+        self.assertFalse(is_reference(b'{"a": 1}'))
+        self.assertFalse(is_reference(b""))
+        self.assertFalse(is_reference(None))
+
+    def test_blob_cache(self):
+        """ Asserts that payloads are cached as stored and evicted beyond
+        max size
+        """
+        cache = BlobCache(max_size=2)
+        cache.put("a", b'{"values": [1, 2]}')
+        self.assertEqual(cache.get("a"), (True, b'{"values": [1, 2]}'))
+
+        cache.put("b", b"")
+        cache.get("a")
+        cache.put("c", b"")
+        self.assertEqual(cache.get("b"), (False, None))
+        self.assertTrue(cache.get("a")[0])
+        self.assertEqual(len(cache), 2)
+        self.assertEqual((cache.hits, cache.misses), (3, 1))
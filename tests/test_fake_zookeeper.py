@@ -0,0 +1,103 @@
+import time
+import unittest
+from threading import Event
+
+try:
+    import kazoo
+    from kazoo.exceptions import NoNodeError, NodeExistsError, \
+        RolledBackError
+    from kazoo.protocol.states import EventType
+    from .fake_zookeeper import FakeKazooClient, FakeZookeeper
+    kazoo_installed = True
+except ImportError:
+    kazoo_installed = False
+
+from niocore.testing.test_case import NIOCoreTestCaseNoModules
+
+
+@unittest.skipUnless(kazoo_installed, "kazoo is not installed")
+class TestFakeZookeeper(NIOCoreTestCaseNoModules):
+
+    def setUp(self):
+        super().setUp()
+        self.client = FakeKazooClient()
+        self.client.start()
+
+    def tearDown(self):
+        self.client.stop()
+        super().tearDown()
+
+    def test_operations(self):
+        """ Asserts basic node operations and stats
+        """
+        client = self.client
+        client.ensure_path("/root/a")
+        client.create("/root/a/b", b"data")
+        with self.assertRaises(NodeExistsError):
+            client.create("/root/a/b")
+        with self.assertRaises(NoNodeError):
+            client.create("/missing/b")
+
+        data, stat = client.get("/root/a/b")
+        self.assertEqual((data, stat.version), (b"data", 0))
+        stat = client.set("/root/a/b", b"new")
+        self.assertEqual(stat.version, 1)
+        children, stat = client.get_children("/root/a", include_data=True)
+        self.assertEqual(children, ["b"])
+        self.assertEqual(stat.numChildren, 1)
+
+        client.delete("/root", recursive=True)
+        self.assertIsNone(client.exists("/root"))
+        self.assertEqual(client.server.requests["get"], 1)
+
+    def test_watches(self):
+        """ Asserts that watches fire once
+        """
+        client = self.client
+        client.create("/a", b"")
+        events = []
+        fired = Event()
+
+        def watch(event):
+            events.append(event)
+            fired.set()
+
+        client.get("/a", watch=watch)
+        client.set("/a", b"1")
+        self.assertTrue(fired.wait(1))
+        fired.clear()
+        client.set("/a", b"2")
+        client.get_children("/a", watch=watch)
+        client.create("/a/b")
+        self.assertTrue(fired.wait(1))
+        self.assertEqual([event.type for event in events],
+                         [EventType.CHANGED, EventType.CHILD])
+
+    def test_transaction(self):
+        """ Asserts that a failing transaction is rolled back
+        """
+        client = self.client
+        client.create("/a", b"a")
+        transaction = client.transaction()
+        transaction.create("/b", b"b")
+        transaction.set_data("/a", b"a2")
+        transaction.create("/a", b"again")
+        results = transaction.commit()
+        self.assertIsInstance(results[0], RolledBackError)
+        self.assertIsInstance(results[2], NodeExistsError)
+        self.assertIsNone(client.exists("/b"))
+        self.assertEqual(client.get("/a")[0], b"a")
+
+    def test_latency(self):
+        """ Asserts that pipelined requests overlap their latency
+        """
+        client = FakeKazooClient(FakeZookeeper(), latency=0.05)
+        client.start()
+        try:
+            start = time.monotonic()
+            requests = [client.exists_async("/") for _ in range(10)]
+            for request in requests:
+                request.get()
+            self.assertLess(time.monotonic() - start, 0.25)
+        finally:
+            client.stop()
@@ -0,0 +1,47 @@
+from unittest.mock import Mock
+
+from niocore.configuration import Configuration
+from niocore.testing.test_case import NIOCoreTestCaseNoModules
+
+from ..lazy import get_lazy_class, read_ahead
+
+
+class TestLazyConfiguration(NIOCoreTestCaseNoModules):
+
+    def test_load_on_access(self):
+        """ Asserts that children are loaded once, when first accessed
+        """
+        lazy_class = get_lazy_class(Configuration)
+        self.assertIs(get_lazy_class(Configuration), lazy_class)
+        config = lazy_class(name="blocks", fetch_on_create=False)
+        loader = Mock(side_effect=lambda child: {"name": child})
+        config.set_loader(["b1", "b2"], loader)
+
+        self.assertIn("b1", config)
+        self.assertFalse(loader.called)
+        self.assertEqual(config.get("b1"), {"name": "b1"})
+        self.assertEqual(config["b1"], {"name": "b1"})
+        self.assertEqual(loader.call_count, 1)
+        self.assertEqual(dict(config.items()),
+                         {"b1": {"name": "b1"}, "b2": {"name": "b2"}})
+        self.assertEqual(loader.call_count, 2)
+        self.assertIsNone(config.get("b3"))
+
+    def test_read_ahead(self):
+        """ Asserts that read ahead fills pending children only
+        """
+        config = get_lazy_class(Configuration)(name="blocks",
+                                               fetch_on_create=False)
+        config.set_loader(["b1", "b2"],
+                          lambda child: {"name": child, "loaded": True})
+        self.assertTrue(config["b1"]["loaded"])
+
+        def fetch_many(children):
+            self.assertEqual(children, ["b2"])
+            for child in children:
+                yield child, {"name": child, "read_ahead": True}
+
+        read_ahead(config, fetch_many, Mock()).join(1)
+        self.assertEqual(config.get_pending(), [])
+        self.assertTrue(config["b2"]["read_ahead"])
+        self.assertTrue(config["b1"]["loaded"])
@@ -1,9 +1,21 @@
+import os
+import tempfile
+import time
 import unittest
+from threading import Event, Thread
 from unittest.mock import Mock, patch
 
 try:
     import kazoo
     from ..provider import ZookeeperProxy
+    from .. import proxy as proxy_module
+    from .fake_zookeeper import fake_kazoo_client, FakeZookeeper, \
+        FakeKazooClient
+    from kazoo.exceptions import BadVersionError, ConnectionLoss, \
+        NoNodeError
+    from kazoo.handlers.threading import KazooTimeoutError
+    from kazoo.protocol.states import KazooState
+    from ..resilience import StaleData, StaleChildren
     kazoo_installed = True
 except:
     kazoo_installed = False
@@ -19,12 +31,103 @@ class MyKazooClient(object):
         self.stop = Mock()
         self._data_set = None
 
-    def set(self, _, data):
+    def set(self, _, data, version=-1):
         self._data_set = data
 
-    def get(self, _):
+    def get(self, _, watch=None):
         return self._data_set, "stat"
 
+    def get_children_async(self, _, watch=None):
+        from kazoo.exceptions import NoNodeError
+        return MyAsyncResult(exception=NoNodeError())
+
+
+class MyAsyncResult(object):
+    def __init__(self, value=None, exception=None):
+        self._value = value
+        self._exception = exception
+
+    def get(self):
+        if self._exception:
+            raise self._exception
+        return self._value
+
+    def rawlink(self, callback):
+        callback(self)
+
+
+class MyNodesKazooClient(MyKazooClient):
+    """ Keeps nodes data and versions keyed by path """
+    def __init__(self):
+        super().__init__()
+        self._nodes = {}
+        self._versions = {}
+        self.writes = 0
+
+    def get(self, node_path, watch=None):
+        from kazoo.exceptions import NoNodeError
+        if node_path not in self._nodes:
+            raise NoNodeError()
+        return self._nodes[node_path], self.exists(node_path)
+
+    def get_async(self, node_path, watch=None):
+        try:
+            return MyAsyncResult(self.get(node_path))
+        except Exception as e:
+            return MyAsyncResult(exception=e)
+
+    def exists(self, node_path):
+        if node_path in self._nodes:
+            return Mock(version=self._versions[node_path])
+
+    def create(self, node_path, data):
+        self.writes += 1
+        self._nodes[node_path] = data
+        self._versions[node_path] = 0
+
+    def create_async(self, node_path, data):
+        self.create(node_path, data)
+        return MyAsyncResult()
+
+    def set(self, node_path, data, version=-1):
+        from kazoo.exceptions import BadVersionError
+        stat = self.get(node_path)[1]
+        if version not in (-1, stat.version):
+            raise BadVersionError()
+        self.writes += 1
+        self._nodes[node_path] = data
+        self._versions[node_path] += 1
+        return self.exists(node_path)
+
+    def delete(self, node_path, recursive=False):
+        for path in list(self._nodes):
+            if path == node_path or path.startswith(node_path + "/"):
+                del self._nodes[path]
+
+    def get_children_async(self, node_path):
+        prefix = node_path + "/"
+        return MyAsyncResult(sorted({
+            path[len(prefix):].split("/")[0] for path in self._nodes
+            if path.startswith(prefix)}))
+
+    def delete_async(self, node_path):
+        self._nodes.pop(node_path, None)
+        return MyAsyncResult()
+
+
+class MyAsyncKazooClient(MyKazooClient):
+    def __init__(self):
+        super().__init__()
+        self._nodes = {}
+        self.requested = []
+
+    def get_async(self, node_path, watch=None):
+        self.requested.append(node_path)
+        if node_path in self._nodes:
+            return MyAsyncResult((self._nodes[node_path], "stat"))
+        from kazoo.exceptions import NoNodeError
+        return MyAsyncResult(exception=NoNodeError())
+
 
 @unittest.skipUnless(kazoo_installed, "kazoo is not installed")
 class TestZookeeperProxy(NIOCoreTestCaseNoModules):
@@ -35,7 +138,7 @@ class TestZookeeperProxy(NIOCoreTestCaseNoModules):
         logging.basicConfig()
         self.logger = logging.getLogger('basic')
 
-    @patch(ZookeeperProxy.__module__ + ".KazooClient")
+    @patch(ZookeeperProxy.__module__ + ".create_client")
     def test_connect_disconnect(self, kazoo_client_mock):
 
         """ Asserts that connect/disconnect setup and cleanup as expected
@@ -71,7 +174,7 @@ class TestZookeeperProxy(NIOCoreTestCaseNoModules):
         # disconnecting more than once is ignored
         self.assertEqual(kazoo_client.stop.call_count, 1)
 
-    @patch(ZookeeperProxy.__module__ + ".KazooClient")
+    @patch(ZookeeperProxy.__module__ + ".create_client")
     def test_save_fetch(self, kazoo_client_mock):
         """ Asserts that save and fetch are in sync
 
@@ -96,3 +199,675 @@ class TestZookeeperProxy(NIOCoreTestCaseNoModules):
 
         # assert that data retrieved has been transformed back.
         self.assertEqual(data_retrieved, data)
+
+    @patch(ZookeeperProxy.__module__ + ".create_client")
+    def test_fetch_many(self, kazoo_client_mock):
+        """ Asserts that fetch_many pipelines gets and handles missing nodes
+        """
+        zk = ZookeeperProxy()
+        kazoo_client = MyAsyncKazooClient()
+        kazoo_client_mock.return_value = kazoo_client
+        zk.connect("ip_address", 2181, "unused_path", self.logger)
+
+        kazoo_client._nodes["/a"] = b'{"a": 1}'
+        kazoo_client._nodes["/c"] = b'{"c": 3}'
+
+        results = zk.fetch_many(["/a", "/b", "/c"], max_in_flight=2)
+        # requests are issued lazily, bounded by max_in_flight
+        self.assertEqual(next(results), ("/a", {"a": 1}))
+        self.assertEqual(kazoo_client.requested, ["/a", "/b"])
+        # missing nodes are returned as empty data, same as fetch
+        self.assertEqual(list(results), [("/b", {}), ("/c", {"c": 3})])
+
+    @patch(ZookeeperProxy.__module__ + ".create_client")
+    def test_cache(self, kazoo_client_mock):
+        """ Asserts that cached reads skip zookeeper until invalidated
+        """
+        from kazoo.client import KazooState
+        from kazoo.protocol.states import EventType, WatchedEvent
+
+        zk = ZookeeperProxy(cache_size=100)
+        kazoo_client = MyKazooClient()
+        kazoo_client.get = Mock(return_value=(b'{"a": 1}', "stat"))
+        kazoo_client.get_children = Mock(return_value=["child"])
+        kazoo_client_mock.return_value = kazoo_client
+        zk.connect("ip_address", 2181, "unused_path", self.logger)
+
+        for _ in range(3):
+            self.assertEqual(zk.fetch("/node"), {"a": 1})
+            self.assertEqual(zk.get_children("/node"), ["child"])
+        self.assertEqual(kazoo_client.get.call_count, 1)
+        self.assertEqual(kazoo_client.get_children.call_count, 1)
+        self.assertEqual(zk.cache.hits, 4)
+
+        # data watch fired, data is read again
+        watch = kazoo_client.get.call_args[1]["watch"]
+        watch(WatchedEvent(EventType.CHANGED, None, "/node"))
+        zk.fetch("/node")
+        self.assertEqual(kazoo_client.get.call_count, 2)
+
+        # a suspended session flushes the cache
+        zk.listener(KazooState.SUSPENDED)
+        zk.get_children("/node")
+        self.assertEqual(kazoo_client.get_children.call_count, 2)
+
+        # local writes invalidate right away
+        zk.save("/node", {"a": 2})
+        zk.fetch("/node")
+        self.assertEqual(kazoo_client.get.call_count, 3)
+
+    @patch(ZookeeperProxy.__module__ + ".create_client")
+    def test_batch(self, kazoo_client_mock):
+        """ Asserts that writes within a batch are deferred to its commit
+        """
+        zk = ZookeeperProxy()
+        kazoo_client = MyKazooClient()
+        kazoo_client.set = Mock()
+        kazoo_client_mock.return_value = kazoo_client
+        zk.connect("ip_address", 2181, "unused_path", self.logger)
+
+        with patch(ZookeeperProxy.__module__ + ".ZookeeperBatch") as batch:
+            with zk.batch():
+                zk.save("/a", {"a": 1})
+                # nested batches join the one in progress
+                with zk.batch():
+                    zk.remove("/b")
+            self.assertFalse(kazoo_client.set.called)
+            batch.return_value.save.assert_called_once_with(
+                "/a", b'{"a": 1}', None)
+            batch.return_value.remove.assert_any_call("/b")
+            self.assertEqual(batch.return_value.commit.call_count, 1)
+
+            # nothing is sent when the batch context fails
+            with self.assertRaises(ValueError):
+                with zk.batch():
+                    raise ValueError()
+            self.assertEqual(batch.return_value.commit.call_count, 1)
+
+        zk.save("/a", {"a": 1})
+        self.assertTrue(kazoo_client.set.called)
+
+    @patch(ZookeeperProxy.__module__ + ".create_client")
+    def test_chunked_save_fetch(self, kazoo_client_mock):
+        """ Asserts that large data is stored as chunks and read back
+        """
+        zk = ZookeeperProxy(max_node_bytes=100)
+        kazoo_client = MyNodesKazooClient()
+        kazoo_client_mock.return_value = kazoo_client
+        zk.connect("ip_address", 2181, "/root", self.logger)
+
+        data = {"entry{}".format(i): "value" for i in range(50)}
+        zk.register("/root/1/services/big", data)
+        nodes = kazoo_client._nodes
+        chunk_paths = [path for path in nodes
+                       if path.startswith("/root/.chunks/1/services/big/")]
+        self.assertGreater(len(chunk_paths), 1)
+        self.assertTrue(all(len(nodes[path]) <= 100 for path in chunk_paths))
+        self.assertEqual(zk.fetch("/root/1/services/big"), data)
+        self.assertEqual(list(zk.fetch_many(["/root/1/services/big"])),
+                         [("/root/1/services/big", data)])
+
+        # saving replaces previous chunks
+        data["entry0"] = "new value"
+        zk.save("/root/1/services/big", data)
+        self.assertEqual(zk.fetch("/root/1/services/big"), data)
+        self.assertTrue(all(path not in nodes for path in chunk_paths))
+
+        # chunks are removed when data no longer needs them
+        zk.save("/root/1/services/big", {"small": 1})
+        self.assertEqual(zk.fetch("/root/1/services/big"), {"small": 1})
+        self.assertEqual(list(nodes), ["/root/1/services/big"])
+        zk.save("/root/1/services/big", data)
+
+        # removing also removes chunks
+        zk.remove("/root/1/services/big")
+        self.assertEqual(nodes, {})
+
+    @patch(ZookeeperProxy.__module__ + ".create_client")
+    def test_write_elision(self, kazoo_client_mock):
+        """ Asserts that unchanged data is not written again
+        """
+        zk = ZookeeperProxy(write_elision=True)
+        kazoo_client = MyNodesKazooClient()
+        kazoo_client_mock.return_value = kazoo_client
+        zk.connect("ip_address", 2181, "/root", self.logger)
+
+        zk.register("/root/node", {"a": 1})
+        zk.save("/root/node", {"a": 1})
+        self.assertEqual(kazoo_client.writes, 1)
+        self.assertEqual(zk.elided_writes, 1)
+
+        zk.save("/root/node", {"a": 2})
+        self.assertEqual(kazoo_client.writes, 2)
+        self.assertEqual(zk.get_version("/root/node"), 1)
+
+        # node modified by someone else is written even if data matches
+        kazoo_client.set("/root/node", b'{"a": 3}')
+        zk.save("/root/node", {"a": 2})
+        self.assertEqual(kazoo_client.writes, 4)
+
+    @patch(ZookeeperProxy.__module__ + ".create_client")
+    def test_conditional_save(self, kazoo_client_mock):
+        """ Asserts that a save fails when node version does not match
+        """
+        from kazoo.exceptions import BadVersionError
+
+        zk = ZookeeperProxy(track_versions=True)
+        kazoo_client = MyNodesKazooClient()
+        kazoo_client_mock.return_value = kazoo_client
+        zk.connect("ip_address", 2181, "/root", self.logger)
+
+        zk.register("/root/node", {"a": 1})
+        zk.fetch("/root/node")
+        version = zk.get_version("/root/node")
+        zk.save("/root/node", {"a": 2}, version=version)
+        with self.assertRaises(BadVersionError):
+            zk.save("/root/node", {"a": 3}, version=version)
+        self.assertEqual(zk.fetch("/root/node"), {"a": 2})
+
+    def test_warm_cache_fake_zookeeper(self):
+        """ Asserts that a warm cache serves a tree with no requests
+        """
+        with fake_kazoo_client(proxy_module) as server:
+            zk = ZookeeperProxy(cache_size=100)
+            zk.connect("ip_address", 2181, "/root", self.logger)
+            for child in range(3):
+                zk._zk.create("/root/{}".format(child), b'{"a": 1}')
+
+            for _ in range(2):
+                server.reset_requests()
+                children = zk.get_children("/root")
+                data = list(zk.fetch_many(
+                    "/root/{}".format(child) for child in children))
+            self.assertEqual(len(data), 3)
+            self.assertEqual(sum(server.requests.values()), 0)
+            zk.disconnect()
+
+    def test_batch_invalidates_cache(self):
+        """ Asserts that reads after a batch commit observe its writes
+        """
+        with fake_kazoo_client(proxy_module) as server:
+            zk = ZookeeperProxy(cache_size=100)
+            zk.connect("ip_address", 2181, "/root", self.logger)
+            zk.register("/root/a", {"a": 1})
+            zk.register("/root/b", {"b": 1})
+            self.assertEqual(zk.fetch("/root/a"), {"a": 1})
+            self.assertEqual(zk.get_children("/root"), ["a", "b"])
+
+            # watch notifications lag, cache is invalidated by the batch
+            server._data_watches.clear()
+            server._child_watches.clear()
+            with zk.batch():
+                zk.save("/root/a", {"a": 2})
+                zk.remove("/root/b")
+                zk.register("/root/c", {"c": 1})
+            self.assertEqual(zk.fetch("/root/a"), {"a": 2})
+            self.assertEqual(zk.get_children("/root"), ["a", "c"])
+            zk.disconnect()
+
+    def test_write_requests(self):
+        """ Asserts that writes list chunks rather than read data replaced,
+        and keep chunks of children
+        """
+        with fake_kazoo_client(proxy_module) as server:
+            zk = ZookeeperProxy(max_node_bytes=100)
+            zk.connect("ip_address", 2181, "/root", self.logger)
+            zk.register("/root/a", {})
+            data = {"entry{}".format(i): "value" for i in range(50)}
+            zk.register("/root/a/big", data)
+            server.reset_requests()
+            zk.save("/root/a", {"a": 1})
+            self.assertEqual(dict(server.requests),
+                             {"get_children": 1, "set": 1})
+
+            zk.save("/root/a", data)
+            zk.save("/root/a", {"a": 2})
+            self.assertEqual(zk._list_children("/root/.chunks/a"), ["big"])
+            self.assertEqual(zk.fetch("/root/a/big"), data)
+            zk.disconnect()
+
+    def test_batch_chunks_rollback(self):
+        """ Asserts that chunks stored for a batch not committed are removed
+        """
+        with fake_kazoo_client(proxy_module):
+            zk = ZookeeperProxy(max_node_bytes=100)
+            zk.connect("ip_address", 2181, "/root", self.logger)
+            data = {"entry{}".format(i): "value" for i in range(50)}
+            zk.register("/root/a", {})
+
+            with self.assertRaises(NoNodeError):
+                with zk.batch():
+                    zk.save("/root/a", data)
+                    # missing node fails the transaction
+                    zk.save("/root/b", data)
+            with self.assertRaises(ValueError):
+                with zk.batch():
+                    zk.save("/root/a", data)
+                    raise ValueError()
+            self.assertEqual(zk._list_children("/root/.chunks/a"), [])
+            self.assertEqual(zk.fetch("/root/a"), {})
+
+            zk.disconnect()
+
+    def test_snapshot(self):
+        """ Asserts that a restarted proxy reads unchanged nodes from its
+        snapshot and changed ones from zookeeper
+        """
+        handle, file_path = tempfile.mkstemp()
+        os.close(handle)
+        self.addCleanup(os.remove, file_path)
+        with fake_kazoo_client(proxy_module) as server:
+            zk = ZookeeperProxy(snapshot_file=file_path)
+            zk.connect("ip_address", 2181, "/root", self.logger)
+            zk.register("/root/1", {})
+            zk.register("/root/1/a", {"a": 1})
+            zk.register("/root/1/b", {"b": 1})
+            self.assertEqual(zk.get_children("/root/1"), ["a", "b"])
+            self.assertEqual(list(zk.fetch_many(["/root/1/a", "/root/1/b"])),
+                             [("/root/1/a", {"a": 1}),
+                              ("/root/1/b", {"b": 1})])
+            zk.disconnect()
+
+            server.set("/root/1/b", b'{"b": 2}')
+            zk = ZookeeperProxy(snapshot_file=file_path)
+            zk.connect("ip_address", 2181, "/root", self.logger)
+            server.reset_requests()
+            self.assertEqual(zk.get_children("/root/1"), ["a", "b"])
+            self.assertEqual(zk.fetch("/root/1/a"), {"a": 1})
+            self.assertEqual(zk.fetch("/root/1/b"), {"b": 2})
+            self.assertEqual(server.requests["get"], 1)
+            self.assertEqual(server.requests["get_children"], 0)
+            zk.disconnect()
+
+            # nodes changed after the snapshot was checked are read again
+            zk = ZookeeperProxy(snapshot_file=file_path)
+            zk.connect("ip_address", 2181, "/root", self.logger)
+            writer = ZookeeperProxy()
+            writer.connect("ip_address", 2181, "/root", self.logger)
+            writer.save("/root/1/a", {"a": 2})
+            writer.register("/root/1/c", {})
+            writer.disconnect()
+            self.assertEqual(zk.fetch("/root/1/a"), {"a": 2})
+            self.assertEqual(zk.get_children("/root/1"), ["a", "b", "c"])
+            zk.disconnect()
+
+    def test_stats(self):
+        """ Asserts that operations are accounted and reported through hooks
+        """
+        completed = []
+        with fake_kazoo_client(proxy_module):
+            zk = ZookeeperProxy()
+            zk.hooks.attach(
+                "operation_complete",
+                lambda *args: completed.append((args[0], args[1], args[5])))
+            zk.connect("ip_address", 2181, "/root", self.logger)
+            zk.register("/root/1", {})
+            zk.register("/root/1/blocks", {})
+            zk.register("/root/1/blocks/b1", {"a": 1})
+            zk.save("/root/1/blocks/b1", {"a": 2})
+            self.assertEqual(zk.get_children("/root/1/blocks"), ["b1"])
+            self.assertEqual(list(zk.fetch_many(["/root/1/blocks/b1"])),
+                             [("/root/1/blocks/b1", {"a": 2})])
+            with self.assertRaises(Exception):
+                zk.save("/root/1/services/s1", {"a": 1})
+
+            stats = zk.get_stats()
+            self.assertEqual(stats["register"]["1"]["blocks"]["calls"], 2)
+            self.assertEqual(stats["register"]["1"][""]["calls"], 1)
+            self.assertEqual(stats["save"]["1"]["blocks"]["bytes_sent"],
+                             len(b'{"a": 2}'))
+            self.assertEqual(stats["save"]["1"]["services"]["errors"], 1)
+            self.assertEqual(stats["get_children"]["1"]["blocks"]
+                             ["bytes_received"], 2)
+            fetch = stats["fetch"]["1"]["blocks"]
+            self.assertEqual(fetch["bytes_received"], len(b'{"a": 2}'))
+            self.assertEqual(sum(fetch["histogram"].values()), 1)
+            self.assertEqual(len(completed), 7)
+            self.assertIsNotNone(completed[-1][2])
+
+            zk.reset_stats()
+            self.assertEqual(zk.get_stats(), {})
+            zk.disconnect()
+
+    def test_read_sessions(self):
+        """ Asserts that reads are spread across read sessions and synced
+        """
+        server = FakeZookeeper()
+        clients = []
+
+        def create_client(hosts, **kwargs):
+            client = FakeKazooClient(server)
+            client.hosts = hosts
+            client.get = Mock(wraps=client.get)
+            clients.append(client)
+            return client
+
+        with patch.object(proxy_module, "create_client", create_client):
+            zk = ZookeeperProxy(read_sessions=2, sync_reads=True)
+            zk.connect("unused", 2181, "/root", self.logger,
+                       hosts="a:1,b:2,c:3")
+            primary, first, second = clients
+            # each read session connects to a different member first
+            self.assertEqual([client.hosts for client in clients],
+                             ["a:1,b:2,c:3", "b:2,c:3,a:1", "c:3,a:1,b:2"])
+
+            zk.register("/root/node", {"a": 1})
+            for _ in range(4):
+                self.assertEqual(zk.fetch("/root/node"), {"a": 1})
+            self.assertEqual(primary.get.call_count, 0)
+            self.assertEqual(first.get.call_count, 2)
+            self.assertEqual(second.get.call_count, 2)
+            self.assertEqual(server.requests["sync"], 4)
+
+            zk.disconnect()
+            self.assertFalse(any(client.connected for client in clients))
+
+    def test_remove_tree(self):
+        """ Asserts that remove deletes a subtree level by level, reporting
+        progress and deleting nodes created meanwhile
+        """
+        with fake_kazoo_client(proxy_module) as server:
+            zk = ZookeeperProxy()
+            zk.connect("ip_address", 2181, "/root", self.logger)
+            for parent in range(3):
+                for child in range(3):
+                    zk._zk.create("/root/1/blocks/{0}/{1}".format(
+                        parent, child), b"{}", makepath=True)
+            client = zk._zk
+            delete_async = client.delete_async
+
+            def create_meanwhile(path):
+                if path == "/root/1/blocks/0/0":
+                    client.create("/root/1/blocks/0/new", b"{}")
+                return delete_async(path)
+            client.delete_async = create_meanwhile
+
+            progress = []
+            zk.remove("/root/1/blocks",
+                      progress=lambda *counts: progress.append(counts))
+            self.assertEqual(sorted(server.nodes), ["/", "/root", "/root/1"])
+            self.assertEqual(progress[-1], (14, 14))
+            self.assertEqual([deleted for deleted, _ in progress],
+                             list(range(1, 15)))
+            # missing nodes are ignored
+            zk.remove("/root/1/blocks")
+            zk.disconnect()
+
+    def test_write_behind(self):
+        """ Asserts that queued saves are coalesced, readable and drained
+        """
+        with fake_kazoo_client(proxy_module) as server:
+            zk = ZookeeperProxy(write_behind_interval=60)
+            zk.connect("ip_address", 2181, "/root", self.logger)
+            zk.register("/root/a", {"a": 0})
+            zk.register("/root/b", {"b": 0})
+            server.reset_requests()
+            for value in range(10):
+                zk.save("/root/a", {"a": value})
+            zk.save("/root/b", {"b": 1})
+            self.assertEqual(sum(server.requests.values()), 0)
+            self.assertEqual(zk.fetch("/root/a"), {"a": 9})
+
+            self.assertEqual(zk.flush(), 2)
+            self.assertEqual(server.requests["multi"], 1)
+            self.assertEqual(server.nodes["/root/a"], b'{"a": 9}')
+
+            # disconnect sends saves still queued
+            zk.save("/root/b", {"b": 2})
+            zk.disconnect()
+            self.assertEqual(server.nodes["/root/b"], b'{"b": 2}')
+
+    def test_write_behind_superseded(self):
+        """ Asserts that writes and removals sent right away discard saves
+        queued for the same nodes
+        """
+        with fake_kazoo_client(proxy_module) as server:
+            zk = ZookeeperProxy(write_behind_interval=60,
+                                track_versions=True)
+            zk.connect("ip_address", 2181, "/root", self.logger)
+            zk.register("/root/a", {"a": 0})
+            zk.register("/root/b", {"b": 0})
+            zk.save("/root/a", {"a": 1})
+            zk.register("/root/a", {"a": 2})
+            self.assertEqual(zk.fetch("/root/a"), {"a": 2})
+
+            zk.save("/root/b", {"b": 1})
+            zk.save("/root/b", {"b": 2}, version=zk.get_version("/root/b"))
+            zk.save("/root/c", {"c": 1})
+            zk.remove("/root/c")
+            self.assertEqual(zk.flush(), 0)
+            self.assertEqual(server.nodes["/root/a"], b'{"a": 2}')
+            self.assertEqual(server.nodes["/root/b"], b'{"b": 2}')
+            self.assertNotIn("/root/c", server.nodes)
+            zk.disconnect()
+
+    def test_background_connect(self):
+        """ Asserts that connect returns right away and operations wait
+        for the session, or fail along with it
+        """
+        server = FakeZookeeper()
+        server.create("/root/node", b'{"a": 1}', makepath=True)
+        started = Event()
+
+        def create_client(hosts, **kwargs):
+            client = FakeKazooClient(server)
+            start = client.start
+
+            def wait_start(timeout=15):
+                if not started.wait(timeout):
+                    raise KazooTimeoutError()
+                start(timeout)
+            client.start = wait_start
+            return client
+
+        with patch.object(proxy_module, "create_client", create_client):
+            zk = ZookeeperProxy(background_connect=True)
+            zk.connect("ip_address", 2181, "/root", self.logger)
+            fetched = []
+            fetcher = Thread(
+                target=lambda: fetched.append(zk.fetch("/root/node")))
+            fetcher.start()
+            fetcher.join(0.1)
+            self.assertEqual(fetched, [])
+            started.set()
+            fetcher.join()
+            self.assertEqual(fetched, [{"a": 1}])
+            zk.disconnect()
+
+            started.clear()
+            zk = ZookeeperProxy(background_connect=True, start_timeout=0.05)
+            zk.connect("ip_address", 2181, "/root", self.logger)
+            with self.assertRaises(KazooTimeoutError):
+                zk.fetch("/root/node")
+            zk.disconnect()
+
+    def test_coalesced_reads(self):
+        """ Asserts that concurrent reads of a node share one request,
+        unless the node was written to meanwhile
+        """
+        with fake_kazoo_client(proxy_module, latency=0.1) as server:
+            zk = ZookeeperProxy()
+            zk.connect("ip_address", 2181, "/root", self.logger)
+            zk.register("/root/node", {"a": 1})
+            server.reset_requests()
+            results = []
+            threads = [Thread(target=lambda: results.append(
+                zk.fetch("/root/node"))) for _ in range(4)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            self.assertEqual(results, [{"a": 1}] * 4)
+            self.assertEqual(server.requests["get"], 1)
+            self.assertEqual(zk.coalesced_reads, 3)
+
+            self.assertEqual(list(zk.fetch_many(["/root/node"] * 2)),
+                             [("/root/node", {"a": 1})] * 2)
+            self.assertEqual(server.requests["get"], 2)
+            zk.save("/root/node", {"a": 2})
+            self.assertEqual(zk.fetch("/root/node"), {"a": 2})
+            zk.disconnect()
+
+    def test_dedup(self):
+        """ Asserts that identical data is stored once and read through the
+        blob cache
+        """
+        config = {"values": list(range(100))}
+        with fake_kazoo_client(proxy_module) as server:
+            zk = ZookeeperProxy(dedup=True)
+            zk.connect("ip_address", 2181, "/root", self.logger)
+            zk.register("/root/1", {})
+            zk.register("/root/1/a", config)
+            zk.register("/root/1/b", config)
+            zk.register("/root/1/c", {"small": 1})
+            blobs = zk._list_children("/root/.blobs")
+            self.assertEqual(len(blobs), 1)
+            self.assertLess(len(server.nodes["/root/1/a"]), 100)
+            self.assertEqual(server.nodes["/root/1/a"],
+                             server.nodes["/root/1/b"])
+            self.assertEqual(server.nodes["/root/1/c"], b'{"small": 1}')
+
+            server.reset_requests()
+            first = zk.fetch("/root/1/a")
+            second = zk.fetch("/root/1/b")
+            self.assertEqual(first, config)
+            self.assertEqual(second, config)
+            # payload is read once, each node's data is its own
+            self.assertEqual(server.requests["get"], 3)
+            first["values"].append(99)
+            first["name"] = "first"
+            self.assertEqual(list(zk.fetch_many(["/root/1/b"])),
+                             [("/root/1/b", config)])
+            self.assertEqual(zk.fetch("/root/1/a"), config)
+
+            # a reader not deduplicating resolves references as well
+            reader = ZookeeperProxy(write_elision=True)
+            reader.connect("ip_address", 2181, "/root", self.logger)
+            self.assertEqual(reader.fetch("/root/1/a"), config)
+            # data read is known to match, only its version is checked
+            server.reset_requests()
+            reader.save("/root/1/a", config)
+            self.assertEqual(set(server.requests), {"exists"})
+            reader.disconnect()
+
+            # payloads removed are stored again
+            zk.remove("/root/.blobs")
+            zk.register("/root/1/d", config)
+            self.assertEqual(zk.fetch("/root/1/d"), config)
+            zk.disconnect()
+
+    def test_collect_blobs(self):
+        """ Asserts that payloads no longer referenced are removed once old
+        enough, and that old payloads referenced again are touched
+        """
+        config = {"values": list(range(100))}
+        with fake_kazoo_client(proxy_module) as server:
+            zk = ZookeeperProxy(dedup=True)
+            zk.connect("ip_address", 2181, "/root", self.logger)
+            zk.register("/root/a", config)
+            zk.register("/root/b", {"other": list(range(100))})
+            zk.save("/root/b", {"small": 1})
+            self.assertEqual(len(zk._list_children("/root/.blobs")), 2)
+            # recently modified payloads are kept
+            self.assertEqual(zk.collect_blobs(), 0)
+
+            blobs = ["/root/.blobs/" + digest
+                     for digest in zk._list_children("/root/.blobs")]
+            for blob in blobs:
+                server._get_node(blob).mtime = 0
+            # a writer referencing an old payload touches it
+            writer = ZookeeperProxy(dedup=True)
+            writer.connect("ip_address", 2181, "/root", self.logger)
+            writer.register("/root/c", config)
+            writer.disconnect()
+
+            self.assertEqual(zk.collect_blobs(), 1)
+            self.assertEqual(len(zk._list_children("/root/.blobs")), 1)
+            self.assertEqual(zk.fetch("/root/a"), config)
+            self.assertEqual(zk.fetch("/root/c"), config)
+            # removed payloads are stored again when referenced
+            zk.register("/root/d", {"other": list(range(100))})
+            self.assertEqual(len(zk._list_children("/root/.blobs")), 2)
+            zk.disconnect()
+
+    def test_retry_versioned_save(self):
+        """ Asserts that a versioned save applied although its response was
+        lost succeeds when retried, and that a conflicting one fails
+        """
+        with fake_kazoo_client(proxy_module) as server:
+            zk = ZookeeperProxy(track_versions=True, retry_max_tries=2,
+                                retry_delay=0.001)
+            zk.connect("ip_address", 2181, "/root", self.logger)
+            zk.register("/root/a", {"a": 0})
+            version = zk.get_version("/root/a")
+            server_set = server.set
+            lost = [True]
+
+            def set_response_lost(*args):
+                result = server_set(*args)
+                if lost[0]:
+                    lost[0] = False
+                    raise ConnectionLoss()
+                return result
+
+            with patch.object(server, "set", set_response_lost):
+                zk.save("/root/a", {"a": 1}, version=version)
+            self.assertEqual(server.nodes["/root/a"], b'{"a": 1}')
+            self.assertEqual(zk.get_version("/root/a"), version + 1)
+
+            # modified meanwhile by someone else
+            lost[0] = True
+            with patch.object(server, "set", set_response_lost):
+                zk.save("/root/a", {"a": 2}, version=version + 1)
+                with self.assertRaises(BadVersionError):
+                    zk.save("/root/a", {"a": 3}, version=version + 1)
+            zk.disconnect()
+
+    def test_session_interrupted(self):
+        """ Asserts that reads are served stale and writes queued while the
+        session is suspended, queued writes being sent once reconnected,
+        and that connection errors are retried
+        """
+        with fake_kazoo_client(proxy_module) as server:
+            zk = ZookeeperProxy(serve_stale=True, max_offline_writes=10,
+                                retry_max_tries=2, retry_delay=0.001)
+            zk.connect("ip_address", 2181, "/root", self.logger)
+            zk.register("/root/1", {})
+            zk.register("/root/1/a", {"a": 1})
+            self.assertEqual(zk.get_children("/root/1"), ["a"])
+            self.assertNotIsInstance(zk.fetch("/root/1/a"), StaleData)
+
+            zk._zk.set_state(KazooState.SUSPENDED)
+            data = zk.fetch("/root/1/a")
+            self.assertIsInstance(data, StaleData)
+            self.assertEqual(data, {"a": 1})
+            self.assertIsInstance(zk.get_children("/root/1"), StaleChildren)
+
+            zk.save("/root/1/a", {"a": 2})
+            zk.register("/root/1/b", {"b": 1})
+            # queued writes are read back, not sent yet
+            self.assertEqual(zk.fetch("/root/1/a"), {"a": 2})
+            self.assertEqual(server.nodes["/root/1/a"], b'{"a": 1}')
+            self.assertNotIn("/root/1/b", server.nodes)
+
+            zk._zk.set_state(KazooState.CONNECTED)
+            for _ in range(100):
+                if not len(zk._offline_writes):
+                    break
+                time.sleep(0.01)
+            self.assertEqual(server.nodes["/root/1/a"], b'{"a": 2}')
+            self.assertEqual(server.nodes["/root/1/b"], b'{"b": 1}')
+            self.assertEqual(zk.fetch("/root/1/b"), {"b": 1})
+
+            get = zk._zk.get
+            attempts = []
+
+            def fail_once(*args, **kwargs):
+                attempts.append(1)
+                if len(attempts) == 1:
+                    raise ConnectionLoss()
+                return get(*args, **kwargs)
+            with patch.object(zk._zk, "get", fail_once):
+                self.assertEqual(zk.fetch("/root/1/b"), {"b": 1})
+            self.assertEqual(len(attempts), 2)
+            zk.disconnect()
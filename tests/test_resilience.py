@@ -0,0 +1,65 @@
+import unittest
+
+try:
+    import kazoo
+    from kazoo.exceptions import ConnectionLoss
+    from kazoo.retry import RetryFailedError
+    from ..resilience import OfflineWriteQueue, StaleData, StaleChildren, \
+        create_retry, is_stale
+    kazoo_installed = True
+except ImportError:
+    kazoo_installed = False
+
+from niocore.testing.test_case import NIOCoreTestCaseNoModules
+
+
+@unittest.skipUnless(kazoo_installed, "kazoo is not installed")
+class TestResilience(NIOCoreTestCaseNoModules):
+
+    def test_offline_queue(self):
+        """ Asserts that writes are coalesced, kept in order and bounded
+        """
+        queue = OfflineWriteQueue(max_size=2)
+        self.assertIsNone(queue.first())
+        self.assertTrue(queue.put("/a", b"1", create=True))
+        self.assertTrue(queue.put("/b", b"1"))
+        self.assertFalse(queue.put("/c", b"1"))
+        data = b"2"
+        self.assertTrue(queue.put("/a", data))
+        self.assertEqual(len(queue), 2)
+        self.assertEqual(queue.get("/a"), (True, b"2"))
+        # node is still created, it was not when first queued
+        self.assertEqual(queue.first(), ("/a", b"2", True))
+
+        # a write replaced while being sent is kept
+        queue.done("/b", b"0")
+        self.assertEqual(queue.get("/b"), (True, b"1"))
+        queue.done("/a", data)
+        self.assertEqual(queue.first(), ("/b", b"1", False))
+
+        queue.put("/b/c", b"1")
+        queue.discard("/b", tree=True)
+        self.assertEqual(len(queue), 0)
+
+    def test_retry(self):
+        """ Asserts that connection errors are retried up to max_tries
+        """
+        self.assertIsNone(create_retry(0))
+        retry = create_retry(2, delay=0.001)
+        attempts = []
+
+        def fail_once():
+            attempts.append(1)
+            if len(attempts) == 1:
+                raise ConnectionLoss()
+            return "done"
+        self.assertEqual(retry.copy()(fail_once), "done")
+
+        def fail():
+            raise ConnectionLoss()
+        with self.assertRaises(RetryFailedError):
+            retry.copy()(fail)
+
+        self.assertTrue(is_stale(StaleData()))
+        self.assertTrue(is_stale(StaleChildren()))
+        self.assertFalse(is_stale({}))
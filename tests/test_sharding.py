@@ -0,0 +1,133 @@
+import logging
+import unittest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+try:
+    import kazoo
+    from ..provider import ZookeeperConfigurationProvider
+    from ..proxy import ZookeeperProxy
+    from .. import proxy as proxy_module
+    from ..sharding import migrate, get_child_path, is_bucket
+    from ..subscriptions import ADDED
+    from .fake_zookeeper import fake_kazoo_client
+    from .test_subscriptions import wait_for
+    kazoo_installed = True
+except ImportError:
+    kazoo_installed = False
+
+from niocore.configuration import Configuration
+from niocore.testing.test_case import NIOCoreTestCaseNoModules
+
+
+@unittest.skipUnless(kazoo_installed, "kazoo is not installed")
+class TestSharding(NIOCoreTestCaseNoModules):
+
+    def setUp(self):
+        super().setUp()
+        ZookeeperConfigurationProvider.reset()
+
+    def tearDown(self):
+        ZookeeperConfigurationProvider.reset()
+        super().tearDown()
+
+    def _get_provider(self, **settings):
+        ZookeeperConfigurationProvider._parse_mappings({"default": 1})
+        return ZookeeperConfigurationProvider(
+            SimpleNamespace(providers=settings))
+
+    def test_child_path(self):
+        """ Asserts that children are placed in a bucket by name
+        """
+        self.assertEqual(get_child_path("/r/1/blocks", "b1", 0),
+                         "/r/1/blocks/b1")
+        path = get_child_path("/r/1/blocks", "b1", 8)
+        self.assertEqual(path, get_child_path("/r/1/blocks", "b1", 8))
+        bucket = path.split("/")[-2]
+        self.assertTrue(is_bucket(bucket))
+        self.assertTrue(bucket.startswith(".bucket8."))
+        buckets = {get_child_path("/r/1/blocks", "b{}".format(index), 8)
+                   .split("/")[-2] for index in range(100)}
+        self.assertGreater(len(buckets), 4)
+
+    def test_migrate(self):
+        """ Asserts that a configuration is read and written the same way
+        across layouts
+        """
+        with fake_kazoo_client(proxy_module) as server:
+            zk = ZookeeperProxy()
+            zk.connect("ip_address", 2181, "/root", logging.getLogger())
+            zk._zk.ensure_path("/root/1/blocks")
+            ZookeeperConfigurationProvider._set_proxy(zk)
+            provider = self._get_provider()
+            blocks = Configuration(name="blocks")
+            for index in range(20):
+                provider.register(blocks, Configuration(
+                    data={"index": index}), "b{}".format(index))
+
+            self.assertEqual(migrate(zk, "/root/1/blocks", 4), 20)
+            children = zk.get_children("/root/1/blocks")
+            self.assertEqual(len(children), 4)
+            self.assertTrue(all(is_bucket(child) for child in children))
+            self.assertIn(get_child_path("/root/1/blocks", "b3", 4),
+                          server.nodes)
+
+            for parallel in (False, True):
+                provider._parallel_fetch = parallel
+                blocks = provider.fetch("blocks")
+                self.assertEqual(len(blocks["_private"].children), 20)
+                self.assertEqual(blocks["b7"]["index"], 7)
+
+            # registered and saved children follow the layout
+            blocks["b20"] = Configuration(data={"index": 20})
+            provider.register(blocks, blocks["b20"], "b20")
+            self.assertIn(get_child_path("/root/1/blocks", "b20", 4),
+                          server.nodes)
+            blocks["b1"]["index"] = -1
+            del blocks["b2"]
+            provider.save(blocks)
+            blocks = provider.fetch("blocks")
+            self.assertEqual(blocks["b1"]["index"], -1)
+            self.assertNotIn("b2", blocks)
+            self.assertEqual(blocks["b20"]["index"], 20)
+
+            # bucket count changed, then back to flat
+            self.assertEqual(migrate(zk, "/root/1/blocks", 8), 20)
+            self.assertEqual(len(provider.fetch("blocks")), 21)
+            self.assertEqual(migrate(zk, "/root/1/blocks", 0), 20)
+            self.assertEqual(len(zk.get_children("/root/1/blocks")), 20)
+            self.assertEqual(provider.fetch("blocks")["b1"]["index"], -1)
+            zk.disconnect()
+
+    def test_register_layout(self):
+        """ Asserts that the layout is read once to register children of a
+        configuration not fetched, and that subscribers are told about
+        children registered in buckets
+        """
+        with fake_kazoo_client(proxy_module):
+            zk = ZookeeperProxy()
+            zk.connect("ip_address", 2181, "/root", logging.getLogger())
+            ZookeeperConfigurationProvider._set_proxy(zk)
+            provider = self._get_provider()
+            migrate(zk, "/root/1/blocks", 4)
+            blocks = Configuration(name="blocks")
+            with patch.object(zk, "fetch", wraps=zk.fetch) as fetch:
+                for index in range(3):
+                    provider.register(blocks, Configuration(
+                        data={"index": index}), "b{}".format(index))
+            fetch.assert_called_once_with("/root/1/blocks")
+
+            events = []
+            provider.subscribe("blocks", events.append)
+            for index in range(3, 5):
+                provider.register(blocks, Configuration(
+                    data={"index": index}), "b{}".format(index))
+            wait_for(lambda: len(events) == 2)
+            self.assertEqual(sorted(event.child for event in events),
+                             ["b3", "b4"])
+            for event in events:
+                self.assertEqual(event.kind, ADDED)
+                self.assertEqual(event.config["_private"].path,
+                                 get_child_path("/root/1/blocks",
+                                                event.child, 4))
+            zk.disconnect()
@@ -0,0 +1,102 @@
+from threading import Event, Thread
+
+from niocore.testing.test_case import NIOCoreTestCaseNoModules
+
+from ..single_flight import SingleFlight
+
+
+class MyAsyncResult(object):
+    def __init__(self):
+        self.callbacks = []
+
+    def rawlink(self, callback):
+        self.callbacks.append(callback)
+
+    def complete(self):
+        for callback in self.callbacks:
+            callback(self)
+
+
+class TestSingleFlight(NIOCoreTestCaseNoModules):
+
+    def test_do(self):
+        """ Asserts that concurrent calls for a key share one call and its
+        error
+        """
+        flights = SingleFlight()
+        release = Event()
+        calls = []
+
+        def read():
+            calls.append(1)
+            release.wait()
+            return "data"
+
+        results = []
+        threads = [Thread(target=lambda: results.append(
+            flights.do(("get", "/a"), read))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while flights.coalesced < 4:
+            release.wait(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, ["data"] * 5)
+        self.assertEqual((len(calls), flights.issued), (1, 1))
+
+        def fail():
+            raise ValueError()
+        with self.assertRaises(ValueError):
+            flights.do(("get", "/a"), fail)
+        # completed calls are not shared
+        self.assertEqual(flights.do(("get", "/a"), lambda: "new"), "new")
+
+    def test_share(self):
+        """ Asserts that asynchronous requests are shared until complete or
+        discarded
+        """
+        flights = SingleFlight()
+        first = flights.share(("get", "/a"), MyAsyncResult)
+        self.assertIs(flights.share(("get", "/a"), MyAsyncResult), first)
+        self.assertIsNot(flights.share(("get", "/b"), MyAsyncResult), first)
+        self.assertEqual(flights.coalesced, 1)
+
+        first.complete()
+        second = flights.share(("get", "/a"), MyAsyncResult)
+        self.assertIsNot(second, first)
+
+        flights.discard("/a")
+        self.assertIsNot(flights.share(("get", "/a"), MyAsyncResult), second)
+        self.assertEqual(flights.issued, 4)
+
+    def test_capture(self):
+        """ Asserts that state captured by the caller issuing a request is
+        passed to it and handed to every caller sharing it
+        """
+        flights = SingleFlight()
+        generations = iter(range(10))
+        release = Event()
+
+        def read(generation):
+            release.wait()
+            return "data@{}".format(generation)
+
+        results = []
+        threads = [Thread(target=lambda: results.append(flights.do(
+            ("get", "/a"), read, lambda: next(generations))))
+            for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        while flights.coalesced < 2:
+            release.wait(0.01)
+        release.set()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(results, [("data@0", 0)] * 3)
+
+        first = flights.share(("get", "/b"), lambda _: MyAsyncResult(),
+                              lambda: next(generations))
+        self.assertEqual(first[1], 1)
+        self.assertIs(flights.share(("get", "/b"), lambda _: MyAsyncResult(),
+                                    lambda: next(generations)), first)
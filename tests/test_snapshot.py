@@ -0,0 +1,99 @@
+import os
+import tempfile
+from unittest.mock import Mock
+
+from niocore.testing.test_case import NIOCoreTestCaseNoModules
+
+from ..snapshot import ZookeeperSnapshot, SnapshotStat
+
+
+class TestZookeeperSnapshot(NIOCoreTestCaseNoModules):
+
+    def setUp(self):
+        super().setUp()
+        handle, self.file_path = tempfile.mkstemp()
+        os.close(handle)
+
+    def tearDown(self):
+        os.remove(self.file_path)
+        super().tearDown()
+
+    @staticmethod
+    def _get_client(stats):
+        client = Mock()
+        client.exists_async = lambda path, watch: \
+            Mock(get=Mock(return_value=stats.get(path)))
+        return client
+
+    def test_save_load(self):
+        """ Asserts that current entries are served once after loading
+        """
+        snapshot = ZookeeperSnapshot(self.file_path)
+        snapshot.record_children("/root/blocks", ["b1", "b2"],
+                                 SnapshotStat(0, 1, 10))
+        snapshot.record_data("/root/blocks/b1", b'{"b": 1}',
+                             SnapshotStat(3, 11, 11))
+        snapshot.record_data("/root/blocks/b2", b'{"b": 2}',
+                             SnapshotStat(0, 12, 12))
+        self.assertEqual(snapshot.save(), 3)
+
+        snapshot = ZookeeperSnapshot(self.file_path)
+        self.assertEqual(snapshot.load(), 3)
+        client = self._get_client({
+            "/root/blocks": SnapshotStat(0, 1, 10),
+            "/root/blocks/b1": SnapshotStat(3, 11, 11),
+            # modified since recorded
+            "/root/blocks/b2": SnapshotStat(1, 13, 13)})
+        self.assertEqual(snapshot.validate(client, 2), (2, 1))
+        # data is not copied out of the file until served
+        self.assertIsInstance(snapshot._loaded["/root/blocks/b1"].data,
+                              memoryview)
+
+        self.assertEqual(snapshot.take_children("/root/blocks"),
+                         (True, ["b1", "b2"]))
+        found, (data, stat) = snapshot.take_data("/root/blocks/b1")
+        self.assertEqual(data, b'{"b": 1}')
+        self.assertEqual(stat.version, 3)
+        self.assertEqual(snapshot.take_data("/root/blocks/b2"),
+                         (False, None))
+        # entries are served only once
+        self.assertEqual(snapshot.take_data("/root/blocks/b1"),
+                         (False, None))
+
+        # current entries are kept when saving again
+        snapshot.discard("/root/blocks/b1")
+        self.assertEqual(snapshot.save(), 1)
+
+    def test_expire(self):
+        """ Asserts that entries are watched when validated and dropped
+        once their node changes
+        """
+        snapshot = ZookeeperSnapshot(self.file_path)
+        snapshot.record_children("/root/blocks", ["b1"],
+                                 SnapshotStat(0, 1, 10))
+        snapshot.record_data("/root/blocks/b1", b'{"b": 1}',
+                             SnapshotStat(0, 11, 11))
+        snapshot.save()
+
+        snapshot = ZookeeperSnapshot(self.file_path)
+        snapshot.load()
+        client = self._get_client({
+            "/root/blocks": SnapshotStat(0, 1, 10),
+            "/root/blocks/b1": SnapshotStat(0, 11, 11)})
+        self.assertEqual(snapshot.validate(client, 2), (2, 0))
+        client.get_children_async.assert_called_once_with(
+            "/root/blocks", watch=snapshot.expire)
+
+        snapshot.expire(Mock(path="/root/blocks/b1"))
+        self.assertEqual(snapshot.take_data("/root/blocks/b1"),
+                         (False, None))
+        self.assertEqual(snapshot.take_children("/root/blocks"),
+                         (True, ["b1"]))
+
+    def test_invalid_file(self):
+        """ Asserts that a missing or corrupt file is ignored
+        """
+        self.assertEqual(ZookeeperSnapshot(self.file_path).load(), 0)
+        with open(self.file_path, "wb") as f:
+            f.write(b"corrupt")
+        self.assertEqual(ZookeeperSnapshot(self.file_path).load(), 0)
@@ -0,0 +1,41 @@
+from niocore.testing.test_case import NIOCoreTestCaseNoModules
+
+from ..stats import ZookeeperStats
+
+
+class TestZookeeperStats(NIOCoreTestCaseNoModules):
+
+    def test_key(self):
+        """ Asserts that node paths are broken down into mapping id and name
+        """
+        self.assertEqual(ZookeeperStats.get_key("/root", "/root/1/blocks/b1"),
+                         ("1", "blocks"))
+        self.assertEqual(ZookeeperStats.get_key("/root/", "/root/1/blocks"),
+                         ("1", "blocks"))
+        self.assertEqual(ZookeeperStats.get_key("/root", "/root/1"),
+                         ("1", ""))
+        self.assertEqual(ZookeeperStats.get_key("/root", "/rooted/1"),
+                         ("", ""))
+
+    def test_record(self):
+        """ Asserts that counts, bytes and latency histogram are accumulated
+        """
+        stats = ZookeeperStats()
+        stats.record("fetch", "1", "blocks", 0.0001, bytes_received=10)
+        stats.record("fetch", "1", "blocks", 3, bytes_received=5, error=True)
+        stats.record("save", "1", "blocks", 0.01, bytes_sent=7)
+
+        snapshot = stats.snapshot()
+        fetch = snapshot["fetch"]["1"]["blocks"]
+        self.assertEqual(fetch["calls"], 2)
+        self.assertEqual(fetch["errors"], 1)
+        self.assertEqual(fetch["bytes_received"], 15)
+        self.assertEqual(fetch["max_seconds"], 3)
+        self.assertEqual(fetch["histogram"]["0.0005"], 1)
+        self.assertEqual(fetch["histogram"]["5.0"], 1)
+        self.assertEqual(snapshot["save"]["1"]["blocks"]["bytes_sent"], 7)
+
+        stats.reset()
+        self.assertEqual(stats.snapshot(), {})
+        # snapshots are copies
+        self.assertEqual(fetch["calls"], 2)
@@ -0,0 +1,121 @@
+import logging
+import time
+import unittest
+from types import SimpleNamespace
+
+try:
+    import kazoo
+    from ..provider import ZookeeperConfigurationProvider
+    from ..proxy import ZookeeperProxy
+    from .. import proxy as proxy_module
+    from ..subscriptions import ZookeeperSubscription, ADDED, CHANGED, \
+        REMOVED
+    from .fake_zookeeper import fake_kazoo_client, FakeKazooClient
+    kazoo_installed = True
+except ImportError:
+    kazoo_installed = False
+
+from niocore.testing.test_case import NIOCoreTestCaseNoModules
+
+
+def wait_for(condition, timeout=2):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+
+
+@unittest.skipUnless(kazoo_installed, "kazoo is not installed")
+class TestZookeeperSubscription(NIOCoreTestCaseNoModules):
+
+    def setUp(self):
+        super().setUp()
+        self.client = FakeKazooClient()
+        self.client.start()
+        self.client.create("/blocks/b1", b"1", makepath=True)
+        self.events = []
+
+    def tearDown(self):
+        self.client.stop()
+        super().tearDown()
+
+    def _deliver(self, kind, child, data):
+        self.events.append((kind, child, data))
+
+    def test_events(self):
+        """ Asserts that changes to node and children are delivered
+        """
+        subscription = ZookeeperSubscription(
+            self.client, "/blocks", self._deliver).start()
+        self.client.set("/blocks/b1", b"2")
+        self.client.create("/blocks/b2", b"3")
+        self.client.delete("/blocks/b1")
+        self.client.set("/blocks", b"4")
+        wait_for(lambda: len(self.events) == 4)
+        self.assertEqual(sorted(self.events, key=str),
+                         sorted([(CHANGED, "b1", b"2"), (ADDED, "b2", b"3"),
+                                 (REMOVED, "b1", None),
+                                 (CHANGED, None, b"4")], key=str))
+
+        subscription.cancel()
+        self.client.set("/blocks/b2", b"5")
+        time.sleep(0.05)
+        self.assertEqual(len(self.events), 4)
+
+    def test_node_added_again(self):
+        """ Asserts that children are watched again once the node is added
+        again, or added after subscribing
+        """
+        ZookeeperSubscription(self.client, "/blocks", self._deliver).start()
+        ZookeeperSubscription(self.client, "/missing", self._deliver).start()
+        self.client.delete("/blocks", recursive=True)
+        wait_for(lambda: len(self.events) == 2)
+        self.client.ensure_path("/blocks")
+        self.client.create("/blocks/b2", b"2")
+        self.client.create("/missing/m1", b"3", makepath=True)
+        wait_for(lambda: len(self.events) == 6)
+        self.assertEqual(sorted(self.events, key=str),
+                         sorted([(REMOVED, "b1", None), (REMOVED, None, None),
+                                 (ADDED, None, b""), (ADDED, "b2", b"2"),
+                                 (ADDED, None, b""), (ADDED, "m1", b"3")],
+                                key=str))
+
+    def test_debounce(self):
+        """ Asserts that bursts of changes are merged into one event
+        """
+        ZookeeperSubscription(self.client, "/blocks", self._deliver,
+                              debounce=0.1).start()
+        for value in range(5):
+            self.client.set("/blocks/b1", str(value).encode())
+        self.client.create("/blocks/b2", b"")
+        self.client.delete("/blocks/b2")
+        wait_for(lambda: self.events)
+        time.sleep(0.15)
+        self.assertEqual(self.events, [(CHANGED, "b1", b"4")])
+
+    def test_provider_subscribe(self):
+        """ Asserts that provider subscribers receive configurations
+        """
+        events = []
+        with fake_kazoo_client(proxy_module):
+            zk = ZookeeperProxy()
+            zk.connect("ip_address", 2181, "/root", logging.getLogger())
+            zk._zk.ensure_path("/root/1/blocks")
+            ZookeeperConfigurationProvider.reset()
+            ZookeeperConfigurationProvider._set_proxy(zk)
+            ZookeeperConfigurationProvider._parse_mappings({"default": 1})
+            provider = ZookeeperConfigurationProvider(
+                SimpleNamespace(providers={}))
+            provider.subscribe("blocks", events.append)
+            provider.subscribe("blocks", events.append, child="b1")
+
+            zk.register("/root/1/blocks/b1", {"name": "b1"})
+            wait_for(lambda: len(events) == 2)
+            for event in events:
+                self.assertEqual(event.kind, ADDED)
+                self.assertEqual(event.name, "blocks")
+                self.assertEqual(event.child, "b1")
+                self.assertEqual(event.config["name"], "b1")
+                self.assertEqual(event.config["_private"].path,
+                                 "/root/1/blocks/b1")
+            ZookeeperConfigurationProvider.reset()
+            zk.disconnect()
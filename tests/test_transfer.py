@@ -0,0 +1,112 @@
+import io
+import json
+import logging
+import unittest
+
+try:
+    import kazoo
+    from ..proxy import ZookeeperProxy
+    from .. import proxy as proxy_module
+    from ..transfer import export_tree, import_tree, diff_tree, ADDED, \
+        CHANGED, REMOVED
+    from .fake_zookeeper import fake_kazoo_client
+    kazoo_installed = True
+except ImportError:
+    kazoo_installed = False
+
+from niocore.testing.test_case import NIOCoreTestCaseNoModules
+
+
+@unittest.skipUnless(kazoo_installed, "kazoo is not installed")
+class TestTransfer(NIOCoreTestCaseNoModules):
+
+    def _connect(self, **options):
+        zk = ZookeeperProxy(**options)
+        zk.connect("ip_address", 2181, "/root", logging.getLogger())
+        return zk
+
+    def _export(self, zk):
+        output = io.StringIO()
+        count = export_tree(zk, output, max_in_flight=3)
+        return count, output.getvalue()
+
+    def test_export_import(self):
+        """ Asserts that a tree is exported in order and imported back
+        """
+        with fake_kazoo_client(proxy_module):
+            zk = self._connect(max_node_bytes=64)
+            zk._zk.ensure_path("/root/1/blocks")
+            zk._zk.ensure_path("/root/1-a")
+            for name in ("b2", "b1", "b10"):
+                zk.register("/root/1/blocks/{}".format(name), {"name": name})
+            zk.register("/root/1/blocks/b1/sub", {"sub": True})
+            zk.register("/root/2", {"large": "x" * 200})
+            # decodes, but not as configuration data
+            zk._zk.create("/root/3", b"5")
+            count, exported = self._export(zk)
+            zk.disconnect()
+
+        records = [json.loads(line) for line in exported.splitlines()]
+        self.assertEqual(count, 9)
+        self.assertEqual([record["path"] for record in records],
+                         ["/1", "/1/blocks", "/1/blocks/b1",
+                          "/1/blocks/b1/sub", "/1/blocks/b10",
+                          "/1/blocks/b2", "/1-a", "/2", "/3"])
+        self.assertEqual(records[2]["config"], {"name": "b1"})
+        self.assertEqual(records[1]["data"], "")
+        # chunked payloads are exported whole
+        self.assertEqual(records[-2]["config"], {"large": "x" * 200})
+        self.assertEqual(records[-1]["data"], "NQ==")
+
+        with fake_kazoo_client(proxy_module) as server:
+            zk = self._connect()
+            zk._zk.create("/root/2", b"{}")
+            self.assertEqual(import_tree(zk, io.StringIO(exported),
+                                         max_in_flight=2),
+                             {"created": 8, "updated": 1})
+            self.assertEqual(zk.fetch("/root/1/blocks/b1/sub"),
+                             {"sub": True})
+            self.assertEqual(server.nodes["/root/3"], b"5")
+            self.assertEqual(self._export(zk), (count, exported))
+            self.assertNotIn("/root/.chunks", server.nodes)
+            zk.disconnect()
+
+    def test_diff(self):
+        """ Asserts that dry run reports differences and writes nothing
+        """
+        with fake_kazoo_client(proxy_module) as server:
+            zk = self._connect()
+            zk._zk.ensure_path("/root/1/blocks")
+            zk.register("/root/1/blocks/b1", {"name": "b1"})
+            zk.register("/root/1/blocks/b2", {"name": "b2"})
+            _, exported = self._export(zk)
+
+            zk.save("/root/1/blocks/b1", {"name": "changed"})
+            zk.remove("/root/1/blocks/b2")
+            zk.register("/root/1/blocks/b3", {"name": "b3"})
+            server.reset_requests()
+            self.assertEqual(list(diff_tree(zk, io.StringIO(exported))),
+                             [(CHANGED, "/1/blocks/b1"),
+                              (ADDED, "/1/blocks/b2"),
+                              (REMOVED, "/1/blocks/b3")])
+            self.assertEqual(set(server.requests), {"get", "get_children"})
+
+            with self.assertRaises(ValueError):
+                list(diff_tree(zk, io.StringIO(
+                    "\n".join(reversed(exported.splitlines())))))
+            zk.disconnect()
+
+    def test_diff_unchanged(self):
+        """ Asserts that dry run of an export reports no difference, for
+        configs holding several keys in any order
+        """
+        with fake_kazoo_client(proxy_module):
+            zk = self._connect()
+            zk._zk.ensure_path("/root/1/blocks")
+            zk.register("/root/1/blocks/b1",
+                        {"type": "Block", "name": "b1", "log_level": 20})
+            zk.register("/root/1/blocks/b2",
+                        {"name": "b2", "nested": {"z": 1, "a": [1, 2]}})
+            _, exported = self._export(zk)
+            self.assertEqual(list(diff_tree(zk, io.StringIO(exported))), [])
+            zk.disconnect()
@@ -0,0 +1,49 @@
+import time
+from unittest.mock import Mock
+
+from niocore.testing.test_case import NIOCoreTestCaseNoModules
+
+from ..write_behind import WriteBehindQueue
+
+
+class TestWriteBehindQueue(NIOCoreTestCaseNoModules):
+
+    def test_coalesce_flush(self):
+        """ Asserts that writes to a node are coalesced and served until sent
+        """
+        write = Mock()
+        queue = WriteBehindQueue(write, interval=60)
+        queue.put("/a", b"1")
+        queue.put("/b", b"1")
+        queue.put("/a", b"2")
+        queue.put("/b/c", b"1")
+        self.assertEqual(queue.get("/a"), (True, b"2"))
+        self.assertEqual(queue.coalesced, 1)
+
+        queue.discard("/b", tree=True)
+        self.assertEqual(queue.flush(), 1)
+        write.assert_called_once_with([("/a", b"2")])
+        self.assertEqual(queue.get("/a"), (False, None))
+        self.assertEqual(queue.flush(), 0)
+
+    def test_triggers(self):
+        """ Asserts that writes are sent on interval, size and stop
+        """
+        written = []
+        queue = WriteBehindQueue(written.extend, interval=0.05,
+                                 max_pending=3)
+        queue.start()
+        queue.put("/a", b"1")
+        time.sleep(0.2)
+        self.assertEqual(written, [("/a", b"1")])
+
+        queue._interval = 60
+        for path in ("/b", "/c", "/d"):
+            queue.put(path, b"1")
+        time.sleep(0.1)
+        self.assertEqual(len(written), 4)
+
+        queue.put("/e", b"1")
+        queue.stop()
+        self.assertEqual(written[-1], ("/e", b"1"))
+        self.assertEqual(len(queue), 0)
@@ -1,4 +1,7 @@
+import json
+import logging
 import unittest
+from contextlib import contextmanager
 from unittest.mock import Mock, patch, MagicMock
 
 from nio.modules.settings import Settings
@@ -9,6 +12,9 @@ try:
     import kazoo
     from ..provider import ZookeeperConfigurationProvider
     from ..provider import ZookeeperProxy
+    from .. import proxy as proxy_module
+    from .fake_zookeeper import fake_kazoo_client
+    from kazoo.exceptions import BadVersionError
     ZookeeperProxy_namespace = "{}.ZookeeperProxy".format(
         ZookeeperConfigurationProvider.__module__)
     kazoo_installed = True
@@ -22,6 +28,7 @@ class MyZookeeperProxy(object):
         self.connect = Mock()
         self.get_root_path = MagicMock(return_value="/nio_configuration")
         self._data = {}
+        self._versions = {}
 
     def get_children(self, node_path):
         pass
@@ -35,12 +42,37 @@ class MyZookeeperProxy(object):
 
         return {}
 
+    def fetch_many(self, node_paths, max_in_flight):
+        for node_path in node_paths:
+            yield node_path, self._data.get(node_path, {})
+
+    def get_children_many(self, node_paths, max_in_flight):
+        for node_path in node_paths:
+            yield node_path, self.get_children(node_path)
+
     def save(self, node_path, config):
         self._data[node_path] = config
 
     def remove(self, node_path):
         del self._data[node_path]
 
+    def get_version(self, node_path):
+        return self._versions.get(node_path)
+
+    def get_digest(self, config):
+        return json.dumps({k: config[k] for k in config
+                           if not k.startswith("_")}, sort_keys=True)
+
+    def get_read_digest(self, node_path):
+        return self.get_digest(self._data.get(node_path, {}))
+
+    @contextmanager
+    def batch(self):
+        yield
+
+    def after_commit(self, callback):
+        callback()
+
 
 @unittest.skipUnless(kazoo_installed, "kazoo is not installed")
 class TestZookeeperProvider(NIOCoreTestCase):
@@ -155,3 +187,240 @@ class TestZookeeperProvider(NIOCoreTestCase):
         provider.remove(config)
         data_fetched = provider.fetch("config_name")
         self.assertNotIn("entry1", data_fetched)
+
+    @patch(ZookeeperProxy_namespace)
+    def test_parallel_fetch(self, proxy_mock):
+        """ Asserts that children are fetched through fetch_many when enabled
+        """
+        my_proxy = MyZookeeperProxy()
+        my_proxy.get_children = Mock(return_value=["child1", "child2"])
+        my_proxy.fetch = Mock()
+        proxy_mock.return_value = my_proxy
+
+        settings = self._get_settings()
+        settings.providers["parallel_fetch"] = "True"
+        provider = ZookeeperConfigurationProvider(settings)
+
+        node_path = "/nio_configuration/1/blocks"
+        my_proxy._data["{}/child1".format(node_path)] = {"id": 1}
+        config = provider.fetch("blocks")
+
+        self.assertFalse(my_proxy.fetch.called)
+        self.assertEqual(config["child1"]["id"], 1)
+        # missing child results in empty configuration
+        self.assertNotIn("id", config["child2"])
+        self.assertEqual(config["child2"]["_private"].path,
+                         "{}/child2".format(node_path))
+
+    @patch(ZookeeperProxy_namespace)
+    def test_optimistic_concurrency(self, proxy_mock):
+        """ Asserts that saves carry the version the config was fetched at
+        """
+        my_proxy = MyZookeeperProxy()
+        my_proxy.save = Mock()
+        proxy_mock.return_value = my_proxy
+
+        settings = self._get_settings()
+        settings.providers["optimistic_concurrency"] = True
+        provider = ZookeeperConfigurationProvider(settings)
+
+        node_path = "/nio_configuration/1/config_name"
+        my_proxy._versions[node_path] = 3
+        config = provider.fetch("config_name")
+        self.assertEqual(config["_private"].version, 3)
+
+        my_proxy._versions[node_path] = 4
+        provider.save(config)
+        my_proxy.save.assert_called_once_with(node_path, config, version=3)
+        self.assertEqual(config["_private"].version, 4)
+
+    @patch(ZookeeperProxy_namespace)
+    def test_lazy_fetch(self, proxy_mock):
+        """ Asserts that children are fetched when first accessed
+        """
+        my_proxy = MyZookeeperProxy()
+        my_proxy.get_children = Mock(return_value=["child1", "child2"])
+        my_proxy.fetch = Mock(side_effect=my_proxy.fetch)
+        proxy_mock.return_value = my_proxy
+
+        settings = self._get_settings()
+        settings.providers["lazy_fetch"] = "True"
+        provider = ZookeeperConfigurationProvider(settings)
+
+        node_path = "/nio_configuration/1/blocks"
+        my_proxy._data["{}/child1".format(node_path)] = {"id": 1}
+        config = provider.fetch("blocks")
+        self.assertIsInstance(config, Configuration)
+        self.assertFalse(my_proxy.fetch.called)
+        self.assertEqual(config.get_pending(), ["child1", "child2"])
+
+        self.assertEqual(config["child1"]["id"], 1)
+        self.assertEqual(config["child1"]["id"], 1)
+        my_proxy.fetch.assert_called_once_with(
+            "{}/child1".format(node_path))
+        self.assertEqual(config.get_pending(), ["child2"])
+
+    @patch(ZookeeperProxy_namespace)
+    def test_incremental_save(self, proxy_mock):
+        """ Asserts that saving a multiple config writes only its changes
+        """
+        my_proxy = MyZookeeperProxy()
+        node_path = "/nio_configuration/1/blocks"
+        children = ["b{}".format(index) for index in range(5)]
+        for child in children:
+            my_proxy._data["{0}/{1}".format(node_path, child)] = {"id": child}
+        my_proxy.get_children = Mock(side_effect=lambda _: list(children))
+        proxy_mock.return_value = my_proxy
+        provider = ZookeeperConfigurationProvider(self._get_settings())
+
+        config = provider.fetch("blocks")
+        my_proxy.register = Mock(side_effect=my_proxy._data.__setitem__)
+        my_proxy.save = Mock(side_effect=my_proxy.save)
+        my_proxy.remove = Mock(side_effect=my_proxy.remove)
+        my_proxy.batch = Mock(side_effect=my_proxy.batch)
+        # unchanged, nothing is written
+        provider.save(config)
+        self.assertFalse(my_proxy.save.called)
+
+        config["b1"]["name"] = "changed"
+        config["b5"] = Configuration(data={"id": "b5"})
+        del config["b2"]
+        provider.save(config)
+        self.assertEqual(my_proxy.batch.call_count, 2)
+        my_proxy.save.assert_called_once_with(
+            "{}/b1".format(node_path), config["b1"])
+        my_proxy.register.assert_called_once_with(
+            "{}/b5".format(node_path), config["b5"])
+        my_proxy.remove.assert_called_once_with("{}/b2".format(node_path))
+        self.assertEqual(config["b5"]["_private"].path,
+                         "{}/b5".format(node_path))
+
+        # saved changes become the baseline
+        provider.save(config)
+        self.assertEqual(my_proxy.save.call_count, 1)
+        self.assertEqual(my_proxy.register.call_count, 1)
+        self.assertEqual(my_proxy.remove.call_count, 1)
+
+    @patch(ZookeeperProxy_namespace)
+    def test_prefetch(self, proxy_mock):
+        """ Asserts that prefetched configurations are handed out by the
+        next fetch, across mappings, and dropped on writes
+        """
+        my_proxy = MyZookeeperProxy()
+        blocks_path = "/nio_configuration/3/blocks"
+        services_path = "/nio_configuration/1/services"
+        my_proxy._data["{}/b1".format(blocks_path)] = {"id": "b1"}
+        my_proxy._data[services_path] = {"id": "services"}
+        my_proxy.get_children = Mock(
+            side_effect=lambda node_path: ["b1"]
+            if node_path == blocks_path else None)
+        proxy_mock.return_value = my_proxy
+
+        settings = self._get_settings()
+        settings.providers["mappings"] = {"blocks": 3, "default": 1}
+        provider = ZookeeperConfigurationProvider(settings)
+
+        timings = provider.prefetch(["blocks", "services"])
+        self.assertEqual(set(timings), {"blocks", "services"})
+        my_proxy.get_children.reset_mock()
+        my_proxy.fetch = Mock(side_effect=my_proxy.fetch)
+        blocks = provider.fetch("blocks")
+        self.assertEqual(blocks["b1"]["id"], "b1")
+        self.assertEqual(blocks["_private"].children, {"b1"})
+        services = provider.fetch("services")
+        self.assertEqual(services["id"], "services")
+        self.assertEqual(services["_private"].path, services_path)
+        self.assertFalse(my_proxy.get_children.called)
+        self.assertFalse(my_proxy.fetch.called)
+
+        # handed out once
+        provider.fetch("blocks")
+        self.assertTrue(my_proxy.get_children.called)
+
+        # a write drops only the configuration it belongs to
+        provider.prefetch(["blocks", "services"])
+        provider.save(services)
+        my_proxy.get_children.reset_mock()
+        provider.fetch("blocks")
+        self.assertFalse(my_proxy.get_children.called)
+        provider.fetch("services")
+        my_proxy.fetch.assert_called_with(services_path)
+
+        # expired
+        provider._prefetch_ttl = 0
+        provider.prefetch(["blocks"])
+        my_proxy.get_children.reset_mock()
+        provider.fetch("blocks")
+        self.assertTrue(my_proxy.get_children.called)
+
+    def test_incremental_save_conflict(self):
+        """ Asserts that children keep their versions across incremental
+        saves, so that a concurrent write fails the next save
+        """
+        with fake_kazoo_client(proxy_module) as server:
+            zk = ZookeeperProxy(track_versions=True, track_digests=True)
+            zk.connect("ip_address", 2181, "/root", logging.getLogger())
+            zk.register("/root/1", {})
+            zk.register("/root/1/blocks", {})
+            zk.register("/root/1/blocks/b1", {"v": 0})
+            ZookeeperConfigurationProvider._set_proxy(zk)
+            settings = self._get_settings()
+            settings.providers["optimistic_concurrency"] = True
+            provider = ZookeeperConfigurationProvider(settings)
+            ZookeeperConfigurationProvider._parse_mappings({"default": 1})
+
+            with patch.object(zk, "get_digest",
+                              side_effect=zk.get_digest) as get_digest:
+                blocks = provider.fetch("blocks")
+            # baseline is taken from data read, not serialized again
+            self.assertFalse(get_digest.called)
+            self.assertEqual(blocks["b1"]["_private"].version, 0)
+
+            blocks["b1"]["v"] = 1
+            provider.save(blocks)
+            self.assertEqual(blocks["b1"]["_private"].version, 1)
+            # unchanged children are not written
+            provider.save(blocks)
+            self.assertEqual(zk.get_version("/root/1/blocks/b1"), 1)
+
+            # written by someone else meanwhile
+            server.set("/root/1/blocks/b1", b'{"v": 2}')
+            blocks["b1"]["v"] = 3
+            with self.assertRaises(BadVersionError):
+                provider.save(blocks)
+            self.assertEqual(server.nodes["/root/1/blocks/b1"], b'{"v": 2}')
+            zk.disconnect()
+
+    def test_batch_register_version(self):
+        """ Asserts that configurations registered or saved within a batch
+        get the version they were written at once committed
+        """
+        with fake_kazoo_client(proxy_module) as server:
+            zk = ZookeeperProxy(track_versions=True)
+            zk.connect("ip_address", 2181, "/root", logging.getLogger())
+            zk.register("/root/1", {})
+            zk.register("/root/1/blocks", {})
+            zk.register("/root/1/single", {"v": 0})
+            ZookeeperConfigurationProvider._set_proxy(zk)
+            settings = self._get_settings()
+            settings.providers["optimistic_concurrency"] = True
+            provider = ZookeeperConfigurationProvider(settings)
+            ZookeeperConfigurationProvider._parse_mappings({"default": 1})
+
+            single = provider.fetch("single")
+            sub_config = Configuration(name="b1")
+            with provider.batch():
+                provider.register(Configuration(name="blocks"), sub_config,
+                                  "b1")
+                single["v"] = 1
+                provider.save(single)
+            self.assertEqual(sub_config["_private"].version, 0)
+            self.assertEqual(single["_private"].version, 1)
+
+            # written by someone else meanwhile
+            server.set("/root/1/blocks/b1", b'{"name": "other"}')
+            with self.assertRaises(BadVersionError):
+                provider.save(sub_config)
+            self.assertEqual(server.nodes["/root/1/blocks/b1"],
+                             b'{"name": "other"}')
+            zk.disconnect()
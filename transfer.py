@@ -0,0 +1,305 @@
+"""
+    Streaming export and import of the whole configuration tree
+
+    Trees are written as json lines, gzip compressed when the file name ends
+    with .gz, one record per node in pre-order with children sorted:
+
+        {"path": "/1/blocks/b1", "config": {"name": "b1"}}
+        {"path": "/1/blocks", "data": ""}
+
+    Paths are relative to root path. Nodes holding configuration data carry
+    it decoded as "config", so a tree can be imported using a different
+    serializer or compression, any other node carries its raw data, base64
+    encoded, as "data". Chunks of large nodes and payloads shared by
+    deduplicated nodes are not exported, nodes are imported as chunks or
+    references again when needed.
+
+    Usage:
+
+        python -m <package>.transfer export tree.jsonl.gz \\
+            --hosts zk1:2181,zk2:2181 --root-path /nio_configuration
+        python -m <package>.transfer import tree.jsonl.gz --dry-run
+
+"""
+import argparse
+import base64
+import gzip
+import json
+import logging
+from collections import deque
+
+from kazoo.exceptions import NodeExistsError, NoNodeError
+
+from .chunks import ChunkManifest, CHUNKS_NODE
+from .dedup import BLOBS_NODE
+from .proxy import ZookeeperProxy, DEFAULT_MAX_IN_FLIGHT
+
+
+__all__ = ['export_tree', 'import_tree', 'diff_tree', 'ADDED', 'CHANGED',
+           'REMOVED']
+
+
+# differences reported by diff_tree
+ADDED = "added"
+CHANGED = "changed"
+REMOVED = "removed"
+
+
+def open_tree_file(file_path, mode):
+    """ Opens a tree file as text, through gzip when named *.gz
+    """
+    if file_path.endswith(".gz"):
+        return gzip.open(file_path, mode + "t", encoding="utf-8")
+    return open(file_path, mode, encoding="utf-8")
+
+
+def export_tree(proxy, output, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    """ Writes every node under root path to output
+
+    Args:
+        proxy (ZookeeperProxy): connected proxy
+        output: text file to write json lines to
+        max_in_flight (int): maximum number of outstanding requests
+
+    Returns:
+        int: number of nodes exported
+    """
+    exported = 0
+    for record in iter_tree(proxy, max_in_flight):
+        output.write(json.dumps(record, sort_keys=True))
+        output.write("\n")
+        exported += 1
+    return exported
+
+
+def iter_tree(proxy, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    """ Reads every node under root path, in pre-order with sorted children
+
+    Data and children of a node are requested together, keeping at most
+    max_in_flight nodes outstanding. Only paths of nodes yet to be read are
+    held, so memory depends on the tree's width, not its size
+
+    Yields:
+        dict: node record
+    """
+    client = proxy.get_client()
+    root_path = proxy.get_root_path().rstrip("/")
+    max_in_flight = max(1, max_in_flight)
+    # paths to read, next one last
+    stack = [root_path]
+    pending = deque()
+    while stack or pending:
+        while stack and len(pending) < max_in_flight:
+            node_path = stack.pop()
+            pending.append((node_path, client.get_async(node_path),
+                            client.get_children_async(node_path)))
+        node_path, data_request, children_request = pending.popleft()
+        try:
+            data, stat = data_request.get()
+            children = children_request.get()
+        except NoNodeError:
+            # removed while exporting
+            continue
+        if node_path == root_path:
+            children = [child for child in children
+                        if child not in (CHUNKS_NODE, BLOBS_NODE)]
+        else:
+            yield _get_record(proxy, node_path[len(root_path):],
+                              *proxy.resolve_chunks(node_path, data, stat))
+        # a node popped from stack next must be the first child, requests
+        # issued already for the following siblings of this node are
+        # yielded first otherwise
+        if children:
+            _drain_into(stack, pending)
+        stack.extend("{0}/{1}".format(node_path, child)
+                     for child in sorted(children, reverse=True))
+
+
+def _drain_into(stack, pending):
+    """ Puts back paths whose requests were issued ahead of order
+
+    Keeps pre-order when a node turns out to have children while requests
+    for nodes following it are outstanding, they are issued again later
+    """
+    while pending:
+        stack.append(pending.pop()[0])
+
+
+def _get_record(proxy, path, data, _):
+    record = {"path": path}
+    if data and not ChunkManifest.is_manifest(data):
+        try:
+            config = proxy.deserialize(data)
+            json.dumps(config)
+        except (TypeError, ValueError):
+            # not configuration data, or not representable as json
+            config = None
+        # only mappings are imported as configuration data
+        if isinstance(config, dict):
+            record["config"] = config
+            return record
+    record["data"] = base64.b64encode(data or b"").decode()
+    return record
+
+
+def read_tree(input):
+    """ Reads node records from a tree file, checking their order
+
+    Yields:
+        dict: node record
+    """
+    previous = None
+    for line in input:
+        line = line.strip()
+        if not line:
+            continue
+        record = json.loads(line)
+        key = _order_key(record["path"])
+        if previous is not None and key <= previous:
+            raise ValueError("Records out of order at {}".format(
+                record["path"]))
+        previous = key
+        yield record
+
+
+def _order_key(path):
+    # pre-order with sorted children is the order of path components
+    return path.split("/")
+
+
+def _encode_record(proxy, record):
+    if "config" in record:
+        return proxy.serialize(record["config"])
+    return base64.b64decode(record["data"])
+
+
+def import_tree(proxy, input, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    """ Creates or overwrites nodes read from input
+
+    Nodes are created through pipelined asynchronous requests, keeping at
+    most max_in_flight outstanding. A session processes requests in order,
+    so a node is created after its parent even when both are in flight.
+    Parents missing from input are created, nodes not in input are left
+    untouched
+
+    Args:
+        proxy (ZookeeperProxy): connected proxy
+        input: text file to read json lines from
+        max_in_flight (int): maximum number of outstanding requests
+
+    Returns:
+        dict: number of nodes "created" and "updated"
+    """
+    client = proxy.get_client()
+    root_path = proxy.get_root_path().rstrip("/")
+    max_in_flight = max(1, max_in_flight)
+    counts = {"created": 0, "updated": 0}
+    pending = deque()
+    try:
+        for record in read_tree(input):
+            if len(pending) >= max_in_flight:
+                _complete_import(client, counts, *pending.popleft())
+            node_path = root_path + record["path"]
+            data, cleanup, _ = proxy.prepare_write(
+                node_path, _encode_record(proxy, record))
+            pending.append((node_path, data, cleanup,
+                            client.create_async(node_path, data)))
+        while pending:
+            _complete_import(client, counts, *pending.popleft())
+    finally:
+        proxy.forget_tree(root_path)
+    return counts
+
+
+def _complete_import(client, counts, node_path, data, cleanup, request):
+    try:
+        request.get()
+        counts["created"] += 1
+    except NodeExistsError:
+        client.set(node_path, data)
+        counts["updated"] += 1
+    except NoNodeError:
+        client.create(node_path, data, makepath=True)
+        counts["created"] += 1
+    if cleanup:
+        cleanup()
+
+
+def diff_tree(proxy, input, max_in_flight=DEFAULT_MAX_IN_FLIGHT):
+    """ Compares nodes read from input against the live tree
+
+    Both are streamed in the same order and merged, nothing is written
+
+    Yields:
+        tuple: (ADDED, CHANGED or REMOVED, relative path), ADDED and
+            CHANGED nodes would be written by import_tree, REMOVED nodes
+            are only found in the live tree
+    """
+    live = iter_tree(proxy, max_in_flight)
+    wanted = read_tree(input)
+    live_record = next(live, None)
+    wanted_record = next(wanted, None)
+    while live_record is not None or wanted_record is not None:
+        if wanted_record is None or (
+                live_record is not None and
+                _order_key(live_record["path"]) <
+                _order_key(wanted_record["path"])):
+            yield REMOVED, live_record["path"]
+            live_record = next(live, None)
+        elif live_record is None or \
+                live_record["path"] != wanted_record["path"]:
+            yield ADDED, wanted_record["path"]
+            wanted_record = next(wanted, None)
+        else:
+            if _normalize_record(live_record) != \
+                    _normalize_record(wanted_record):
+                yield CHANGED, wanted_record["path"]
+            live_record = next(live, None)
+            wanted_record = next(wanted, None)
+
+
+def _normalize_record(record):
+    # configs compared as exported, whatever the order of their keys
+    if "config" in record:
+        return json.dumps(record["config"], sort_keys=True)
+    return record["data"]
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(
+        description="Exports or imports a zookeeper configuration tree")
+    parser.add_argument("command", choices=["export", "import"])
+    parser.add_argument("file", help="json lines file, gzip when *.gz")
+    parser.add_argument("--hosts", default="127.0.0.1:2181")
+    parser.add_argument("--root-path", default="/nio_configuration")
+    parser.add_argument("--max-in-flight", type=int,
+                        default=DEFAULT_MAX_IN_FLIGHT)
+    parser.add_argument("--dry-run", action="store_true",
+                        help="report differences instead of importing")
+    args = parser.parse_args(args)
+
+    logging.basicConfig(level=logging.INFO)
+    proxy = ZookeeperProxy()
+    proxy.connect(None, None, args.root_path,
+                  logging.getLogger("ZookeeperTransfer"), hosts=args.hosts)
+    try:
+        if args.command == "export":
+            with open_tree_file(args.file, "w") as output:
+                print("{} nodes exported".format(
+                    export_tree(proxy, output, args.max_in_flight)))
+        elif args.dry_run:
+            with open_tree_file(args.file, "r") as input:
+                for kind, path in diff_tree(proxy, input,
+                                            args.max_in_flight):
+                    print("{0:<8} {1}".format(kind, path))
+        else:
+            with open_tree_file(args.file, "r") as input:
+                counts = import_tree(proxy, input, args.max_in_flight)
+            print("{created} nodes created, {updated} updated".format(
+                **counts))
+    finally:
+        proxy.disconnect()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,157 @@
+"""
+    Write-behind queue coalescing saves to the same node
+
+"""
+import time
+from collections import OrderedDict
+from threading import Condition, Lock, Thread, get_ident
+
+
+DEFAULT_MAX_PENDING = 100
+
+
+class WriteBehindQueue(object):
+
+    """ Collects writes and sends them from a background thread
+
+    Writes to a node replace any write to the same node not sent yet, so
+    only the latest data is sent. Pending writes are sent when the oldest
+    of them has waited interval seconds, when max_pending nodes are
+    pending, or when flushed explicitly. Writes not sent yet, or being
+    sent, can be looked up so that readers observe them. Writes sent
+    directly discard queued writes to the same node, see discard.
+    """
+
+    def __init__(self, write, interval, max_pending=DEFAULT_MAX_PENDING):
+        """ Constructor for write-behind queue
+
+        Args:
+            write (callable): receives a list of (node_path, data) to send
+            interval (float): maximum seconds a write waits to be sent
+            max_pending (int): number of pending nodes that triggers a flush
+        """
+        self._write = write
+        self._interval = interval
+        self._max_pending = max(1, max_pending)
+        self._condition = Condition()
+        # node path -> data, in order of first write
+        self._pending = OrderedDict()
+        # writes being sent, and thread sending them
+        self._flushing = {}
+        self._flusher = None
+        # time oldest pending write was queued
+        self._oldest = None
+        self._flush_lock = Lock()
+        self._thread = None
+        self._stopped = False
+        # writes replaced before being sent
+        self.coalesced = 0
+
+    def __len__(self):
+        with self._condition:
+            return len(self._pending)
+
+    def start(self):
+        self._stopped = False
+        self._thread = Thread(target=self._run, name="ZookeeperWriteBehind",
+                              daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """ Stops background thread, sending writes still pending
+        """
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def put(self, node_path, data):
+        with self._condition:
+            if node_path in self._pending:
+                self.coalesced += 1
+            elif not self._pending:
+                self._oldest = time.monotonic()
+                # flusher waits for a first write before timing interval
+                self._condition.notify_all()
+            self._pending[node_path] = data
+            if len(self._pending) >= self._max_pending:
+                self._condition.notify_all()
+
+    def get(self, node_path):
+        """ Provides data written to node_path not sent yet
+
+        Returns:
+            tuple: (found, data)
+        """
+        with self._condition:
+            if node_path in self._pending:
+                return True, self._pending[node_path]
+            if node_path in self._flushing:
+                return True, self._flushing[node_path]
+        return False, None
+
+    def discard(self, node_path, tree=False):
+        """ Drops pending writes to node_path, and its descendants when tree
+        is set
+
+        Invoked before writing or removing node_path right away, so that
+        queued data does not overwrite it once sent. Waits for writes to
+        these nodes being sent, unless invoked while sending them
+        """
+        prefix = node_path + "/"
+
+        def matches(path):
+            return path == node_path or (tree and path.startswith(prefix))
+
+        with self._condition:
+            for path in list(self._pending):
+                if matches(path):
+                    del self._pending[path]
+            while self._flusher != get_ident() and \
+                    any(matches(path) for path in self._flushing):
+                self._condition.wait()
+
+    def flush(self):
+        """ Sends pending writes, waiting until they are sent
+
+        Returns:
+            int: number of writes sent
+        """
+        with self._flush_lock:
+            with self._condition:
+                writes, self._pending = self._pending, OrderedDict()
+                self._flushing = writes
+                self._flusher = get_ident()
+                self._oldest = None
+            if not writes:
+                return 0
+            try:
+                self._write(list(writes.items()))
+            finally:
+                with self._condition:
+                    self._flushing = {}
+                    self._flusher = None
+                    self._condition.notify_all()
+            return len(writes)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._stopped and not self._is_due():
+                    timeout = None
+                    if self._pending:
+                        timeout = self._interval - \
+                            (time.monotonic() - self._oldest)
+                    self._condition.wait(timeout)
+                if self._stopped:
+                    return
+            self.flush()
+
+    def _is_due(self):
+        if not self._pending:
+            return False
+        return len(self._pending) >= self._max_pending or \
+            time.monotonic() - self._oldest >= self._interval